@@ -0,0 +1,4 @@
+"""Нагрузочные сценарии подбора без Telegram и БД.
+
+Запуск из корня проекта: python -m benchmarks.<сценарий>
+"""
@@ -0,0 +1,110 @@
+"""Время тика глобального распределения пар (MATCHING_MODE=batch).
+
+    python -m benchmarks.batch_assignment --sizes 1000 10000 50000 --budget 1.5
+
+Для небольших очередей дополнительно сравнивает результат с жадным
+подбором при входе в очередь (режим greedy).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+
+from tests.profiles import make_profiles, fill_profile_cache
+from services.match_state import MemoryStateBackend
+from services.matchmaker import Matchmaker
+from services.search_queue import SearchQueue
+
+def build_queue(matchmaker: Matchmaker, profiles, seed: int = 1):
+    """Заполняет очередь подборщика: ожидание до 5 минут и соответствующий уровень ослабления"""
+    rng = random.Random(seed)
+    now = time.time()
+    matchmaker.setup(SearchQueue(), MemoryStateBackend(), on_match=None)
+    for profile in profiles:
+        waited = rng.uniform(0, 300)
+        matchmaker.searchers[profile['user_id']] = {
+            'profile': profile,
+            'tier': 'low',
+            'enqueued_at': matchmaker.search_queue.add(profile['user_id'], 'low', profile, now - waited),
+            'relaxed_level': min(int(waited // matchmaker.relax_interval), matchmaker.max_relaxed_level),
+            'bot': None,
+            'message': None,
+            'state': None
+        }
+    return now
+
+def summary(pairs):
+    scores = [score for _, _, score, _ in pairs]
+    mean = sum(scores) / len(scores) if scores else 0.0
+    return f"{len(pairs)} pairs, total {sum(scores):.1f}, mean {mean:.3f}"
+
+async def run_batch(size: int, budget: float, repeats: int):
+    profiles = make_profiles(size)
+    fill_profile_cache(profiles)
+    matchmaker = Matchmaker(mode='batch')
+    now = build_queue(matchmaker, profiles)
+
+    # Первый проход строит строки BatchScorer, дальше они переиспользуются
+    started = time.perf_counter()
+    pairs = await matchmaker.assigner.assign(matchmaker.searchers, matchmaker.index, now)
+    cold = time.perf_counter() - started
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        pairs = await matchmaker.assigner.assign(matchmaker.searchers, matchmaker.index, now)
+        timings.append(time.perf_counter() - started)
+    warm = max(timings)
+
+    status = "OK" if warm <= budget else "OVER BUDGET"
+    print(f"{size:>7} users: cold {cold:.3f}s, warm max {warm:.3f}s (budget {budget:.2f}s) {status}; {summary(pairs)}")
+    return pairs, warm <= budget
+
+async def run_greedy(size: int):
+    """Последовательный подбор при входе, как в режиме greedy"""
+    profiles = make_profiles(size)
+    fill_profile_cache(profiles)
+    matchmaker = Matchmaker(mode='greedy')
+    build_queue(matchmaker, profiles)
+    entries = sorted(matchmaker.searchers.items(), key=lambda item: item[1]['enqueued_at'])
+    matchmaker.searchers.clear()
+    matchmaker.setup(SearchQueue(), MemoryStateBackend(), on_match=None)
+
+    pairs = []
+    matchmaker.on_match = None
+    create_chat = matchmaker._create_chat
+    async def record(user_id, partner_id, score, reasons, level):
+        pairs.append((user_id, partner_id, score, level))
+        return await create_chat(user_id, partner_id, score, reasons, level)
+    matchmaker._create_chat = record
+
+    # Подборщик печатает каждую созданную пару
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id, entry in entries:
+            await matchmaker.state.add_searcher(user_id, entry['tier'], entry['enqueued_at'])
+            matchmaker.searchers[user_id] = entry
+            matchmaker.search_queue.add(user_id, entry['tier'], entry['profile'], entry['enqueued_at'])
+            await matchmaker._try_match(user_id)
+    print(f"{size:>7} users greedy on arrival: {summary(pairs)}")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--budget', type=float, default=1.5, help='допустимое время тика, секунд')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--compare-up-to', type=int, default=2000,
+                        help='сравнивать с greedy для очередей не больше этого размера')
+    args = parser.parse_args()
+
+    ok = True
+    for size in args.sizes:
+        _, within_budget = await run_batch(size, args.budget, args.repeats)
+        ok = ok and within_budget
+        if size <= args.compare_up_to:
+            await run_greedy(size)
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""Локальный сервер с протоколом Bot API для проверок без Telegram.
+
+    python -m benchmarks.bot_api_server --port 8081 --latency 0.02
+
+Отвечает на методы отправки (sendMessage, sendPhoto, ..., copyMessage,
+editMessageText) правдоподобными результатами с заданной задержкой и
+запоминает вызовы: (время, метод, chat_id). Бот подключается к нему через
+AiohttpSession(api=TelegramAPIServer.from_base(url)). Сообщения с
+message_id из uncopyable copyMessage отклоняет, как Telegram - служебные
+сообщения, а скопированные записывает по получателям в порядке доставки. С flood_control отправки сверх лимитов Telegram (global_rate в
+секунду на всех, chat_rate в секунду в один чат с всплеском chat_burst)
+получают 429 с retry_after.
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+from services.outbound import OutboundBudget
+
+class BotApiServer:
+    def __init__(self, latency: float = 0.0, flood_control: bool = False,
+                 global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 5):
+        self.latency = latency  # Задержка ответа, сек
+        self.flood_control = flood_control
+        self.global_bucket = OutboundBudget(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: Dict[str, OutboundBudget] = {}
+        self.calls: List[Tuple[float, str, Optional[str]]] = []
+        self.flooded = 0  # Ответов 429
+        self.uncopyable: Set[int] = set()
+        self.slow: Dict[int, float] = {}  # message_id -> дополнительная задержка copyMessage (тяжелое видео)
+        self.delivered: Dict[str, List[int]] = {}  # Получатель -> message_id скопированных ему, в порядке доставки
+        self._message_ids = itertools.count(1)
+        self.runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def _flood_check(self, chat_id: str) -> int:
+        """0 - отправку можно принять, иначе retry_after в секундах"""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = OutboundBudget(self.chat_rate, self.chat_burst)
+        if bucket.available() < 1:
+            return max(1, math.ceil(bucket.delay()))
+        if not self.global_bucket.try_take():
+            return max(1, math.ceil(self.global_bucket.delay()))
+        bucket.try_take()
+        return 0
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        form = await request.post()
+        chat_id = form.get('chat_id')
+        self.calls.append((time.perf_counter(), method, chat_id))
+        if self.flood_control and chat_id is not None and not method.startswith('get'):
+            retry_after = self._flood_check(chat_id)
+            if retry_after:
+                self.flooded += 1
+                return web.json_response({
+                    'ok': False, 'error_code': 429,
+                    'description': f"Too Many Requests: retry after {retry_after}",
+                    'parameters': {'retry_after': retry_after}
+                }, status=429)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'
+            }})
+        if method == 'copyMessage':
+            message_id = int(form.get('message_id', 0))
+            if message_id in self.slow:
+                await asyncio.sleep(self.slow[message_id])
+            if message_id in self.uncopyable:
+                return web.json_response(
+                    {'ok': False, 'error_code': 400, 'description': "Bad Request: the message can't be copied"},
+                    status=400
+                )
+            self.delivered.setdefault(chat_id, []).append(message_id)
+            return web.json_response({'ok': True, 'result': {'message_id': next(self._message_ids)}})
+        if method.startswith('send') or method.startswith('edit'):
+            return web.json_response({'ok': True, 'result': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(chat_id or 0), 'type': 'private'}
+            }})
+        return web.json_response({'ok': True, 'result': True})
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--flood-control', action='store_true')
+    args = parser.parse_args()
+
+    server = BotApiServer(args.latency, args.flood_control)
+    url = await server.start(args.host, args.port)
+    print(f"Bot API server on {url}")
+    await asyncio.Event().wait()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""Учет сообщения в чате: ChatSession против прежних раздельных словарей.
+
+    python -m benchmarks.chat_session --chats 2000 --messages 20000 --backend redis
+
+Новый путь - фильтр in_active_chat (ChatSessions.resolve) и настоящие
+ChatLogger, ConversationTracker и SmartMatching middleware над одной
+сессией. Прежний путь воспроизведен здесь же: три запроса partner_of
+(фильтр, ConversationTracker, ChatLogger), ключи tuple(sorted(...)) в
+conversations и chat_logs и отдельный chat_stats подборщика (без
+отладочной печати на каждое сообщение, которая была в ChatLogger). Считаются
+время на сообщение, запросы к хранилищу и память на чат.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+import tracemalloc
+from typing import Dict
+
+from aiogram import types
+
+from tests.resp_server import RespServer
+from middlewares.chat_logger import ChatLoggerMiddleware
+from middlewares.conversation_tracker import ConversationTrackerMiddleware
+from middlewares.smart_matching import SmartMatchingMiddleware
+from services.chat_session import ChatSessions
+from services.match_state import MemoryStateBackend, RedisStateBackend
+
+ADULT_KEYWORDS = ['согласен на 18+', 'хочу 18+', 'можно интим', 'давай 18+']
+
+class LegacyBookkeeping:
+    """Прежний учет: у каждого middleware свой словарь и свой поиск собеседника"""
+
+    def __init__(self, state):
+        self.state = state
+        self.conversations = {}
+        self.chat_logs = {}
+        self.chat_stats = {}
+
+    def chat_started(self, user_id: int, partner_id: int):
+        started_at = time.time()
+        self.chat_stats[user_id] = [partner_id, started_at, 0, False]
+        self.chat_stats[partner_id] = [user_id, started_at, 0, False]
+
+    async def handle(self, message: types.Message):
+        user_id = message.from_user.id
+        # Фильтр обработчика чата
+        partner_id = await self.state.partner_of(user_id)
+        # ConversationTracker
+        partner_id = await self.state.partner_of(user_id)
+        key = tuple(sorted([user_id, partner_id]))
+        now = time.time()
+        conv = self.conversations.setdefault(key, {
+            'messages': 0, 'start_time': now, 'quality_score': 0.0,
+            'adult_consent': {'user1': False, 'user2': False}, 'last_activity': now
+        })
+        conv['messages'] += 1
+        conv['last_activity'] = now
+        if any(keyword in message.text.lower() for keyword in ADULT_KEYWORDS):
+            conv['adult_consent']['user1' if user_id == min(key) else 'user2'] = True
+        # SmartMatching
+        stats = self.chat_stats.get(user_id)
+        if stats:
+            stats[2] += 1
+        # ChatLogger
+        partner_id = await self.state.partner_of(user_id)
+        log = self.chat_logs.setdefault(tuple(sorted([user_id, partner_id])), [])
+        msg_type, msg_content = "text", message.text or ""
+        if message.photo:
+            msg_type, msg_content = "photo", message.caption or "📷 Фото"
+        elif message.video:
+            msg_type, msg_content = "video", message.caption or "🎥 Видео"
+        elif message.voice or message.sticker or message.document:
+            msg_type = "other"
+        log.append({'user_id': user_id, 'message': msg_content, 'timestamp': time.time(), 'type': msg_type})
+        if len(log) > 100:
+            self.chat_logs[key] = log[-100:]
+
+class CountingState:
+    """Считает обращения к хранилищу"""
+
+    def __init__(self, state):
+        self.state = state
+        self.shared = state.shared
+        self.calls = 0
+
+    async def partner_of(self, user_id: int):
+        self.calls += 1
+        return await self.state.partner_of(user_id)
+
+async def handled(event, data):
+    return None
+
+def make_message(user_id: int, message_id: int) -> types.Message:
+    return types.Message.model_validate({
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+        'text': f"сообщение {message_id}"
+    })
+
+async def run(args, state) -> Dict:
+    pairs = [(2 * n + 1, 2 * n + 2) for n in range(args.chats)]
+    for user_id, partner_id in pairs:
+        await state.add_searcher(user_id, 'low', time.time())
+        await state.add_searcher(partner_id, 'low', time.time())
+        await state.pair(user_id, partner_id)
+    rng = random.Random(args.seed)
+    senders = [rng.choice(pair) for pair in rng.choices(pairs, k=args.messages)]
+    messages = [make_message(user_id, n) for n, user_id in enumerate(senders, start=1)]
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        counting = CountingState(state)
+        legacy = LegacyBookkeeping(counting)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for user_id, partner_id in pairs:
+            legacy.chat_started(user_id, partner_id)
+        started = time.perf_counter()
+        for message in messages:
+            await legacy.handle(message)
+        elapsed = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        results['legacy'] = (elapsed, counting.calls, memory)
+
+        counting = CountingState(state)
+        sessions = ChatSessions(counting)
+        chain = [ConversationTrackerMiddleware(), SmartMatchingMiddleware(), ChatLoggerMiddleware()]
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for user_id, partner_id in pairs:
+            sessions.start(user_id, partner_id)
+        started = time.perf_counter()
+        for message in messages:
+            session = await sessions.resolve(message.from_user.id)
+            data = {'partner_id': session.partner(message.from_user.id), 'chat_session': session}
+            for middleware in chain:
+                await middleware(handled, message, data)
+        elapsed = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        results['session'] = (elapsed, counting.calls, memory)
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--backend', choices=['memory', 'redis'], default='memory')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    server = None
+    if args.backend == 'redis':
+        server = RespServer()
+        port = await server.start()
+        state = RedisStateBackend(f"redis://127.0.0.1:{port}/0", prefix=f"sessions:{time.time_ns()}:")
+    else:
+        state = MemoryStateBackend()
+    try:
+        results = await run(args, state)
+    finally:
+        await state.close()
+        if server:
+            await server.stop()
+
+    print(f"{args.chats} chats, {args.messages} messages, {args.backend} backend:")
+    for name, (elapsed, calls, memory) in results.items():
+        print(f"  {name:8} {elapsed / args.messages * 1e6:7.1f} us/message  "
+              f"{calls / args.messages:.1f} state lookups/message  {memory / args.chats:7.0f} bytes/chat")
+
+if __name__ == '__main__':
+    asyncio.run(main())
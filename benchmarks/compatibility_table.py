@@ -0,0 +1,60 @@
+"""Проверка и замер таблиц совместимости по полу/ориентации/цели.
+
+    python -m benchmarks.compatibility_table
+
+Сравнивает ORIENTATION_ROWS/STRICT_ROWS (и orientation_compatible /
+goal_compatible по признакам профиля) с is_gender_orientation_compatible и
+is_dating_goal_compatible на всех сочетаниях значений словарей, пустых
+значений, значений не из словаря и вариантов написания (регистр, пробелы).
+Затем измеряет стоимость проверки пары строковыми функциями и по таблице.
+Выборку из тех же пар проверяет tests/test_compatibility_table.py.
+"""
+import argparse
+import itertools
+import random
+import time
+
+from keyboards.registration import GENDERS, ORIENTATIONS, DATING_GOALS
+from services.ai_filters import is_gender_orientation_compatible, is_dating_goal_compatible, STRICT_ROWS
+from services.profile_features import ProfileFeatures
+from tests.compatibility import mismatches, spelling_profiles
+
+def parity() -> int:
+    profiles = spelling_profiles()
+    count = len(mismatches(itertools.product(profiles, profiles)))
+    print(f"parity: {len(profiles) ** 2} pairs, {count} mismatches")
+    return count
+
+def timing(pairs: int, seed: int):
+    rng = random.Random(seed)
+    profiles = [
+        {'gender': rng.choice(GENDERS), 'orientation': rng.choice(ORIENTATIONS), 'dating_goal': rng.choice(DATING_GOALS)}
+        for _ in range(1000)
+    ]
+    sample = [(rng.choice(profiles), rng.choice(profiles)) for _ in range(pairs)]
+    started = time.perf_counter()
+    for first, second in sample:
+        is_gender_orientation_compatible(first, second) and is_dating_goal_compatible(first, second)
+    strings = time.perf_counter() - started
+
+    features = {id(profile): ProfileFeatures(profile) for profile in profiles}
+    feature_pairs = [(features[id(first)], features[id(second)]) for first, second in sample]
+    started = time.perf_counter()
+    for first, second in feature_pairs:
+        STRICT_ROWS[first.compat_id][second.compat_id]
+    table = time.perf_counter() - started
+    print(f"strings: {strings / pairs * 1e9:7.0f} ns/pair   table: {table / pairs * 1e9:5.0f} ns/pair   "
+          f"({strings / table:.0f}x)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    mismatches = parity()
+    timing(args.pairs, args.seed)
+    raise SystemExit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Стоимость подбора собеседника на синтетической очереди.
+
+    python -m benchmarks.matching --sizes 100 1000 10000 100000
+
+Для каждого размера очереди измеряет задержку выбора собеседника подборщиком,
+SmartMatchingService.find_best_matches и calculate_local_compatibility
+(p50/p99), число созданных пар в секунду при разборе очереди и память на
+очередь с кэшем профилей. Telegram и БД не нужны: профили кладутся прямо
+в profile_cache.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import random
+import resource
+import time
+import tracemalloc
+from typing import Dict, List
+
+from benchmarks.stats import percentile
+from tests.profiles import make_profiles, fill_profile_cache
+from handlers import chat
+from services.ai_filters import calculate_local_compatibility
+from services.batch_scoring import batch_scorer
+from services.cache import profile_cache
+from services.queue_index import GOAL_RELAXED_LEVEL
+from services.smart_matching import smart_matcher
+
+def latency(name: str, samples: List[float], unit: str = 'ms') -> str:
+    scale = 1000 if unit == 'ms' else 1_000_000
+    return (f"  {name:<30} p50 {percentile(samples, 0.5) * scale:9.2f} {unit}"
+            f"   p99 {percentile(samples, 0.99) * scale:9.2f} {unit}   n={len(samples)}")
+
+async def reset():
+    """Пустая очередь, чаты и кэш перед следующим размером"""
+    for user_id in list(chat.search_queue):
+        await chat.matchmaker.dequeue(user_id)
+    for user_id in list(chat.match_state.chats):
+        await chat.match_state.end_chat(user_id)
+    profile_cache.clear()
+    gc.collect()
+
+async def fill_queue(profiles: List[Dict]):
+    """Ставит всех в очередь так же, как start_search, но без бота и актора"""
+    for profile in profiles:
+        tier = chat.get_rating_tier(profile['rating'])
+        enqueued_at = time.time()
+        await chat.match_state.add_searcher(profile['user_id'], tier, enqueued_at)
+        chat.matchmaker.searchers[profile['user_id']] = {
+            'profile': profile,
+            'tier': tier,
+            'enqueued_at': chat.search_queue.add(profile['user_id'], tier, profile, enqueued_at),
+            'relaxed_level': 0,
+            'bot': None,
+            'message': None,
+            'state': None
+        }
+
+async def pick_partner(user_id: int, level: int):
+    """Выбор собеседника подборщиком на заданном уровне ослабления, без создания чата"""
+    entry = chat.matchmaker.searchers[user_id]
+    entry['relaxed_level'] = level
+    candidates = chat.matchmaker.index.candidate_list(entry['profile'], GOAL_RELAXED_LEVEL, exclude=user_id)
+    return await chat.matchmaker._best_candidate(user_id, entry, candidates)
+
+async def run(size: int, queries: int, pairs: int, drain_seconds: float, seed: int):
+    rng = random.Random(seed)
+    await reset()
+
+    # Память: профили, признаки, очередь с индексом корзин и строки BatchScorer
+    tracemalloc.start()
+    profiles = make_profiles(size, seed=seed)
+    fill_profile_cache(profiles)
+    await fill_queue(profiles)
+    batch_scorer.rows_for(profiles)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{size} queued users: {memory / 2 ** 20:.1f} MiB for profiles, features and queue "
+          f"({memory / size:.0f} B/user)")
+
+    sample = rng.sample(profiles, min(queries, size))
+    levels = [rng.randint(0, 4) for _ in sample]
+
+    # Выбор собеседника: кандидаты из индекса очереди + оценка
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for profile, level in zip(sample, levels):
+            started = time.perf_counter()
+            await pick_partner(profile['user_id'], level)
+            samples.append(time.perf_counter() - started)
+    print(latency('pick_partner', samples))
+
+    # find_best_matches по всем совместимым кандидатам очереди
+    samples = []
+    for profile, level in zip(sample, levels):
+        candidates = chat.search_queue.index.candidate_list(profile, level, exclude=profile['user_id'])
+        started = time.perf_counter()
+        await smart_matcher.find_best_matches(profile['user_id'], candidates, level)
+        samples.append(time.perf_counter() - started)
+    print(latency('find_best_matches', samples))
+
+    # calculate_local_compatibility на случайных парах
+    samples = []
+    for _ in range(pairs):
+        first, second = rng.choice(profiles), rng.choice(profiles)
+        started = time.perf_counter()
+        calculate_local_compatibility(first, second)
+        samples.append(time.perf_counter() - started)
+    print(latency('calculate_local_compatibility', samples, unit='us'))
+
+    # Разбор очереди: подборщик берет ищущих по порядку на максимальном уровне
+    # и создает пары, пока есть время (без уведомлений - бота нет)
+    for entry in chat.matchmaker.searchers.values():
+        entry['relaxed_level'] = chat.matchmaker.max_relaxed_level
+    on_match, chat.matchmaker.on_match = chat.matchmaker.on_match, None
+    matches = 0
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id in list(chat.search_queue):
+            if time.perf_counter() - started > drain_seconds:
+                break
+            if user_id in chat.search_queue and await chat.matchmaker._try_match(user_id):
+                matches += 1
+    elapsed = time.perf_counter() - started
+    chat.matchmaker.on_match = on_match
+    print(f"  {'matches/sec':<30} {matches / elapsed:9.1f}   ({matches} pairs in {elapsed:.2f}s)")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=100, help='запросов подбора на размер очереди')
+    parser.add_argument('--pairs', type=int, default=20000, help='пар для calculate_local_compatibility')
+    parser.add_argument('--drain-seconds', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        await run(size, args.queries, args.pairs, args.drain_seconds, args.seed)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS: {max_rss / 1024:.0f} MiB")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""Пересылка в чатах во время рассылки: планировщик исходящих запросов против прежней схемы.
+
+    python -m benchmarks.outbound --relay 15 --notify 3 --latency 0.005
+
+Настоящий aiogram Bot ходит в локальный BotApiServer, который, как
+Telegram, отвечает 429 на отправки сверх 30 в секунду на всех и сверх
+~1 в секунду в один чат. Одновременно идут рассылка по всем
+пользователям, пересылка в живых чатах (пуассоновский поток, иногда -
+пачка сообщений подряд в один чат) и уведомления. Прежняя схема: запросы
+уходят сразу, рассылка спит 0.05 с между отправками. Новая: все запросы
+идут через OutboundScheduler со своим классом приоритета. Хвост задержки
+пересылки при планировщике - это пачки в один чат, растянутые до
+лимита чата, вместо потерянных на 429 сообщений; p99 "with lost" считает
+потерянные сообщения недоставленными.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import random
+import time
+from typing import Dict
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.bot_api_server import BotApiServer
+from benchmarks.stats import percentile
+from services.outbound import BROADCAST, NOTIFY, RELAY, OutboundScheduler, outbound_priority
+
+async def run(args, scheduled: bool) -> Dict:
+    server = BotApiServer(args.latency, flood_control=True, chat_burst=args.chat_burst)
+    url = await server.start()
+    bot = Bot('1:bench', session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    scheduler = OutboundScheduler(rate=args.rate)
+    if scheduled:
+        bot.session.middleware(scheduler)
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.seconds
+    latencies = {RELAY: [], NOTIFY: []}
+    failed = {RELAY: 0, NOTIFY: 0, BROADCAST: 0}
+    broadcast_sent = 0
+    tasks = set()
+
+    async def send(priority: int, chat_id: int):
+        started = time.monotonic()
+        try:
+            with outbound_priority(priority):
+                await bot.send_message(chat_id, "сообщение")
+        except Exception:
+            failed[priority] += 1
+            return
+        latencies[priority].append(time.monotonic() - started)
+
+    def spawn(coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def stream(priority: int, rate: float, chats: range, burst: bool):
+        next_burst = time.monotonic() + args.burst_every
+        while time.monotonic() < deadline:
+            spawn(send(priority, rng.choice(chats)))
+            if burst and time.monotonic() >= next_burst:
+                # Пользователь отправляет пачку сообщений подряд
+                chat_id = rng.choice(chats)
+                for _ in range(args.burst_size):
+                    spawn(send(priority, chat_id))
+                next_burst += args.burst_every
+            await asyncio.sleep(rng.expovariate(rate))
+
+    async def broadcast():
+        nonlocal broadcast_sent
+        chat_id = 100000
+        with outbound_priority(BROADCAST):
+            while time.monotonic() < deadline:
+                chat_id += 1
+                try:
+                    await bot.send_message(chat_id, "рассылка")
+                    broadcast_sent += 1
+                except Exception:
+                    failed[BROADCAST] += 1
+                if not scheduled:
+                    await asyncio.sleep(0.05)  # Прежняя защита от rate limit
+
+    started = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(
+            stream(RELAY, args.relay, range(1000, 1000 + args.chats), burst=True),
+            stream(NOTIFY, args.notify, range(5000, 6000), burst=False),
+            broadcast()
+        )
+        if tasks:
+            await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    await bot.session.close()
+    await server.stop()
+    return {
+        'relay_p50': percentile(latencies[RELAY], 0.5) * 1000,
+        'relay_p99': percentile(latencies[RELAY], 0.99) * 1000,
+        # Потерянное сообщение не доставлено никогда - без этого отбрасывание на 429 выглядит быстрым
+        'relay_delivery_p99': percentile(latencies[RELAY] + [math.inf] * failed[RELAY], 0.99) * 1000,
+        'relay_sent': len(latencies[RELAY]),
+        'notify_p99': percentile(latencies[NOTIFY], 0.99) * 1000,
+        'failed': failed,
+        'broadcast_rate': broadcast_sent / elapsed,
+        'flooded': server.flooded,
+        'retries': sum(scheduler.retries)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--relay', type=float, default=10, help='пересылок в секунду')
+    parser.add_argument('--notify', type=float, default=2, help='уведомлений в секунду')
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--burst-every', type=float, default=3, help='раз в сколько секунд кто-то шлет пачку')
+    parser.add_argument('--burst-size', type=int, default=6)
+    parser.add_argument('--chat-burst', type=float, default=5, help='всплеск в один чат, который терпит сервер')
+    parser.add_argument('--rate', type=float, default=25, help='бюджет планировщика, запросов в секунду')
+    parser.add_argument('--latency', type=float, default=0.03, help='задержка ответа Bot API, сек')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for scheduled in (False, True):
+        result = await run(args, scheduled)
+        print(f"{'scheduler' if scheduled else 'old':9}  relay p50 {result['relay_p50']:6.0f}ms p99 {result['relay_p99']:6.0f}ms "
+              f"(with lost {result['relay_delivery_p99']:6.0f}ms)  notify p99 {result['notify_p99']:6.0f}ms  broadcast {result['broadcast_rate']:5.1f}/s")
+        print(f"           429 from server {result['flooded']}, retried {result['retries']}, "
+              f"lost: relay {result['failed'][RELAY]}, notify {result['failed'][NOTIFY]}, broadcast {result['failed'][BROADCAST]}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
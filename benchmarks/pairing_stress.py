@@ -0,0 +1,43 @@
+"""Стресс-проверка атомарности подбора: тысячи одновременных ищущих.
+
+    python -m benchmarks.pairing_stress --users 3000 --rounds 3
+    python -m benchmarks.pairing_stress --backend redis --mode batch
+
+Каждый пользователь - отдельная задача, которая несколько раз подряд
+встает в очередь, случайно просит расширить критерии (relax), отменяет
+поиск (dequeue) и, если уже попал в чат, через некоторое время его
+завершает. Все это идет одновременно с работой актора подборщика.
+С --backend redis состояние лежит во встроенном tests.resp_server,
+и у pair() появляются настоящие точки ожидания.
+
+Проверяется:
+- ни один пользователь не получил двух собеседников за один поиск;
+- созданная пара сразу после pair() есть в хранилище с обеих сторон;
+- в уведомление о паре попадает запись самого поиска (с ботом и FSM), а не
+  копия, которую сверка с общим хранилищем создает для чужих ищущих;
+- отмена, вернувшая True, не закончилась чатом, а вернувшая False - закончилась;
+- в конце очередь подборщика совпадает с хранилищем, чаты взаимны,
+  никто не стоит в очереди и в чате одновременно, резервов не осталось.
+
+Те же инварианты на небольшой нагрузке проверяет tests/test_pairing_stress.py.
+"""
+import argparse
+import asyncio
+
+from tests.stress import run, violations
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--rounds', type=int, default=3, help='поисков на пользователя')
+    parser.add_argument('--max-wait', type=float, default=1.0, help='наибольшая пауза между действиями, сек')
+    parser.add_argument('--relax-interval', type=float, default=0.5)
+    parser.add_argument('--mode', choices=['greedy', 'batch'], default='greedy')
+    parser.add_argument('--tick-interval', type=float, default=0.2, help='период тика в режиме batch, сек')
+    parser.add_argument('--backend', choices=['memory', 'redis'], default='memory')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    raise SystemExit(1 if violations(asyncio.run(run(args))) else 0)
+
+if __name__ == '__main__':
+    main()
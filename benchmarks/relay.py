@@ -0,0 +1,126 @@
+"""Задержка пересылки в чате: copyMessage против отправки по типу.
+
+    python -m benchmarks.relay --messages 2000 --latency 0.02 --concurrency 20
+
+Настоящий aiogram Bot ходит в локальный BotApiServer. Сообщения разных
+типов (текст, фото с подписью, голосовые, стикеры, GIF, ...) пересылаются
+через relay_message в режимах copy и types; считаются задержка одной
+пересылки (p50/p99), запросов к Bot API на сообщение и пропускная
+способность. Часть сообщений сервер отказывается копировать - для них
+в режиме copy срабатывает запасной путь по типу.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+from typing import List
+
+from aiogram import Bot, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import handlers.chat as chat
+from benchmarks.bot_api_server import BotApiServer
+from benchmarks.stats import percentile
+
+PARTNER_ID = 200
+
+def file(kind: str, n: int) -> dict:
+    return {'file_id': f"{kind}-{n}", 'file_unique_id': f"u{kind}-{n}"}
+
+CONTENT = {
+    'text': lambda n: {'text': f"привет {n}", 'entities': [{'type': 'bold', 'offset': 0, 'length': 6}]},
+    'photo': lambda n: {'photo': [dict(file('ps', n), width=90, height=90), dict(file('p', n), width=800, height=800)],
+                        'caption': 'фото', 'caption_entities': [{'type': 'italic', 'offset': 0, 'length': 4}]},
+    'voice': lambda n: {'voice': dict(file('v', n), duration=3)},
+    'sticker': lambda n: {'sticker': dict(file('s', n), type='regular', width=512, height=512, is_animated=False, is_video=False)},
+    'animation': lambda n: {'animation': dict(file('a', n), width=320, height=240, duration=2),
+                            'document': file('a', n), 'caption': 'gif'},
+    'video_note': lambda n: {'video_note': dict(file('vn', n), length=240, duration=5)},
+    'document': lambda n: {'document': file('d', n), 'caption': 'файл'},
+    'location': lambda n: {'location': {'latitude': 55.75, 'longitude': 37.62}},
+}
+# Примерная доля типов в анонимном чате
+WEIGHTS = {'text': 70, 'photo': 8, 'voice': 8, 'sticker': 8, 'animation': 2, 'video_note': 2, 'document': 1, 'location': 1}
+
+def make_messages(bot: Bot, count: int, seed: int) -> List[types.Message]:
+    rng = random.Random(seed)
+    kinds = rng.choices(list(WEIGHTS), weights=list(WEIGHTS.values()), k=count)
+    messages = []
+    for n, kind in enumerate(kinds, start=1):
+        data = {
+            'message_id': n,
+            'date': int(time.time()),
+            'chat': {'id': 100, 'type': 'private'},
+            'from': {'id': 100, 'is_bot': False, 'first_name': 'user'},
+        }
+        data.update(CONTENT[kind](n))
+        messages.append(types.Message.model_validate(data, context={'bot': bot}))
+    return messages
+
+async def run(bot: Bot, server: BotApiServer, messages: List[types.Message], mode: str, concurrency: int) -> dict:
+    chat.RELAY_MODE = mode
+    server.calls.clear()
+    latencies: List[float] = []
+    unsupported = 0
+    pending = iter(messages)
+
+    async def worker():
+        nonlocal unsupported
+        for message in pending:
+            started = time.perf_counter()
+            if not await chat.relay_message(message, PARTNER_ID):
+                unsupported += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    methods = {}
+    for _, method, _ in server.calls:
+        methods[method] = methods.get(method, 0) + 1
+    return {
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'throughput': len(messages) / elapsed,
+        'requests': len(server.calls) / len(messages),
+        'methods': methods,
+        'unsupported': unsupported
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа Bot API, сек')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--uncopyable', type=float, default=0.01, help='доля сообщений, которые нельзя скопировать')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    server = BotApiServer(args.latency)
+    url = await server.start()
+    bot = Bot('1:bench', session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    messages = make_messages(bot, args.messages, args.seed)
+    rng = random.Random(args.seed)
+    server.uncopyable = {m.message_id for m in messages if rng.random() < args.uncopyable}
+
+    try:
+        print(f"{args.messages} messages, Bot API latency {args.latency * 1000:.0f}ms, "
+              f"{args.concurrency} chats at once, {len(server.uncopyable)} uncopyable")
+        for mode in ('types', 'copy'):
+            result = await run(bot, server, messages, mode, args.concurrency)
+            methods = ', '.join(f"{method} {count}" for method, count in sorted(result['methods'].items(), key=lambda item: -item[1]))
+            print(f"  {mode:5}  p50 {result['p50']:6.1f}ms  p99 {result['p99']:6.1f}ms  "
+                  f"{result['throughput']:7.0f} msg/s  {result['requests']:.3f} requests/msg  "
+                  f"unsupported {result['unsupported']}")
+            print(f"         {methods}")
+    finally:
+        await bot.session.close()
+        await server.stop()
+
+if __name__ == '__main__':
+    asyncio.run(main())
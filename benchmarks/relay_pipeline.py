@@ -0,0 +1,146 @@
+"""Пересылка в чатах: отправка прямо в обработчике против очередей RelayPipelines.
+
+    python -m benchmarks.relay_pipeline --chats 50 --burst 8 --slow 0.05
+
+Настоящий aiogram Bot ходит в локальный BotApiServer. Каждый отправитель
+время от времени шлет пачку сообщений; каждое обрабатывается своей
+задачей, как при параллельной обработке апдейтов, и доходит до пересылки
+со случайной задержкой (middleware, база). Часть сообщений (доля slow) -
+тяжелые видео, копирование которых отвечает на slow_delay секунд
+дольше. Считаются время обработчика, задержка доставки, перестановки
+сообщений у получателя и число одновременно живых обработчиков.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+from typing import Dict, List
+
+from aiogram import Bot, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import handlers.chat as chat
+from benchmarks.bot_api_server import BotApiServer
+from benchmarks.stats import percentile
+from services.relay_pipeline import RelayPipelines
+
+def make_message(bot: Bot, sender: int, message_id: int) -> types.Message:
+    return types.Message.model_validate({
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': sender, 'type': 'private'},
+        'from': {'id': sender, 'is_bot': False, 'first_name': 'user'},
+        'text': f"сообщение {message_id}"
+    }, context={'bot': bot})
+
+async def run(args, pipelined: bool) -> Dict:
+    server = BotApiServer(args.latency)
+    url = await server.start()
+    bot = Bot('1:bench', session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    chat.RELAY_MODE = 'copy'
+    rng = random.Random(args.seed)
+
+    created: Dict[int, float] = {}
+    delivery: List[float] = []
+    handler_times: List[float] = []
+    live = {'now': 0, 'peak': 0}
+    rejected = 0
+
+    async def deliver(message: types.Message, partner_id: int):
+        await chat.deliver_message(message, partner_id)
+        delivery.append(time.monotonic() - created[message.message_id])
+
+    pipelines = RelayPipelines(queue_size=args.queue_size)
+    pipelines.setup(deliver)
+
+    async def handler(message: types.Message, partner_id: int):
+        nonlocal rejected
+        live['now'] += 1
+        live['peak'] = max(live['peak'], live['now'])
+        started = time.monotonic()
+        if pipelined:
+            # Как RelayOrderMiddleware: сообщение отмечается до middleware и базы
+            pipelines.expect(message, partner_id)
+            try:
+                await asyncio.sleep(rng.uniform(0, args.jitter))  # Middleware и база до пересылки
+                if not pipelines.submit(message, partner_id):
+                    rejected += 1
+            finally:
+                pipelines.settle(message, partner_id)
+        else:
+            await asyncio.sleep(rng.uniform(0, args.jitter))
+            await deliver(message, partner_id)
+        handler_times.append(time.monotonic() - started)
+        live['now'] -= 1
+
+    handlers = []
+    message_ids = iter(range(1, 10 ** 9))
+
+    async def sender(user_id: int, partner_id: int):
+        for _ in range(args.bursts):
+            await asyncio.sleep(rng.uniform(0, args.pause))
+            for _ in range(args.burst):
+                message_id = next(message_ids)
+                if rng.random() < args.slow:
+                    server.slow[message_id] = args.slow_delay
+                created[message_id] = time.monotonic()
+                handlers.append(asyncio.create_task(handler(make_message(bot, user_id, message_id), partner_id)))
+                await asyncio.sleep(args.gap)
+
+    # deliver_message отправляет только в текущий чат отправителя
+    for n in range(args.chats):
+        chat.chat_sessions.start(1000 + n, 5000 + n)
+    started = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(sender(1000 + n, 5000 + n) for n in range(args.chats)))
+        await asyncio.gather(*handlers)
+        await pipelines.stop(timeout=60)
+    elapsed = time.monotonic() - started
+    for n in range(args.chats):
+        chat.chat_sessions.end(1000 + n)
+    await bot.session.close()
+    await server.stop()
+
+    out_of_order = sum(
+        1 for ids in server.delivered.values()
+        for previous, current in zip(ids, ids[1:]) if current < previous
+    )
+    return {
+        'handler_p50': percentile(handler_times, 0.5) * 1000,
+        'handler_p99': percentile(handler_times, 0.99) * 1000,
+        'delivery_p50': percentile(delivery, 0.5) * 1000,
+        'delivery_p99': percentile(delivery, 0.99) * 1000,
+        'out_of_order': out_of_order,
+        'delivered': sum(len(ids) for ids in server.delivered.values()),
+        'rejected': rejected,
+        'peak_handlers': live['peak'],
+        'elapsed': elapsed
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--bursts', type=int, default=5, help='пачек на отправителя')
+    parser.add_argument('--burst', type=int, default=8, help='сообщений в пачке')
+    parser.add_argument('--gap', type=float, default=0.01, help='интервал между сообщениями пачки, сек')
+    parser.add_argument('--pause', type=float, default=2, help='максимальная пауза между пачками, сек')
+    parser.add_argument('--jitter', type=float, default=0.03, help='разброс времени до пересылки в обработчике, сек')
+    parser.add_argument('--slow', type=float, default=0.05, help='доля тяжелых сообщений')
+    parser.add_argument('--slow-delay', type=float, default=1.0)
+    parser.add_argument('--latency', type=float, default=0.03, help='задержка ответа Bot API, сек')
+    parser.add_argument('--queue-size', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for pipelined in (False, True):
+        result = await run(args, pipelined)
+        print(f"{'pipelines' if pipelined else 'inline':9}  handler p50 {result['handler_p50']:6.0f}ms p99 {result['handler_p99']:6.0f}ms  "
+              f"delivery p50 {result['delivery_p50']:6.0f}ms p99 {result['delivery_p99']:6.0f}ms")
+        print(f"           delivered {result['delivered']}, out of order {result['out_of_order']}, "
+              f"rejected {result['rejected']}, peak live handlers {result['peak_handlers']}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
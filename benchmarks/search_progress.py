@@ -0,0 +1,124 @@
+"""Нагрузка сообщений о прогрессе поиска на бюджет исходящих запросов.
+
+    python -m benchmarks.search_progress --searchers 2000 --relay 15 --seconds 30
+
+Ищущие с разным временем ожидания стоят в очереди, общий обходчик
+(SearchProgressTicker) правит их сообщения через фиктивный объект
+сообщения, а параллельно идет пересылка в чатах с заданной частотой.
+Считаются правки в секунду, суммарная нагрузка на Bot API и сколько
+сообщений к концу прогона показывают устаревший текст (минуты ожидания
+меняют текст каждому ищущему раз в минуту). Для сравнения
+печатается нагрузка прежней схемы: правка каждого ищущего раз в 5 секунд.
+С --churn ищущие уходят из очереди и приходят новые; правок ушедшим быть
+не должно, а их токены возвращаются в бюджет.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from handlers.chat import render_search_progress
+from services.outbound import PROGRESS, RELAY, OutboundScheduler
+from services.search_progress import SearchProgressTicker
+
+class FakeMessage:
+    def __init__(self, stats: dict):
+        self.stats = stats
+        self.gone = False  # Ищущий уже ушел из очереди
+
+    async def edit_text(self, text: str, **kwargs):
+        self.stats['edits'] += 1
+        self.stats['wasted'] += self.gone
+        await asyncio.sleep(0.05)  # Задержка ответа Bot API
+
+async def relay(scheduler: OutboundScheduler, rate: float, seconds: float, stats: dict):
+    """Пересылка в чатах: старший класс, каждое сообщение в свой чат"""
+    deadline = time.monotonic() + seconds
+    chat_id = 0
+    while time.monotonic() < deadline:
+        chat_id -= 1
+        await scheduler.acquire(RELAY, chat_id)
+        stats['relays'] += 1
+        await asyncio.sleep(1 / rate)
+
+def make_entry(rng: random.Random, stats: dict, now: float, waited: float) -> dict:
+    enqueued_at = now - waited
+    return {
+        'tier': rng.choice(['high', 'medium', 'low']),
+        'enqueued_at': enqueued_at,
+        'relaxed_level': min(int((now - enqueued_at) // 60), 4),
+        'message': FakeMessage(stats)
+    }
+
+async def churn(searchers: dict, rate: float, seconds: float, rng: random.Random, stats: dict):
+    """Ищущие уходят из очереди (пара или отмена), а на их место приходят новые"""
+    deadline = time.monotonic() + seconds
+    next_id = len(searchers)
+    while rate > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(1 / rate)
+        user_id = rng.choice(list(searchers))
+        searchers.pop(user_id)['message'].gone = True
+        searchers[next_id] = make_entry(rng, stats, time.time(), 0)
+        next_id += 1
+
+async def run(args):
+    rng = random.Random(args.seed)
+    stats = {'edits': 0, 'relays': 0, 'wasted': 0}
+    now = time.time()
+    searchers = {user_id: make_entry(rng, stats, now, rng.uniform(0, 600)) for user_id in range(args.searchers)}
+
+    queue = {'total': args.searchers}
+
+    async def snapshot():
+        # Очередь слегка колеблется, как при входах и выходах
+        queue['total'] = max(queue['total'] + rng.randint(-3, 3), 1)
+        total = queue['total']
+        queue['last'] = {'total': total, 'tiers': {'high': total // 5, 'medium': total // 3, 'low': total - total // 5 - total // 3}}
+        return queue['last']
+
+    async def edit(entry, text):
+        await entry['message'].edit_text(text)
+
+    # Установившийся режим: каждому уже показан текст по текущей очереди
+    initial = await snapshot()
+    for entry in searchers.values():
+        entry['progress_text'] = render_search_progress(entry, initial)
+
+    scheduler = OutboundScheduler(rate=args.rate)
+    ticker = SearchProgressTicker(interval=args.interval, scheduler=scheduler)
+    ticker.setup(searchers, snapshot, render_search_progress, edit)
+    ticker.start()
+    started = time.monotonic()
+    await asyncio.gather(
+        relay(scheduler, args.relay, args.seconds, stats),
+        churn(searchers, args.churn, args.seconds, random.Random(args.seed + 1), stats)
+    )
+    elapsed = time.monotonic() - started
+    await ticker.stop()
+
+    # Устаревшие - чей текст по последнему снимку очереди отличается от показанного
+    stale = sum(
+        1 for entry in searchers.values()
+        if render_search_progress(entry, queue['last']) not in (None, entry.get('progress_text'))
+    )
+    print(f"{args.searchers} searchers, relay {args.relay}/s, budget {args.rate}/s, {elapsed:.0f}s:")
+    print(f"  progress edits   {stats['edits'] / elapsed:7.1f}/s   (old per-searcher loop: {args.searchers / 5:.0f}/s)")
+    print(f"  relays           {stats['relays'] / elapsed:7.1f}/s   (max wait {scheduler.max_wait[RELAY] * 1000:.0f}ms)")
+    print(f"  total Bot API    {(stats['edits'] + stats['relays']) / elapsed:7.1f}/s")
+    print(f"  deferred passes  {ticker.deferred}, stale messages at the end: {stale}")
+    print(f"  edits to searchers who already left: {stats['wasted']}, tokens returned: {scheduler.released[PROGRESS]}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--searchers', type=int, default=2000)
+    parser.add_argument('--relay', type=float, default=15, help='пересылок в секунду')
+    parser.add_argument('--rate', type=float, default=25, help='бюджет запросов в секунду')
+    parser.add_argument('--interval', type=float, default=5)
+    parser.add_argument('--churn', type=float, default=20, help='ищущих в секунду уходит и приходит')
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
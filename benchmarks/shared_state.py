@@ -0,0 +1,161 @@
+"""Несколько процессов-подборщиков на одном хранилище (STATE_BACKEND=redis).
+
+    python -m benchmarks.shared_state --workers 4 --users 2000
+    python -m benchmarks.shared_state --redis-url redis://localhost:6379/0
+
+Без --redis-url поднимает tests.resp_server. Два прогона:
+
+1. pairs - каждый процесс ставит в очередь свою долю пользователей и
+   пытается спарить случайные пары из всего пула; проверяется, что ни
+   один пользователь не получил двух собеседников.
+2. matchmaker - в каждом процессе работает настоящий Matchmaker с общим
+   хранилищем: свои пользователи встают в очередь постепенно, чужие
+   подтягиваются сверкой очереди. Проверяется то же самое плюс
+   согласованность счетчиков хранилища.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import random
+import time
+from typing import Dict, List, Tuple
+
+from tests.profiles import make_profiles, fill_profile_cache
+from tests.resp_server import RespServer
+from services.match_state import RedisStateBackend
+from services.matchmaker import Matchmaker
+from services.search_queue import SearchQueue
+
+def own_users(user_ids: List[int], worker: int, workers: int) -> List[int]:
+    return user_ids[worker::workers]
+
+async def contend(url: str, prefix: str, worker: int, workers: int, user_ids: List[int], attempts: int) -> List[Tuple[int, int]]:
+    state = RedisStateBackend(url, prefix=prefix)
+    for user_id in own_users(user_ids, worker, workers):
+        await state.add_searcher(user_id, 'low', time.time())
+
+    rng = random.Random(worker)
+    paired = []
+    for _ in range(attempts):
+        user_id, partner_id = rng.sample(user_ids, 2)
+        if await state.pair(user_id, partner_id):
+            paired.append((user_id, partner_id))
+    await state.close()
+    return paired
+
+async def match(url: str, prefix: str, worker: int, workers: int, users: int, seconds: float) -> List[Tuple[int, int]]:
+    # Все процессы строят одинаковые профили: так чужих ищущих можно
+    # загрузить из profile_cache без БД
+    profiles = make_profiles(users)
+    fill_profile_cache(profiles)
+    mine = own_users(profiles, worker, workers)
+
+    paired = []
+    async def on_match(entry, partner_entry, user_id, partner_id, score, reasons, level):
+        paired.append((user_id, partner_id))
+
+    state = RedisStateBackend(url, prefix=prefix)
+    matchmaker = Matchmaker(relax_interval=1, tick_interval=0.2)
+    matchmaker.setup(SearchQueue(), state, on_match=on_match)
+
+    deadline = time.time() + seconds
+    with contextlib.redirect_stdout(io.StringIO()):
+        for profile in mine:
+            await matchmaker.enqueue(profile['user_id'], profile, 'low', bot=None)
+            await asyncio.sleep(seconds / 2 / len(mine))
+        while time.time() < deadline:
+            await asyncio.sleep(0.1)
+    await asyncio.sleep(0.2)
+    await state.close()
+    return paired
+
+def worker_main(mode: str, url: str, prefix: str, worker: int, workers: int, users: int, attempts: int, seconds: float, results):
+    if mode == 'pairs':
+        user_ids = list(range(1_000_000, 1_000_000 + users))
+        results.put(asyncio.run(contend(url, prefix, worker, workers, user_ids, attempts)))
+    else:
+        results.put(asyncio.run(match(url, prefix, worker, workers, users, seconds)))
+
+async def check_store(url: str, prefix: str, user_ids: List[int]) -> Dict[str, int]:
+    """Согласованность ключей хранилища после прогона"""
+    state = RedisStateBackend(url, prefix=prefix)
+    queue = await state.searchers()
+    partners = {user_id: await state.partner_of(user_id) for user_id in user_ids}
+    in_chat = {user_id: partner_id for user_id, partner_id in partners.items() if partner_id is not None}
+    tier_total = await state.tier_count('low')
+    report = {
+        'queued': len(queue),
+        'in_chat': len(in_chat),
+        'chat_count': await state.chat_count(),
+        'not_mutual': sum(1 for user_id, partner_id in in_chat.items() if in_chat.get(partner_id) != user_id),
+        'queued_and_in_chat': sum(1 for user_id in queue if user_id in in_chat),
+        'tier_count_diff': tier_total - len(queue)
+    }
+    await state.close()
+    return report
+
+def run(mode: str, url: str, workers: int, users: int, attempts: int, seconds: float) -> bool:
+    prefix = f"bench:{mode}:{time.time_ns()}:"
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker_main, args=(mode, url, prefix, worker, workers, users, attempts, seconds, results))
+        for worker in range(workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    paired = [pair for _ in processes for pair in results.get()]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    seen: Dict[int, int] = {}
+    for user_id, partner_id in paired:
+        for uid in (user_id, partner_id):
+            seen[uid] = seen.get(uid, 0) + 1
+    double = sum(1 for count in seen.values() if count > 1)
+
+    user_ids = list(range(1_000_000, 1_000_000 + users))
+    report = asyncio.run(check_store(url, prefix, user_ids))
+    ok = (double == 0 and report['not_mutual'] == 0 and report['queued_and_in_chat'] == 0
+          and report['tier_count_diff'] == 0 and report['chat_count'] * 2 == report['in_chat'] == len(paired) * 2
+          and report['queued'] + report['in_chat'] == users)
+    print(f"{mode:<10} {workers} workers, {users} users: {len(paired)} pairs in {elapsed:.1f}s, "
+          f"double-paired {double}, store {report} {'OK' if ok else 'FAILED'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--attempts', type=int, default=3000, help='попыток pair() на процесс в прогоне pairs')
+    parser.add_argument('--seconds', type=float, default=6.0, help='длительность прогона matchmaker')
+    parser.add_argument('--redis-url', default=None, help='настоящий Redis вместо встроенного сервера')
+    args = parser.parse_args()
+
+    server_process = None
+    url = args.redis_url
+    if url is None:
+        port = 6390
+        server_process = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+        server_process.start()
+        time.sleep(0.5)
+        url = f"redis://127.0.0.1:{port}/0"
+
+    ok = run('pairs', url, args.workers, args.users, args.attempts, args.seconds)
+    ok = run('matchmaker', url, args.workers, args.users, args.attempts, args.seconds) and ok
+    if server_process is not None:
+        server_process.terminate()
+    raise SystemExit(0 if ok else 1)
+
+def serve(port: int):
+    async def forever():
+        server = RespServer()
+        await server.start('127.0.0.1', port)
+        await server.server.serve_forever()
+    asyncio.run(forever())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+from typing import List
+
+def percentile(samples: List[float], q: float) -> float:
+    """Перцентиль q (0..1) выборки; для пустой - nan"""
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else float('nan')
@@ -0,0 +1,115 @@
+"""Память и скорость логов переписки: ChatTranscripts против прежних списков.
+
+    python -m benchmarks.transcripts --chats 5000 --active 300
+
+Чаты идут потоком, одновременно активны active; сообщения (текст, иногда
+фото) перемешаны между активными чатами, часы модельные. Часть чатов
+завершается командой, остальные просто бросают. Прежняя схема
+воспроизведена здесь же: словарь в сообщение, лог текста дважды
+(ChatLogger и "принудительно" в обработчике), срез [-100:] после 100
+сообщений и никакого освобождения. Новая - ChatTranscripts: кольцевой
+буфер кортежей, освобождение при завершении и по простою.
+"""
+import argparse
+import random
+import string
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from services.chat_session import ChatSession, ChatTranscripts
+
+def make_events(args) -> List[Tuple]:
+    """[(время, номер чата, сторона, тип, текст) или (время, номер чата, 'end'/'abandon')]"""
+    rng = random.Random(args.seed)
+    events = []
+    now = 0.0
+    active: Dict[int, int] = {}  # Чат -> сколько сообщений осталось
+    next_chat = 0
+    while next_chat < args.chats or active:
+        while len(active) < args.active and next_chat < args.chats:
+            active[next_chat] = max(1, int(rng.expovariate(1 / args.mean_messages)))
+            next_chat += 1
+        chat = rng.choice(list(active))
+        now += args.tick
+        msg_type = 'photo' if rng.random() < 0.1 else 'text'
+        text = ''.join(rng.choices(string.ascii_letters + ' ', k=rng.randint(5, 200)))
+        events.append((now, chat, rng.randint(0, 1), msg_type, text))
+        active[chat] -= 1
+        if active[chat] == 0:
+            del active[chat]
+            events.append((now, chat, 'end' if rng.random() < args.ended else 'abandon'))
+    return events
+
+def run_legacy(events) -> Tuple[float, int, int]:
+    chat_logs: Dict[int, List[Dict]] = {}
+
+    def log(chat: int, user_id: int, text: str, msg_type: str, now: float):
+        entries = chat_logs.setdefault(chat, [])
+        entries.append({'user_id': user_id, 'message': text, 'timestamp': now, 'type': msg_type})
+        if len(entries) > 100:
+            chat_logs[chat] = entries[-100:]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for event in events:
+        if len(event) == 3:
+            continue  # Логи завершенных чатов не освобождались
+        now, chat, side, msg_type, text = event
+        log(chat, side, text, msg_type, now)
+        if msg_type == 'text':
+            log(chat, side, text, msg_type, now)  # "Принудительно логируем"
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, memory, sum(len(entries) for entries in chat_logs.values())
+
+def run_transcripts(events, args) -> Tuple[float, int, int, int, int]:
+    tracemalloc.start()
+    transcripts = ChatTranscripts(per_chat=100, max_entries=args.max_entries, idle_ttl=args.idle_ttl)
+    sessions: Dict[int, ChatSession] = {}
+    started = time.perf_counter()
+    for event in events:
+        if len(event) == 3:
+            now, chat, outcome = event
+            session = sessions.pop(chat)
+            if outcome == 'end':
+                transcripts.drop(session)
+            continue
+        now, chat, side, msg_type, text = event
+        session = sessions.get(chat)
+        if session is None:
+            session = sessions[chat] = ChatSession(2 * chat, 2 * chat + 1, started_at=now)
+        transcripts.append(session, session.user_id if side == 0 else session.partner_id, text, msg_type, now)
+    elapsed = time.perf_counter() - started
+    sessions.clear()  # Сессии брошенных чатов держит только хранилище логов
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, memory, transcripts.entries, transcripts.footprint(), transcripts.evicted
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=5000)
+    parser.add_argument('--active', type=int, default=300, help='одновременно активных чатов')
+    parser.add_argument('--mean-messages', type=float, default=80)
+    parser.add_argument('--ended', type=float, default=0.7, help='доля чатов, завершенных командой')
+    parser.add_argument('--tick', type=float, default=0.05, help='модельных секунд между сообщениями')
+    parser.add_argument('--idle-ttl', type=float, default=600)
+    parser.add_argument('--max-entries', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    events = make_events(args)
+    messages = sum(1 for event in events if len(event) == 5)
+    legacy_time, legacy_memory, legacy_entries = run_legacy(events)
+    new_time, new_memory, new_entries, footprint, evicted = run_transcripts(events, args)
+    # Тексты сообщений живут и в списке событий, поэтому tracemalloc видит только сами логи
+    print(f"{args.chats} chats, {messages} messages, {events[-1][0]:.0f} model seconds:")
+    print(f"  legacy       {legacy_time / messages * 1e6:6.2f} us/message  {legacy_entries:7} entries  "
+          f"{legacy_memory / 1024 / 1024:7.1f} MB (texts shared with the input)")
+    print(f"  transcripts  {new_time / messages * 1e6:6.2f} us/message  {new_entries:7} entries  "
+          f"{new_memory / 1024 / 1024:7.1f} MB (texts shared)  footprint() {footprint / 1024 / 1024:.1f} MB "
+          f"with texts, {evicted} logs evicted")
+
+if __name__ == '__main__':
+    main()
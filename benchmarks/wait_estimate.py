@@ -0,0 +1,108 @@
+"""Точность оценки ожидания и эффект досрочного ослабления на живой очереди.
+
+    python -m benchmarks.wait_estimate --rate 20 --seconds 60
+
+Ищущие приходят пуассоновским потоком в настоящий Matchmaker (хранилище
+в памяти, время ускорено: уровень ослабления растет раз в relax_interval
+секунд, статистика затухает за half_life). Перед входом каждому
+запоминается estimate_wait, после подбора - фактическое ожидание;
+не дождавшиеся за patience секунд уходят. Прогон повторяется с
+досрочным ослаблением и без него.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+from typing import Dict
+
+from benchmarks.stats import percentile
+from tests.profiles import make_profiles, fill_profile_cache
+from services.match_state import MemoryStateBackend
+from services.matchmaker import Matchmaker
+from services.search_queue import SearchQueue
+from services.wait_estimator import WaitEstimator
+
+async def run(args, adaptive: bool) -> Dict:
+    profiles = make_profiles(int(args.rate * args.seconds * 1.2) + 10, seed=args.seed)
+    fill_profile_cache(profiles)
+    rng = random.Random(args.seed)
+
+    matched_at: Dict[int, float] = {}
+    async def on_match(entry, partner_entry, user_id, partner_id, score, reasons, level):
+        now = time.time()
+        matched_at[user_id] = matched_at[partner_id] = now
+
+    matchmaker = Matchmaker(relax_interval=args.relax_interval, tick_interval=0.2, adaptive=adaptive)
+    matchmaker.estimator = WaitEstimator(half_life=args.half_life)
+    matchmaker.setup(SearchQueue(), MemoryStateBackend(), on_match=on_match)
+
+    estimates: Dict[int, float] = {}
+    arrived: Dict[int, float] = {}
+    gave_up = 0
+
+    async def searcher(profile):
+        nonlocal gave_up
+        user_id = profile['user_id']
+        estimates[user_id] = matchmaker.estimate_wait(profile, user_id)
+        arrived[user_id] = time.time()
+        await matchmaker.enqueue(user_id, profile, 'low', bot=None)
+        await asyncio.sleep(args.patience)
+        if await matchmaker.dequeue(user_id):
+            gave_up += 1
+
+    tasks = []
+    started = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for profile in profiles:
+            if time.time() - started > args.seconds:
+                break
+            tasks.append(asyncio.create_task(searcher(profile)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+
+    # Первые half_life секунд статистика только набирается
+    warm = started + args.half_life
+    errors, waits, unknown = [], [], 0
+    for user_id, matched in matched_at.items():
+        wait = matched - arrived[user_id]
+        waits.append(wait)
+        if arrived[user_id] < warm:
+            continue
+        if estimates[user_id] is None:
+            unknown += 1
+        else:
+            errors.append(abs(estimates[user_id] - wait))
+    return {
+        'searchers': len(tasks),
+        'matched': len(matched_at),
+        'gave_up': gave_up,
+        'wait_p50': percentile(waits, 0.5),
+        'wait_p90': percentile(waits, 0.9),
+        'abs_error_p50': percentile(errors, 0.5),
+        'abs_error_p90': percentile(errors, 0.9),
+        'unknown': unknown,
+        'adaptive_skips': matchmaker.adaptive_skips
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=20, help='входов в секунду')
+    parser.add_argument('--seconds', type=float, default=60)
+    parser.add_argument('--relax-interval', type=float, default=3)
+    parser.add_argument('--half-life', type=float, default=10)
+    parser.add_argument('--patience', type=float, default=20, help='сколько секунд ищущий ждет до отмены')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for adaptive in (False, True):
+        result = await run(args, adaptive)
+        print(f"adaptive={adaptive}: {result['searchers']} searchers, {result['matched']} matched, "
+              f"{result['gave_up']} gave up, {result['adaptive_skips']} early relaxations")
+        print(f"  wait p50 {result['wait_p50']:.2f}s p90 {result['wait_p90']:.2f}s   "
+              f"estimate abs error p50 {result['abs_error_p50']:.2f}s p90 {result['abs_error_p90']:.2f}s   "
+              f"no estimate {result['unknown']}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -33,10 +33,9 @@ from middlewares.conversation_tracker import ConversationTrackerMiddleware
 from middlewares.smart_ban import SmartBanMiddleware
 from middlewares.admin import AdminMiddleware
 from middlewares.chat_logger import ChatLoggerMiddleware
+from middlewares.relay_order import RelayOrderMiddleware
 from middlewares.notifications import NotificationMiddleware
-
-# Глобальный экземпляр для доступа к логам
-chat_logger = ChatLoggerMiddleware()
+from middlewares.smart_matching import smart_matching_middleware
 
 # Настройка логирования
 logging.basicConfig(
@@ -68,12 +67,22 @@ async def main():
         await Tortoise.init(config=__import__('database.tortoise_config', fromlist=['TORTOISE_ORM']).TORTOISE_ORM)
         logger.info("Tortoise-ORM инициализирована")
         
+        # Изученные предпочтения и черный список для подбора
+        from services.smart_matching import smart_matcher
+        await smart_matcher.load_preferences()
+        await smart_matcher.blocklist.load()
+        
         # Инициализация бота и диспетчера
         bot = Bot(token=BOT_TOKEN)
+        # Все исходящие запросы идут через общий планировщик с лимитами Telegram
+        from services.outbound import outbound_scheduler
+        bot.session.middleware(outbound_scheduler)
         storage = MemoryStorage()
         dp = Dispatcher(storage=storage)
         
         # Регистрируем middleware (порядок важен!)
+        # Сообщения из чата отмечаются раньше всех, пока апдейты идут по порядку
+        dp.message.outer_middleware(RelayOrderMiddleware())
         dp.message.middleware(UserCounterMiddleware())
         dp.message.middleware(AuthMiddleware())
         dp.message.middleware(BanMiddleware())
@@ -82,7 +91,8 @@ async def main():
         dp.message.middleware(AntiFloodMiddleware())
         dp.message.middleware(AIContentModerationMiddleware())
         dp.message.middleware(ConversationTrackerMiddleware())
-        dp.message.middleware(chat_logger)
+        dp.message.middleware(smart_matching_middleware)
+        dp.message.middleware(ChatLoggerMiddleware())
         dp.message.middleware(SmartBanMiddleware())
         dp.message.middleware(AdminMiddleware())
         dp.message.middleware(NotificationMiddleware())
@@ -111,6 +121,21 @@ async def main():
         from utils.commands import set_bot_commands
         await set_bot_commands(bot)
         
+        # Возвращаем очередь поиска и чаты, прерванные перезапуском
+        from handlers.chat import restore_sessions
+        from services.match_state import match_state
+        await restore_sessions(bot, storage)
+        dp.shutdown.register(match_state.close)
+
+        # Сообщения о прогрессе поиска обновляет один общий обходчик
+        from services.search_progress import search_progress
+        search_progress.start()
+        dp.shutdown.register(search_progress.stop)
+        
+        # Недоотправленные пересылки в чатах успевают уйти при остановке
+        from services.relay_pipeline import relay_pipelines
+        dp.shutdown.register(relay_pipelines.stop)
+        
         # Запуск бота
         logger.info("Бот запущен")
         await dp.start_polling(bot, skip_updates=True)
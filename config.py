@@ -14,4 +14,61 @@ AUTO_RESTART = os.getenv("AUTO_RESTART", "true").lower() == "true"
 BACKUP_BEFORE_UPDATE = os.getenv("BACKUP_BEFORE_UPDATE", "true").lower() == "true"
 
 # Admin settings
-ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
\ No newline at end of file
+ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
+
+# Matching settings
+# greedy - подбор при входе в очередь, batch - периодическое глобальное распределение пар
+# раз в MATCHING_TICK_INTERVAL секунд. batch дает пары с большей оценкой, но ищущий
+# ждет до тика, и кто уходит раньше, остается без пары (сравнение - benchmarks.batch_assignment
+# и benchmarks.pairing_stress --mode batch --tick-interval)
+MATCHING_MODE = os.getenv("MATCHING_MODE", "greedy").lower()
+MATCHING_TICK_INTERVAL = float(os.getenv("MATCHING_TICK_INTERVAL", "2"))
+MATCHING_WAIT_BONUS = float(os.getenv("MATCHING_WAIT_BONUS", "0.02"))  # Бонус к весу пары за минуту ожидания
+# Сколько 64-битных слов тегов хранит векторная оценка на профиль (64 тега на слово);
+# теги сверх этого (редкие, введенные пользователями) сравниваются по маскам профилей
+MATCHING_TAG_WORDS = int(os.getenv("MATCHING_TAG_WORDS", "8"))
+# Сразу ослаблять требование цели знакомства, если совместимых по цели нет и скоро не будет
+MATCHING_ADAPTIVE_RELAXATION = os.getenv("MATCHING_ADAPTIVE_RELAXATION", "true").lower() == "true"
+# За сколько секунд вдвое затухает статистика входов и пар для оценки ожидания
+WAIT_ESTIMATE_HALF_LIFE = float(os.getenv("WAIT_ESTIMATE_HALF_LIFE", "600"))
+# Сколько последних собеседников не подбирать повторно
+RECENT_PARTNERS = int(os.getenv("RECENT_PARTNERS", "5"))
+# Города ближе этого расстояния считаются соседними на 2-м уровне ослабления
+NEARBY_CITY_KM = float(os.getenv("NEARBY_CITY_KM", "150"))
+
+# Shared matchmaking state
+# memory - очередь и чаты в памяти процесса, redis - общее хранилище для нескольких процессов
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# SQLite-журнал очереди и чатов для STATE_BACKEND=memory; пустое значение отключает
+MATCH_JOURNAL_PATH = os.getenv("MATCH_JOURNAL_PATH", "match_journal.db")
+
+# Chat relay
+# copy - любое сообщение одним copyMessage, types - отдельный метод Bot API на каждый тип
+RELAY_MODE = os.getenv("RELAY_MODE", "copy").lower()
+# Сколько сообщений может ждать отправки одному собеседнику, прежде чем отправителя попросят подождать
+RELAY_QUEUE_SIZE = int(os.getenv("RELAY_QUEUE_SIZE", "20"))
+# Сколько самое большее придерживать сообщение, пока более раннее того же отправителя еще обрабатывается, сек
+RELAY_MAX_HOLD = float(os.getenv("RELAY_MAX_HOLD", "2"))
+
+# Chat transcripts
+# Сколько последних сообщений каждого чата хранится для разбора жалоб
+CHAT_LOG_LIMIT = int(os.getenv("CHAT_LOG_LIMIT", "100"))
+# Сколько сообщений всего держат логи чатов; сверх этого освобождаются логи самых давно молчащих чатов
+CHAT_LOG_MAX_ENTRIES = int(os.getenv("CHAT_LOG_MAX_ENTRIES", "200000"))
+# Через сколько секунд тишины лог чата освобождается
+CHAT_LOG_IDLE_TTL = float(os.getenv("CHAT_LOG_IDLE_TTL", "3600"))
+
+# Outbound Bot API budget
+# Запросов в секунду на всех получателей (лимит Telegram - около 30)
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "25"))
+# Доля бюджета, которую фоновые отправки (прогресс поиска, рассылки) оставляют пересылке и уведомлениям
+OUTBOUND_RELAY_RESERVE = float(os.getenv("OUTBOUND_RELAY_RESERVE", "0.5"))
+# Сообщений в секунду в один чат и допустимый всплеск (Telegram - около 1 в секунду).
+# Пересылку в чатах не ограничивает - кроме чата, только что получившего 429
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "4"))
+# Сколько раз повторять запрос после ответа 429 (retry_after)
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Как часто обходить ищущих и обновлять сообщения о прогрессе поиска, сек
+SEARCH_PROGRESS_INTERVAL = float(os.getenv("SEARCH_PROGRESS_INTERVAL", "5"))
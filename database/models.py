@@ -99,4 +99,45 @@ class PremiumPurchase(Model):
     created_at = fields.DatetimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Purchase({self.user.tg_id}, {self.stars_amount} stars)"
\ No newline at end of file
+        return f"Purchase({self.user.tg_id}, {self.stars_amount} stars)"
+
+class ChatOutcome(Model):
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="chat_outcomes", on_delete=fields.CASCADE)  # завершил чат
+    partner = fields.ForeignKeyField("models.User", related_name="partner_chat_outcomes", on_delete=fields.CASCADE)
+    started_at = fields.DatetimeField()
+    duration_seconds = fields.FloatField()
+    user_messages = fields.IntField(default=0)
+    partner_messages = fields.IntField(default=0)
+    end_reason = fields.CharField(max_length=16)  # ended
+    user_reported = fields.BooleanField(default=False)  # жалоба от завершившего
+    partner_reported = fields.BooleanField(default=False)  # жалоба от собеседника
+    created_at = fields.DatetimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"ChatOutcome({self.user_id}, {self.partner_id}, {self.end_reason})"
+
+
+class UserPreference(Model):
+    id = fields.IntField(pk=True)
+    user = fields.OneToOneField("models.User", related_name="preference", on_delete=fields.CASCADE)
+    weights = fields.JSONField(default=list)  # веса по services.preferences.PREFERENCE_FEATURES
+    updates = fields.IntField(default=0)  # число учтенных чатов
+    updated_at = fields.DatetimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"UserPreference({self.user_id}, {self.updates})"
+
+
+class BlockedUser(Model):
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="blocked_users", on_delete=fields.CASCADE)
+    blocked = fields.ForeignKeyField("models.User", related_name="blocked_by", on_delete=fields.CASCADE)
+    reason = fields.CharField(max_length=32, null=True)  # report
+    created_at = fields.DatetimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = (("user", "blocked"),)
+    
+    def __str__(self):
+        return f"BlockedUser({self.user_id} -> {self.blocked_id})"
@@ -5,6 +5,7 @@ from database.models import User, Profile, Ban
 from keyboards.profile import create_keyboard
 from services.ai_moderation import ai_moderator
 from services.cache import profile_cache
+from services.pair_cache import pair_cache
 from utils.admin_helpers import safe_edit_message
 import time
 
@@ -34,15 +35,16 @@ async def admin_stats(callback: types.CallbackQuery):
     if not user or not user.is_admin:
         await callback.answer("Доступ запрещен")
         return
-    from handlers.chat import active_chats, search_queue
+    from services.match_state import match_state
     
     total_users = await User.all().count()
     active_users = await User.filter(is_active=True).count()
     premium_users = await User.filter(is_premium=True).count()
     banned_users = await Ban.filter(is_active=True).count()
     
-    in_chat = len(active_chats) // 2
-    in_queue = sum(len(queue) for queue in search_queue.values())
+    in_chat = await match_state.chat_count()
+    in_queue = await match_state.queue_size()
+    pair_stats = pair_cache.stats()
     
     stats_text = f"""**📊 Статистика системы**
 
@@ -59,6 +61,7 @@ async def admin_stats(callback: types.CallbackQuery):
 
 **Система:**
 • Кэш профилей: `{len(profile_cache.cache)}`
+• Кэш объяснений пар: `{pair_stats['size']}` (попаданий `{pair_stats['hit_rate']:.0%}`)
 • Нарушения: `{len(ai_moderator.violation_history)}`"""
     
     kb = create_keyboard([("🔄 Обновить", "admin_stats"), ("◀️ Назад", "admin_back")])
@@ -152,12 +155,17 @@ async def admin_settings(callback: types.CallbackQuery):
 
 @router.callback_query(F.data == "admin_limits")
 async def admin_limits(callback: types.CallbackQuery):
-    from handlers.chat import active_chats, search_queue
+    from services.match_state import match_state
+    from services.matchmaker import matchmaker
+    from handlers.chat import format_wait
+    from services.outbound import outbound_scheduler
+    from services.relay_pipeline import relay_pipelines
+    from services.chat_session import chat_transcripts
     
     max_users_in_chat = 1000
     max_queue_size = 500
-    current_chats = len(active_chats) // 2
-    current_queue = sum(len(queue) for queue in search_queue.values())
+    current_chats = await match_state.chat_count()
+    current_queue = await match_state.queue_size()
     
     text = f"**📊 Лимиты системы**\n\n"
     text += f"**Текущая нагрузка:**\n"
@@ -170,6 +178,41 @@ async def admin_limits(callback: types.CallbackQuery):
     text += f"• Поиск партнера: `60 сек`\n"
     text += f"• Антифлуд: `3 сек`\n\n"
     
+    # Скользящая статистика подборщика по корзинам (пол, ориентация, цель)
+    arrivals, matches, buckets = matchmaker.estimator.summary()
+    text += "**Поток очереди:**\n"
+    text += f"• Входов в поиск: `{arrivals:.1f}/мин`\n"
+    text += f"• Подобрано: `{matches:.1f}/мин`\n"
+    text += f"• Досрочных ослаблений: `{matchmaker.adaptive_skips}`\n"
+    for key, bucket_arrivals, bucket_matches, mean_wait in buckets[:5]:
+        waiting = len(matchmaker.index.buckets.get(key, ()))
+        estimate = matchmaker.estimate_wait(dict(zip(('gender', 'orientation', 'dating_goal'), key)))
+        text += (f"• {'/'.join(part or '?' for part in key)}: входов `{bucket_arrivals:.1f}/мин`, "
+                 f"пар `{bucket_matches:.1f}/мин`, ждут `{waiting}`, "
+                 f"ожидание `{format_wait(mean_wait) if mean_wait is not None else '-'}` "
+                 f"(оценка `{format_wait(estimate)}`)\n")
+    text += "\n"
+    
+    # Планировщик исходящих запросов к Telegram
+    outbound = outbound_scheduler.stats()
+    text += "**Исходящие запросы:**\n"
+    text += f"• Токенов в ведре: `{outbound['tokens']:.1f}/{outbound_scheduler.budget.burst:.0f}`\n"
+    text += f"• Ответов 429: `{outbound['flood_waits']}`, чатов на паузе: `{outbound['paused_chats']}`\n"
+    for name, metrics in outbound['classes'].items():
+        text += (f"• {name}: в очереди `{metrics['queued']}`, отправлено `{metrics['sent']}`, "
+                 f"ожидание `{metrics['mean_wait'] * 1000:.0f}/{metrics['max_wait'] * 1000:.0f} мс`, "
+                 f"повторов `{metrics['retries']}`\n")
+    text += (f"• Очереди пересылки: `{len(relay_pipelines.workers)}` чатов, `{relay_pipelines.depth()}` сообщений, "
+             f"макс. `{relay_pipelines.max_depth}`, отклонено `{relay_pipelines.rejected}`, "
+             f"сброшено `{relay_pipelines.dropped}`\n")
+    text += "\n"
+    
+    # Логи переписки для разбора жалоб
+    chat_transcripts.evict()
+    text += "**Логи чатов:**\n"
+    text += f"• Чатов с логом: `{len(chat_transcripts)}`, сообщений: `{chat_transcripts.entries}/{chat_transcripts.max_entries}`\n"
+    text += f"• Память: `{chat_transcripts.footprint() / 1024 / 1024:.1f} МБ`, освобождено логов: `{chat_transcripts.evicted}`\n\n"
+    
     if current_chats > max_users_in_chat * 0.8:
         status = "🔴 Высокая нагрузка"
     elif current_chats > max_users_in_chat * 0.5:
@@ -313,8 +356,8 @@ async def admin_cleanup(callback: types.CallbackQuery):
     
     # Очистка кэша
     cache_count = len(profile_cache.cache)
-    profile_cache.cache.clear()
-    profile_cache.timestamps.clear()
+    profile_cache.clear()
+    pair_cache.clear()
     
     # Очистка неактивных банов
     from datetime import datetime
@@ -781,7 +824,7 @@ async def system_stats_command(message: types.Message):
     if not user or not user.is_admin:
         return
     
-    from handlers.chat import active_chats, search_queue
+    from services.match_state import match_state
     from services.cache import profile_cache
     from services.ai_moderation import ai_moderator
     
@@ -790,8 +833,9 @@ async def system_stats_command(message: types.Message):
     premium_users = await User.filter(is_premium=True).count()
     banned_users = await Ban.filter(is_active=True).count()
     
-    in_chat = len(active_chats) // 2
-    in_queue = sum(len(queue) for queue in search_queue.values())
+    in_chat = await match_state.chat_count()
+    in_queue = await match_state.queue_size()
+    pair_stats = pair_cache.stats()
     
     text = f"**📊 Полная статистика системы**\n\n"
     text += f"👥 **Пользователи:**\n"
@@ -806,6 +850,7 @@ async def system_stats_command(message: types.Message):
     
     text += f"⚙️ **Система:**\n"
     text += f"• Кэш профилей: `{len(profile_cache.cache)}`\n"
+    text += f"• Кэш объяснений пар: `{pair_stats['size']}/{pair_stats['max_size']}`, попаданий `{pair_stats['hits']}`, промахов `{pair_stats['misses']}` ({pair_stats['hit_rate']:.0%})\n"
     text += f"• Нарушителей: `{len(ai_moderator.violation_history)}`"
     
     await message.answer(text, parse_mode="Markdown")
@@ -60,9 +60,9 @@ async def handle_quick_questions(callback: types.CallbackQuery):
     }
     
     # Проверяем статус пользователя
-    from handlers.chat import active_chats, search_queue
-    user_data['in_chat'] = callback.from_user.id in active_chats
-    user_data['in_search'] = any(callback.from_user.id in queue for queue in search_queue.values())
+    from services.match_state import match_state
+    user_data['in_chat'] = await match_state.partner_of(callback.from_user.id) is not None
+    user_data['in_search'] = await match_state.is_searching(callback.from_user.id)
     
     questions = {
         'rating': 'Как работает система рейтингов?',
@@ -171,9 +171,9 @@ async def handle_direct_question(message: types.Message):
     }
     
     # Проверяем статус пользователя
-    from handlers.chat import active_chats, search_queue
-    user_data['in_chat'] = message.from_user.id in active_chats
-    user_data['in_search'] = any(message.from_user.id in queue for queue in search_queue.values())
+    from services.match_state import match_state
+    user_data['in_chat'] = await match_state.partner_of(message.from_user.id) is not None
+    user_data['in_search'] = await match_state.is_searching(message.from_user.id)
     
     dbg(f"Прямой вопрос к ассистенту: {question}", "AI_ASSISTANT")
     
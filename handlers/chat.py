@@ -1,13 +1,24 @@
 from aiogram import types, Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
 import asyncio
 import random
 import time
+from typing import Optional
 
 from database.models import User, Profile
 from services.smart_matching import smart_matcher
+from services.matchmaker import matchmaker
+from services.search_queue import SearchQueue
+from services.match_state import match_state
+from services.outbound import RELAY, NOTIFY, BROADCAST, outbound_priority
+from services.search_progress import search_progress
+from services.relay_pipeline import relay_pipelines
+from services.chat_session import ChatSession, chat_sessions
+from config import NEARBY_CITY_KM, RELAY_MODE
 from keyboards.profile import create_keyboard
 
 router = Router()
@@ -16,126 +27,179 @@ class ChatStates(StatesGroup):
     searching = State()
     chatting = State()
 
-# Активные чаты: {user_id: partner_id}
-active_chats = {}
-# Очередь поиска: {rating_tier: [user_ids]}
-search_queue = {"high": [], "medium": [], "low": []}
+# Очередь и активные чаты хранит match_state (общий для процессов при STATE_BACKEND=redis),
+# здесь - локальная копия очереди подборщика (уровни рейтинга, время постановки, индекс корзин)
+search_queue = SearchQueue()
 
-async def background_partner_search(user_id: int, user_profile: dict, user_tier: str, bot):
-    """Фоновый поиск партнеров каждые 3 секунды"""
-    for i in range(200):  # 10 минут максимум
-        await asyncio.sleep(3)
-        
-        # ИСПРАВЛЕНИЕ: Проверяем, не нашел ли уже партнера или не в очереди
-        if user_id in active_chats:
-            break
-            
-        user_in_queue = any(user_id in queue for queue in search_queue.values())
-        if not user_in_queue:
-            break
-            
-        # Ищем партнера с постепенным ослаблением правил
-        print(f"Background search for {user_id}, tier: {user_tier}, queue: {search_queue}")
-        # Определяем уровень ослабления правил на основе времени поиска
-        relaxed_level = min(i // 20, 4)  # Каждую минуту увеличиваем уровень ослабления (0-4)
-        partner_id = await find_compatible_partner(user_id, user_profile, user_tier, relaxed_level)
-        print(f"Found partner: {partner_id} (relaxed_level: {relaxed_level})")
-        
-        if partner_id:
-            # Убираем обоих из очереди
-            for tier_queue in search_queue.values():
-                if user_id in tier_queue:
-                    tier_queue.remove(user_id)
-                if partner_id in tier_queue:
-                    tier_queue.remove(partner_id)
-            
-            # Создаем чат
-            active_chats[user_id] = partner_id
-            active_chats[partner_id] = user_id
-            
-            kb = create_keyboard([
-                ("Завершить чат", "end_chat"),
-                ("Пожаловаться", "report_user")
-            ])
-            
+SEARCH_TIPS = [
+    "🤖 ИИ анализирует ваши интересы и личность для идеального подбора",
+    "🎯 Система учитывает совместимость личностей по описаниям",
+    "✨ Качество подбора улучшается с каждым вашим чатом",
+    "🔍 Подробно заполните профиль - это помогает ИИ найти вам лучших собеседников",
+    "💬 Общайтесь качественно - система запоминает успешные матчи",
+    "🔄 Постепенно расширяем критерии для поиска наиболее подходящих людей",
+    "⏰ Поиск идет, пока вы его не отмените: чем дольше ожидание, тем шире критерии подбора"
+]
+
+async def notify_match(user_entry: dict, partner_entry: dict, user_id: int, partner_id: int,
+                       score: float, reasons: list, relaxed_level: int):
+    """Уведомляет обоих пользователей о найденном собеседнике"""
+    kb = create_keyboard([
+        ("Завершить чат", "end_chat"),
+        ("Пожаловаться", "report_user")
+    ])
+    
+    match_info = ""
+    if relaxed_level > 0:
+        match_info = f"\n🔄 Подбор с расширенными критериями: {', '.join(reasons)}"
+    elif score > 0.7:
+        match_info = f"\n🎆 Отличная совместимость: {', '.join(reasons)}"
+    elif score > 0.5:
+        match_info = f"\n✨ Хорошая совместимость: {', '.join(reasons)}"
+    elif reasons:
+        match_info = f"\n🔍 Подбор по: {', '.join(reasons)}"
+    
+    # Ищущий из другого процесса приходит без бота и FSM: пишем ему через бота собеседника,
+    # а состояние чата выставит handle_search_message при первом сообщении
+    bot = user_entry.get('bot') or partner_entry.get('bot')
+    for uid, entry in ((user_id, user_entry), (partner_id, partner_entry)):
+        try:
+            # Переводим в состояние чата, иначе первое сообщение съест обработчик поиска
+            if entry.get('state'):
+                await entry['state'].set_state(ChatStates.chatting)
+            await bot.send_message(uid, f"**Собеседник найден**{match_info}\n\nМожете начинать общение.", reply_markup=kb, parse_mode="Markdown")
+        except Exception as e:
+            print(f"Error sending messages: {e}")
+
+def format_wait(seconds) -> str:
+    """Оценка ожидания для пользователя"""
+    if seconds is None:
+        return "оцениваем"
+    if seconds < 60:
+        return "меньше минуты"
+    if seconds >= 3600:
+        return "больше часа"
+    return f"около {round(seconds / 60)} мин"
+
+def approx_count(count: int) -> str:
+    """Число людей для сообщения о поиске: крупные округляются, чтобы текст не менялся на каждом обходе"""
+    if count < 20:
+        return str(count)
+    step = 10 ** max(len(str(count)) - 2, 1)
+    return f"~{(count + step // 2) // step * step}"
+
+async def search_stats() -> dict:
+    """Снимок очереди для одного обхода сообщений о прогрессе"""
+    return {
+        'total': await match_state.queue_size(),
+        'tiers': {tier: await match_state.tier_count(tier) for tier in ("high", "medium", "low")}
+    }
+
+def render_search_progress(entry: dict, stats: dict):
+    """Текст сообщения поиска; None, пока в нем нечего обновлять"""
+    relaxed_level = entry['relaxed_level']
+    minutes = int(time.time() - entry['enqueued_at']) // 60
+    # Первую минуту остается исходное сообщение с критериями подбора
+    if minutes == 0 and relaxed_level == 0:
+        return None
+    
+    progress_text = f"В очереди: {approx_count(stats['total'])} | Ваш уровень: {approx_count(stats['tiers'].get(entry['tier'], 0))} чел."
+    
+    relaxed_info = ""
+    if relaxed_level == 1:
+        relaxed_info = "\n🔄 Расширяем возрастные рамки (до 15 лет разницы)"
+    elif relaxed_level == 2:
+        relaxed_info = f"\n🔄 Расширяем возраст + соседние города (до {NEARBY_CITY_KM:.0f} км)"
+    elif relaxed_level == 3:
+        relaxed_info = "\n🔄 Расширяем возраст + любой город + цели знакомства"
+    elif relaxed_level >= 4:
+        relaxed_info = "\n🔄 Максимальное ослабление критериев (кроме пола/ориентации)"
+    
+    tip = SEARCH_TIPS[relaxed_level % len(SEARCH_TIPS)]
+    return f"**Поиск активен** `({minutes} мин)`\n\n{progress_text}{relaxed_info}\n\n{tip}"
+
+async def edit_search_progress(entry: dict, text: str):
+    kb = create_keyboard([("Отменить поиск", "cancel_search")])
+    await entry['message'].edit_text(text, reply_markup=kb, parse_mode="Markdown")
+
+matchmaker.setup(search_queue, match_state, on_match=notify_match)
+search_progress.setup(matchmaker.searchers, search_stats, render_search_progress, edit_search_progress)
+
+async def restore_sessions(bot, storage: BaseStorage):
+    """Возвращает очередь и чаты после перезапуска бота.
+
+    Состояние подбора загружается из журнала, FSM-состояния выставляются
+    заново, а ищущие возвращаются в подбор с уровнем ослабления по
+    исходному времени постановки. Уведомления о возобновлении уходят
+    фоновой задачей, чтобы бот не ждал их перед приемом апдейтов.
+    """
+    restored = await match_state.restore()
+    if restored is None:
+        return
+    queue, chats = restored
+
+    from services.cache import profile_cache
+    resumed = []
+    for user_id, (tier, enqueued_at) in queue.items():
+        profile = await profile_cache.get_profile(user_id)
+        if not profile:
+            await match_state.remove_searcher(user_id)
+            continue
+        state = FSMContext(storage, StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id))
+        await state.set_state(ChatStates.searching)
+        matchmaker.resume(user_id, profile, tier, enqueued_at, bot, None, state)
+        resumed.append(user_id)
+
+    for user_id in chats:
+        state = FSMContext(storage, StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id))
+        await state.set_state(ChatStates.chatting)
+    print(f"Resumed {len(resumed)} searches and {len(chats) // 2} chats")
+
+    task = asyncio.create_task(notify_restored(bot, resumed, list(chats)))
+    _restore_tasks.add(task)
+    task.add_done_callback(_restore_tasks.discard)
+
+# Фоновые рассылки уведомлений о возобновлении (ссылки, чтобы задачи не собрал GC)
+_restore_tasks = set()
+
+async def notify_restored(bot, searching: list, chatting: list):
+    """Сообщает пользователям, что поиск или чат продолжаются после перезапуска.
+
+    Собеседникам в чатах - уведомлениями, ищущим - с приоритетом
+    рассылки: это сообщение затем обновляется как прогресс поиска.
+    Кто успел найти собеседника или выйти из чата, уведомление не получает.
+    """
+    chat_kb = create_keyboard([
+        ("Завершить чат", "end_chat"),
+        ("Пожаловаться", "report_user")
+    ])
+    with outbound_priority(NOTIFY):
+        for user_id in chatting:
+            if await match_state.partner_of(user_id) is None:
+                continue
             try:
-                # Получаем информацию о качестве подбора
-                matches = await smart_matcher.find_best_matches(user_id, [partner_id], relaxed_level)
-                match_info = ""
-                if matches:
-                    score, reasons = matches[0][1], matches[0][2]
-                    if relaxed_level > 0:
-                        match_info = f"\n🔄 Подбор с расширенными критериями: {', '.join(reasons)}"
-                    elif score > 0.6:
-                        match_info = f"\n✨ Отличный подбор: {', '.join(reasons)}"
-                    elif reasons:
-                        match_info = f"\n🔍 Подбор по: {', '.join(reasons)}"
-                
-                # Отправляем уведомления обоим пользователям
-                await bot.send_message(user_id, f"**Собеседник найден**{match_info}\n\nМожете начинать общение.", reply_markup=kb, parse_mode="Markdown")
-                await bot.send_message(partner_id, f"**Собеседник найден**{match_info}\n\nМожете начинать общение.", reply_markup=kb, parse_mode="Markdown")
-                
-                # Устанавливаем состояние чата для обоих (нужно для FSM)
-                from aiogram.fsm.storage.memory import MemoryStorage
-                # Пока просто отмечаем в логах
-                print(f"Chat created: {user_id} <-> {partner_id}")
+                await bot.send_message(user_id, "**Чат продолжается**\n\nБот был перезапущен, собеседник на связи.", reply_markup=chat_kb, parse_mode="Markdown")
             except Exception as e:
-                print(f"Error sending messages: {e}")
-            break
+                print(f"Error resuming chat for {user_id}: {e}")
 
-async def update_search_progress_simple(user_id: int, message, user_tier: str):
-    """Упрощенное обновление прогресса поиска без AI-ассистента"""
-    for i in range(120):  # 10 минут максимум
-        await asyncio.sleep(5)
-        
-        # Проверяем, не найден ли партнер или пользователь не в очереди
-        if user_id in active_chats:
-            break
-            
-        user_in_queue = any(user_id in queue for queue in search_queue.values())
-        if not user_in_queue:
-            break
-            
-        total_in_queue = sum(len(queue) for queue in search_queue.values())
-        tier_count = len(search_queue[user_tier])
-        progress_text = f"В очереди: {total_in_queue} | Ваш уровень: {tier_count} чел."
-        
-        # Советы с информацией о новой ИИ-системе
-        tips = [
-            "🤖 ИИ анализирует ваши интересы и личность для идеального подбора",
-            "🎯 Система учитывает совместимость личностей по описаниям",
-            "✨ Качество подбора улучшается с каждым вашим чатом",
-            "🔍 Подробно заполните профиль - это помогает ИИ найти вам лучших собеседников",
-            "💬 Общайтесь качественно - система запоминает успешные матчи",
-            "🔄 Постепенно расширяем критерии для поиска наиболее подходящих людей",
-            "⏰ Максимальное время поиска - 10 минут, ИИ найдет кого-то подходящего!"
-        ]
-        
-        kb = create_keyboard([("Отменить поиск", "cancel_search")])
-        
-        # Показываем совет каждые 15 секунд и информацию об ослаблении правил
-        relaxed_level = min(i // 12, 4)  # Каждую минуту увеличиваем уровень
-        relaxed_info = ""
-        if relaxed_level == 1:
-            relaxed_info = "\n🔄 Расширяем возрастные рамки (до 15 лет разницы)"
-        elif relaxed_level == 2:
-            relaxed_info = "\n🔄 Расширяем возраст + разрешаем разные города"
-        elif relaxed_level == 3:
-            relaxed_info = "\n🔄 Расширяем возраст + город + цели знакомства"
-        elif relaxed_level >= 4:
-            relaxed_info = "\n🔄 Максимальное ослабление критериев (кроме пола/ориентации)"
-        
-        if i % 3 == 0 and i > 0:
-            tip = tips[(i // 3 - 1) % len(tips)]
-            try:
-                await message.edit_text(f"**Поиск активен** `({i*5+5}с)`\n\n{progress_text}{relaxed_info}\n\n{tip}", reply_markup=kb, parse_mode="Markdown")
-            except:
-                pass
-        else:
+    search_kb = create_keyboard([("Отменить поиск", "cancel_search")])
+    with outbound_priority(BROADCAST):
+        for user_id in searching:
+            entry = matchmaker.searchers.get(user_id)
+            if entry is None:
+                continue
+            minutes = int(time.time() - entry['enqueued_at']) // 60
             try:
-                await message.edit_text(f"**Поиск активен** `({i*5+5}с)`\n\n{progress_text}{relaxed_info}", reply_markup=kb, parse_mode="Markdown")
-            except:
-                break
+                search_msg = await bot.send_message(
+                    user_id, f"**Поиск возобновлен** `({minutes} мин)`\n\nБот был перезапущен, ваше место в очереди сохранено.",
+                    reply_markup=search_kb, parse_mode="Markdown"
+                )
+            except Exception as e:
+                print(f"Error resuming search for {user_id}: {e}")
+                continue
+            # Пока шла рассылка, собеседник мог найтись
+            if matchmaker.searchers.get(user_id) is entry:
+                entry['message'] = search_msg
 
 def get_rating_tier(rating: int) -> str:
     if rating >= 700:
@@ -145,34 +209,6 @@ def get_rating_tier(rating: int) -> str:
     else:
         return "low"
 
-def get_search_tiers(user_tier: str) -> list:
-    # Для тестирования - разрешаем всем искать друг друга
-    return ["high", "medium", "low"]
-
-async def find_compatible_partner(user_id: int, user_profile: dict, user_tier: str, relaxed_level: int = 0):
-    search_tiers = get_search_tiers(user_tier)
-    candidates = []
-    
-    for tier in search_tiers:
-        if tier in search_queue:
-            candidates.extend(search_queue[tier])
-    
-    if not candidates:
-        return None
-    
-    # Используем новую интеллектуальную систему подбора
-    matches = await smart_matcher.find_best_matches(user_id, candidates, relaxed_level)
-    
-    if not matches:
-        print(f"No AI matches found for {user_profile['first_name']} (relaxed_level: {relaxed_level})")
-        return None
-    
-    best_match = matches[0]
-    best_match_id, score, reasons = best_match
-    
-    print(f"AI match for {user_profile['first_name']}: score {score:.2f}, reasons: {', '.join(reasons)}")
-    return best_match_id
-
 @router.message(F.text == "Найти собеседника")
 async def start_search(message: types.Message, state: FSMContext):
     user = await User.filter(tg_id=message.from_user.id).first()
@@ -186,7 +222,7 @@ async def start_search(message: types.Message, state: FSMContext):
         return
     
     # Проверяем, не в чате ли уже
-    if message.from_user.id in active_chats:
+    if await match_state.partner_of(message.from_user.id) is not None:
         await message.answer("Вы уже в чате! Завершите текущий разговор.")
         return
     
@@ -198,86 +234,44 @@ async def start_search(message: types.Message, state: FSMContext):
         await message.answer("Завершите заполнение профиля")
         return
     
+    # Уже в поиске - не запускаем второй
+    if matchmaker.is_searching(message.from_user.id) or await match_state.is_searching(message.from_user.id):
+        await message.answer("Поиск уже идет, ожидайте.")
+        return
+    
     # Показываем прогресс поиска
-    total_in_queue = sum(len(queue) for queue in search_queue.values())
-    tier_count = len(search_queue[user_tier])
+    total_in_queue = await match_state.queue_size()
+    tier_count = await match_state.tier_count(user_tier)
     
-    # Ищем партнера
-    print(f"Initial search for {message.from_user.id}, tier: {user_tier}, queue: {search_queue}")
-    partner_id = await find_compatible_partner(message.from_user.id, user_profile, user_tier, 0)
-    print(f"Initial found partner: {partner_id}")
+    # Показываем критерии подбора
+    search_criteria = f"🎯 **Критерии подбора:**\n"
+    search_criteria += f"• Город: {user_profile.get('city', 'Не указан')}\n"
+    search_criteria += f"• Цель: {user_profile.get('dating_goal', 'Не указана')}\n"
+    search_criteria += f"• Возраст: {user_profile.get('age', 'Не указан')} лет\n"
+    search_criteria += f"• Пол/ориентация: {user_profile.get('gender', 'Не указан')}/{user_profile.get('orientation', 'Не указана')}\n\n"
     
-    if partner_id:
-        # Создаем чат сначала
-        active_chats[message.from_user.id] = partner_id
-        active_chats[partner_id] = message.from_user.id
-        print(f"Chat created between {message.from_user.id} and {partner_id}")
-        
-        # Теперь убираем обоих из очереди
-        for tier_queue in search_queue.values():
-            if message.from_user.id in tier_queue:
-                tier_queue.remove(message.from_user.id)
-            if partner_id in tier_queue:
-                tier_queue.remove(partner_id)
-        
-        kb = create_keyboard([
-            ("Завершить чат", "end_chat"),
-            ("Пожаловаться", "report_user")
-        ])
-        
-        # Получаем информацию о качестве подбора
-        matches = await smart_matcher.find_best_matches(message.from_user.id, [partner_id], 0)
-        match_info = ""
-        if matches:
-            score, reasons = matches[0][1], matches[0][2]
-            if score > 0.7:
-                match_info = f"\n🎆 Отличная совместимость: {', '.join(reasons)}"
-            elif score > 0.5:
-                match_info = f"\n✨ Хорошая совместимость: {', '.join(reasons)}"
-            elif reasons:
-                match_info = f"\n🔍 Подбор по: {', '.join(reasons)}"
-        
-        await message.answer(f"**Собеседник найден**{match_info}\n\nМожете начинать общение.", reply_markup=kb, parse_mode="Markdown")
-        await message.bot.send_message(partner_id, f"**Собеседник найден**{match_info}\n\nМожете начинать общение.", reply_markup=kb, parse_mode="Markdown")
-        
-        await state.set_state(ChatStates.chatting)
-        print(f"Set chatting state for {message.from_user.id}")
-    else:
-        # Добавляем в очередь поиска
-        if message.from_user.id not in search_queue[user_tier]:
-            search_queue[user_tier].append(message.from_user.id)
-            print(f"Added {message.from_user.id} to queue {user_tier}. Queue now: {search_queue}")
-        
-        # Запускаем фоновый поиск партнеров
-        asyncio.create_task(background_partner_search(message.from_user.id, user_profile, user_tier, message.bot))
-        
-        # Показываем критерии подбора
-        search_criteria = f"🎯 **Критерии подбора:**\n"
-        search_criteria += f"• Город: {user_profile.get('city', 'Не указан')}\n"
-        search_criteria += f"• Цель: {user_profile.get('dating_goal', 'Не указана')}\n"
-        search_criteria += f"• Возраст: {user_profile.get('age', 'Не указан')} лет\n"
-        search_criteria += f"• Пол/ориентация: {user_profile.get('gender', 'Не указан')}/{user_profile.get('orientation', 'Не указана')}\n\n"
-        
-        kb = create_keyboard([("Отменить поиск", "cancel_search")])
-        search_msg = await message.answer(f"**Поиск собеседника**\n\n{search_criteria}Пожалуйста, ожидайте...", reply_markup=kb, parse_mode="Markdown")
-        
-        # Показываем прогресс в callback
-        progress_text = f"В очереди: {total_in_queue + 1} | Ваш уровень: {tier_count + 1} чел.\nОжидание: до 10 минут"
-        try:
-            await search_msg.edit_text(f"**Поиск активен**\n\n{search_criteria}{progress_text}", reply_markup=kb, parse_mode="Markdown")
-        except:
-            pass
-        
-        await state.set_state(ChatStates.searching)
-        
-        # Запускаем периодическое обновление прогресса (без AI-ассистента)
-        asyncio.create_task(update_search_progress_simple(message.from_user.id, search_msg, user_tier))
+    kb = create_keyboard([("Отменить поиск", "cancel_search")])
+    # Оценка по недавним входам и парам совместимых с пользователем корзин
+    wait_text = format_wait(matchmaker.estimate_wait(user_profile, message.from_user.id))
+    progress_text = f"В очереди: {total_in_queue + 1} | Ваш уровень: {tier_count + 1} чел.\nОжидание: {wait_text}"
+    search_msg = await message.answer(f"**Поиск активен**\n\n{search_criteria}{progress_text}", reply_markup=kb, parse_mode="Markdown")
+    
+    await state.set_state(ChatStates.searching)
+    
+    # Подбор ведет общий актор: сначала сравнивает новичка с очередью,
+    # затем пересматривает его по мере ослабления критериев
+    if not await matchmaker.enqueue(message.from_user.id, user_profile, user_tier, message.bot, search_msg, state):
+        # Успел встать в очередь или попасть в чат через другой процесс
+        await search_msg.edit_text("Поиск уже идет, ожидайте.")
+        return
+    print(f"Added {message.from_user.id} to queue {user_tier}")
 
 @router.callback_query(F.data == "cancel_search")
 async def cancel_search(callback: types.CallbackQuery, state: FSMContext):
-    for tier_queue in search_queue.values():
-        if callback.from_user.id in tier_queue:
-            tier_queue.remove(callback.from_user.id)
+    # dequeue дожидается подбора, если чат с пользователем создается прямо сейчас
+    if not await matchmaker.dequeue(callback.from_user.id) and await match_state.partner_of(callback.from_user.id) is not None:
+        await callback.answer("Собеседник уже найден")
+        return
     
     await callback.message.edit_text("**Поиск отменен**", parse_mode="Markdown")
     await state.clear()
@@ -290,65 +284,28 @@ async def relaxed_search(callback: types.CallbackQuery):
         await callback.answer("Ошибка авторизации")
         return
     
-    from services.cache import profile_cache
-    user_profile = await profile_cache.get_profile(user_id)
-    user_tier = get_rating_tier((await User.filter(tg_id=user_id).first()).raiting)
-    
-    # Поиск в расслабленном режиме (максимальное ослабление)
-    partner_id = await find_compatible_partner(user_id, user_profile, user_tier, 4)
+    # Пары создает только подборщик: поднимаем уровень ослабления до максимального,
+    # а найденного собеседника он пришлет обоим как обычно
+    if await matchmaker.relax(user_id):
+        await callback.answer("Ищем по расширенным критериям")
+        return
     
-    if partner_id:
-        # Создаем чат
-        active_chats[user_id] = partner_id
-        active_chats[partner_id] = user_id
-        
-        # Убираем из очереди
-        for tier_queue in search_queue.values():
-            if user_id in tier_queue:
-                tier_queue.remove(user_id)
-            if partner_id in tier_queue:
-                tier_queue.remove(partner_id)
-        
-        kb = create_keyboard([
-            ("Завершить чат", "end_chat"),
-            ("Пожаловаться", "report_user")
-        ])
-        
-        await callback.message.edit_text(
-            "**🎉 Собеседник найден!**\n\n"
-            "💡 Подбор по расширенным критериям\n"
-            "Можете начинать общение!",
-            reply_markup=kb,
-            parse_mode="Markdown"
-        )
-        
-        await callback.bot.send_message(
-            partner_id,
-            "**🎉 Собеседник найден!**\n\n"
-            "💡 Подбор по расширенным критериям\n"
-            "Можете начинать общение!",
-            reply_markup=kb,
-            parse_mode="Markdown"
-        )
-    else:
-        await callback.message.edit_text(
-            "**😔 К сожалению, никого не нашлось**\n\n"
-            "Попробуйте позже или обновите свой профиль.",
-            parse_mode="Markdown"
-        )
+    await callback.message.edit_text(
+        "**😔 Поиск уже завершен**\n\n"
+        "Начните новый поиск, чтобы найти собеседника.",
+        parse_mode="Markdown"
+    )
     
     await callback.answer()
 
 @router.callback_query(F.data == "end_chat")
 async def end_chat(callback: types.CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
-    partner_id = active_chats.get(user_id)
+    # Завершаем чат для обоих
+    partner_id, session = await chat_sessions.finish(user_id)
     
     if partner_id:
-        # Завершаем чат для обоих
-        del active_chats[user_id]
-        del active_chats[partner_id]
-        
+        await smart_matcher.record_chat_end(user_id, partner_id, session)
         await callback.message.edit_text("**Чат завершен**\n\nСпасибо за общение.", parse_mode="Markdown")
         await callback.bot.send_message(partner_id, "**Чат завершен**\n\nСпасибо за общение.", parse_mode="Markdown")
     
@@ -359,7 +316,8 @@ async def report_user(callback: types.CallbackQuery):
     try:
         print(f"Report button clicked by {callback.from_user.id}")
         user_id = callback.from_user.id
-        partner_id = active_chats.get(user_id)
+        session = await chat_sessions.resolve(user_id)
+        partner_id = session.partner(user_id) if session else None
         
         print(f"Reporter: {user_id}, Reported: {partner_id}")
         
@@ -367,6 +325,10 @@ async def report_user(callback: types.CallbackQuery):
             await callback.answer("Нет активного чата")
             return
         
+        session.note_report(user_id)
+        # Больше не подбираем их друг другу
+        await smart_matcher.blocklist.block(user_id, partner_id, reason="report")
+        
         if partner_id:
             # Получаем информацию о пользователях
             reporter_user = await User.filter(tg_id=user_id).first()
@@ -376,8 +338,7 @@ async def report_user(callback: types.CallbackQuery):
             reported_profile = await Profile.filter(user=reported_user).first()
         
             # Получаем реальный лог переписки
-            from bot import chat_logger
-            chat_log = chat_logger.get_chat_log(user_id, partner_id)
+            chat_log = session.transcript()
             print(f"Chat log for report: {len(chat_log)} messages")
         
             # AI-анализ обоснованности жалобы
@@ -506,13 +467,12 @@ async def report_user(callback: types.CallbackQuery):
 async def handle_search_message(message: types.Message, state: FSMContext):
     """Обработка сообщений во время поиска - простые ответы"""
     # Проверяем, не найден ли уже партнер
-    if message.from_user.id in active_chats:
+    if await match_state.partner_of(message.from_user.id) is not None:
         await state.set_state(ChatStates.chatting)
         return
     
     # Проверяем, что пользователь все еще в очереди поиска
-    user_in_queue = any(message.from_user.id in queue for queue in search_queue.values())
-    if not user_in_queue:
+    if not await match_state.is_searching(message.from_user.id):
         await state.clear()
         return
     
@@ -520,7 +480,7 @@ async def handle_search_message(message: types.Message, state: FSMContext):
     text_lower = message.text.lower() if message.text else ""
     
     if any(word in text_lower for word in ['сколько', 'долго', 'время']):
-        response = "⏱️ Поиск до 10 минут. ИИ анализирует совместимость по многим параметрам для идеального подбора!"
+        response = "⏱️ Поиск продолжается, пока вы его не отмените. Если подходящих собеседников мало, критерии постепенно расширяются."
     elif any(word in text_lower for word in ['как', 'работает', 'алгоритм', 'ии']):
         response = "🤖 ИИ анализирует: возраст, город, цели, интересы, личность по описанию. Система учится на ваших успешных чатах!"
     elif any(word in text_lower for word in ['отменить', 'стоп', 'хватит']):
@@ -534,41 +494,38 @@ async def handle_search_message(message: types.Message, state: FSMContext):
             "🎯 Анализируем интересы и совместимость...",
             "💫 ИИ найдет вам идеального собеседника!"
         ]
-        import random
         response = random.choice(responses)
     
     kb = create_keyboard([("Отменить поиск", "cancel_search")])
     await message.answer(response, reply_markup=kb)
 
+async def in_active_chat(message: types.Message, relay_resolved: bool = False,
+                         relay_session: Optional[ChatSession] = None):
+    """Фильтр: пользователь в чате; id собеседника и ChatSession чата передаются
+    обработчику и middleware (chat_session в data). Сессию, уже найденную
+    RelayOrderMiddleware, повторно не ищет"""
+    session = relay_session if relay_resolved else await chat_sessions.resolve(message.from_user.id)
+    if session is None:
+        return False
+    return {'partner_id': session.partner(message.from_user.id), 'chat_session': session}
+
 # Универсальный обработчик для всех сообщений в активных чатах
-@router.message(lambda message: message.from_user.id in active_chats)
-async def handle_chat_message(message: types.Message, state: FSMContext):
+@router.message(in_active_chat)
+async def handle_chat_message(message: types.Message, state: FSMContext, partner_id: int):
     user_id = message.from_user.id
-    partner_id = active_chats.get(user_id)
     
-    print(f"Chat message from {user_id}, partner: {partner_id}, active_chats: {active_chats}")
+    print(f"Chat message from {user_id}, partner: {partner_id}")
     
     if not partner_id:
         await message.answer("Чат не активен.")
         await state.clear()
         return
     
-    # Принудительно логируем сообщение
-    from bot import chat_logger
-    if message.text:
-        chat_logger.chat_logs.setdefault(chat_logger._get_chat_key(user_id, partner_id), []).append({
-            'user_id': user_id,
-            'message': message.text,
-            'timestamp': time.time(),
-            'type': 'text'
-        })
-        print(f"Force logged message from {user_id}: {message.text[:30]}...")
-    
     # Добавляем ID партнера в контекст для middleware через data
     # Не можем изменять замороженный объект Message - используем только data
     
     # Проверяем возможность деанона и 18+ чата (пока отключено)
-    # conversation_stats = data.get('conversation_stats', {})
+    # conversation_stats = chat_session.stats()
     conversation_stats = {}
     
     if conversation_stats.get('can_deanon'):
@@ -585,40 +542,80 @@ async def handle_chat_message(message: types.Message, state: FSMContext):
         ])
         await message.bot.send_message(user_id, "🔞 Доступен 18+ режим общения!", reply_markup=kb)
     
-    # Пересылаем сообщение партнеру
+    # Пересылка идет через очередь собеседника: по порядку и не задерживая обработчик
+    if not relay_pipelines.submit(message, partner_id):
+        await message.answer("⏳ Собеседник еще не получил предыдущие сообщения, подождите немного.")
+
+async def deliver_message(message: types.Message, partner_id: int):
+    """Отправка одного сообщения из очереди пересылки; об ошибках узнает отправитель"""
+    # Чат могли завершить, пока сообщение ждало в очереди
+    session = chat_sessions.get(message.from_user.id)
+    if session is None or session.partner(message.from_user.id) != partner_id:
+        return
     try:
-        if message.text:
-            await message.bot.send_message(partner_id, message.text)
-        elif message.photo:
-            await message.bot.send_photo(partner_id, message.photo[-1].file_id, caption=message.caption or "📷 Фото")
-        elif message.video:
-            await message.bot.send_video(partner_id, message.video.file_id, caption=message.caption or "🎥 Видео")
-        elif message.voice:
-            await message.bot.send_voice(partner_id, message.voice.file_id)
-        elif message.video_note:
-            await message.bot.send_video_note(partner_id, message.video_note.file_id)
-        elif message.audio:
-            await message.bot.send_audio(partner_id, message.audio.file_id, caption=message.caption or "🎵 Аудио")
-        elif message.document:
-            await message.bot.send_document(partner_id, message.document.file_id, caption=message.caption or "📄 Документ")
-        elif message.sticker:
-            await message.bot.send_sticker(partner_id, message.sticker.file_id)
-        elif message.animation:
-            await message.bot.send_animation(partner_id, message.animation.file_id, caption=message.caption or "🎬 GIF")
-        elif message.location:
-            await message.bot.send_location(partner_id, message.location.latitude, message.location.longitude)
-        elif message.contact:
-            await message.bot.send_contact(partner_id, message.contact.phone_number, message.contact.first_name, message.contact.last_name)
-        else:
+        # У пересылки старший класс в планировщике исходящих запросов
+        with outbound_priority(RELAY):
+            relayed = await relay_message(message, partner_id)
+        if not relayed:
             await message.answer("Этот тип сообщения не поддерживается")
     except Exception as e:
         print(f"Error sending message: {e}")
         await message.answer("Ошибка отправки сообщения.")
 
+relay_pipelines.setup(deliver_message)
+
+async def relay_message(message: types.Message, partner_id: int) -> bool:
+    """Пересылает сообщение собеседнику; False - тип сообщения не поддерживается.
+
+    copyMessage копирует любое содержимое одним вызовом, с исходной
+    подписью и форматированием и без пометки "переслано". Чего он не
+    умеет (служебные сообщения, викторины с неизвестным боту ответом и
+    т.п.), отправляется прежним путем по типу содержимого.
+    """
+    if RELAY_MODE == 'copy':
+        try:
+            await message.copy_to(partner_id)
+            return True
+        except TelegramBadRequest as e:
+            print(f"copy_message failed for {message.content_type}: {e}")
+    return await relay_by_type(message, partner_id)
+
+async def relay_by_type(message: types.Message, partner_id: int) -> bool:
+    """Отправка отдельным методом Bot API для каждого типа содержимого"""
+    bot = message.bot
+    caption, caption_entities = message.caption, message.caption_entities
+    if message.text:
+        await bot.send_message(partner_id, message.text, entities=message.entities)
+    elif message.photo:
+        await bot.send_photo(partner_id, message.photo[-1].file_id, caption=caption, caption_entities=caption_entities)
+    elif message.video:
+        await bot.send_video(partner_id, message.video.file_id, caption=caption, caption_entities=caption_entities)
+    elif message.voice:
+        await bot.send_voice(partner_id, message.voice.file_id, caption=caption, caption_entities=caption_entities)
+    elif message.video_note:
+        await bot.send_video_note(partner_id, message.video_note.file_id)
+    elif message.audio:
+        await bot.send_audio(partner_id, message.audio.file_id, caption=caption, caption_entities=caption_entities)
+    elif message.animation:
+        # У GIF заполнен и document, поэтому animation проверяется раньше
+        await bot.send_animation(partner_id, message.animation.file_id, caption=caption, caption_entities=caption_entities)
+    elif message.document:
+        await bot.send_document(partner_id, message.document.file_id, caption=caption, caption_entities=caption_entities)
+    elif message.sticker:
+        await bot.send_sticker(partner_id, message.sticker.file_id)
+    elif message.location:
+        await bot.send_location(partner_id, message.location.latitude, message.location.longitude)
+    elif message.contact:
+        await bot.send_contact(partner_id, message.contact.phone_number, message.contact.first_name, message.contact.last_name)
+    else:
+        return False
+    return True
+
 @router.callback_query(F.data == "offer_deanon")
 async def offer_deanon(callback: types.CallbackQuery):
     user_id = callback.from_user.id
-    partner_id = active_chats.get(user_id)
+    session = await chat_sessions.resolve(user_id)
+    partner_id = session.partner(user_id) if session else None
     
     if partner_id:
         kb = create_keyboard([
@@ -658,7 +655,8 @@ async def accept_deanon(callback: types.CallbackQuery):
 @router.callback_query(F.data == "decline_deanon")
 async def decline_deanon(callback: types.CallbackQuery):
     user_id = callback.from_user.id
-    partner_id = active_chats.get(user_id)
+    session = await chat_sessions.resolve(user_id)
+    partner_id = session.partner(user_id) if session else None
     
     if partner_id:
         await callback.bot.send_message(partner_id, "❌ Предложение деанона отклонено")
@@ -668,7 +666,8 @@ async def decline_deanon(callback: types.CallbackQuery):
 @router.callback_query(F.data == "adult_mode")
 async def adult_mode(callback: types.CallbackQuery):
     user_id = callback.from_user.id
-    partner_id = active_chats.get(user_id)
+    session = await chat_sessions.resolve(user_id)
+    partner_id = session.partner(user_id) if session else None
     
     if partner_id:
         kb = create_keyboard([
@@ -688,6 +687,11 @@ async def accept_adult(callback: types.CallbackQuery):
     requester_id = int(callback.data.split("_")[2])
     accepter_id = callback.from_user.id
     
+    # Согласие обоих запоминается в сессии чата
+    session = await chat_sessions.resolve(accepter_id)
+    if session and session.partner(accepter_id) == requester_id:
+        session.adult_consent = [True, True]
+    
     # Уведомляем обоих пользователей
     await callback.bot.send_message(requester_id, "🔞 Режим 18+ активирован")
     await callback.bot.send_message(accepter_id, "🔞 Режим 18+ активирован")
@@ -697,7 +701,8 @@ async def accept_adult(callback: types.CallbackQuery):
 @router.callback_query(F.data == "decline_adult")
 async def decline_adult(callback: types.CallbackQuery):
     user_id = callback.from_user.id
-    partner_id = active_chats.get(user_id)
+    session = await chat_sessions.resolve(user_id)
+    partner_id = session.partner(user_id) if session else None
     
     if partner_id:
         await callback.bot.send_message(partner_id, "❌ Предложение 18+ отклонено")
@@ -3,6 +3,7 @@ from aiogram.types import LabeledPrice, PreCheckoutQuery
 from database.models import User, PremiumPurchase
 from keyboards.profile import create_keyboard
 from middlewares.notifications import notification_service
+from services.cache import profile_cache
 
 router = Router()
 
@@ -91,6 +92,8 @@ async def successful_payment(message: types.Message):
             
             # Выдаем Premium
             await User.filter(id=user.id).update(is_premium=True)
+            # Премиум дает приоритет в поиске - профиль из кэша устарел
+            profile_cache.invalidate(user_id)
             
             # Уведомляем пользователя
             await notification_service.notify_premium_granted(user_id)
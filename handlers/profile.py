@@ -5,6 +5,8 @@ from aiogram.fsm.state import State, StatesGroup
 
 from database.models import User, Profile
 from keyboards.profile import create_keyboard
+from services.cache import profile_cache
+from services.cities import city_registry
 
 router = Router()
 
@@ -120,13 +122,15 @@ async def process_edit(message: types.Message, state: FSMContext):
             return
         update_data["age"] = int(message.text)
     elif field == "city":
-        update_data["city"] = message.text
+        update_data["city"] = city_registry.canonical_name(message.text)
     elif field == "about":
         update_data["about"] = message.text
     elif field == "tags":
         update_data["tags"] = message.text
     
     await Profile.filter(id=profile.id).update(**update_data)
+    # Признаки для подбора пересоберутся при следующей загрузке профиля
+    profile_cache.invalidate(message.from_user.id)
     await message.answer("Сохранено!")
     await show_profile(message)
     await state.clear()
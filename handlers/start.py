@@ -13,6 +13,8 @@ from keyboards.registration import (
     photo_source_keyboard
 )
 from keyboards.main import main_keyboard
+from services.cache import profile_cache
+from services.cities import city_registry
 
 router = Router()
 
@@ -81,7 +83,8 @@ async def process_age(message: types.Message, state: FSMContext):
 @router.message(RegistrationStates.city)
 async def process_city(message: types.Message, state: FSMContext):
     if message.text != "Пропустить":
-        await state.update_data(city=message.text)
+        # "мск", "г. Москва" и т.п. сохраняем под названием из справочника
+        await state.update_data(city=city_registry.canonical_name(message.text))
     
     # Запрашиваем пол
     await message.answer("Укажите ваш пол:", reply_markup=gender_keyboard)
@@ -183,6 +186,7 @@ async def complete_registration(message: types.Message, state: FSMContext):
     else:
         # Создаем новый профиль
         await Profile.create(user=user, **data, profile_completed=True)
+    profile_cache.invalidate(message.from_user.id)
     
     # Завершаем регистрацию
     await message.answer(
@@ -218,29 +222,30 @@ async def cmd_find(message: types.Message, state: FSMContext):
 
 @router.message(Command("cancel"))
 async def cmd_cancel(message: types.Message, state: FSMContext):
-    from handlers.chat import active_chats, search_queue
+    from services.matchmaker import matchmaker
     
     user_id = message.from_user.id
     
-    # Убираем из очереди поиска
-    for tier_queue in search_queue.values():
-        if user_id in tier_queue:
-            tier_queue.remove(user_id)
-    
+    # Убираем из очереди поиска; если собеседник уже найден, чат не трогаем
+    if not await matchmaker.dequeue(user_id):
+        from services.match_state import match_state
+        if await match_state.partner_of(user_id) is not None:
+            await message.answer("Собеседник уже найден. Чтобы завершить чат, используйте /end")
+            return
+
     await state.clear()
     await message.answer("Поиск отменен")
 
 @router.message(Command("end"))
 async def cmd_end(message: types.Message, state: FSMContext):
-    from handlers.chat import active_chats
+    from services.chat_session import chat_sessions
     
     user_id = message.from_user.id
-    partner_id = active_chats.get(user_id)
+    partner_id, session = await chat_sessions.finish(user_id)
     
     if partner_id:
-        del active_chats[user_id]
-        del active_chats[partner_id]
-        
+        from services.smart_matching import smart_matcher
+        await smart_matcher.record_chat_end(user_id, partner_id, session)
         await message.answer("Чат завершен")
         await message.bot.send_message(partner_id, "Собеседник завершил чат")
     else:
@@ -250,12 +255,11 @@ async def cmd_end(message: types.Message, state: FSMContext):
 
 @router.message(Command("report"))
 async def cmd_report(message: types.Message):
-    from handlers.chat import active_chats
+    from services.chat_session import chat_sessions
     
     user_id = message.from_user.id
-    partner_id = active_chats.get(user_id)
     
-    if partner_id:
+    if await chat_sessions.resolve(user_id):
         await message.answer("Используйте кнопку 'Пожаловаться' в чате")
     else:
         await message.answer("Нет активного чата")
@@ -275,9 +279,9 @@ async def cmd_stats(message: types.Message):
     total_users = await User.all().count()
     active_users = await User.filter(is_active=True).count()
     
-    from handlers.chat import active_chats, search_queue
-    in_chat = len(active_chats) // 2
-    in_queue = sum(len(queue) for queue in search_queue.values())
+    from services.match_state import match_state
+    in_chat = await match_state.chat_count()
+    in_queue = await match_state.queue_size()
     
     stats_text = f"📊 **Ваша статистика:**\n\n"
     stats_text += f"🎆 Рейтинг: {user.raiting}\n"
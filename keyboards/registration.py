@@ -7,16 +7,22 @@ def create_keyboard(buttons, row_width=2):
         kb.append(row)
     return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
 
-gender_keyboard = create_keyboard(["Мужской", "Женский", "Другое"])
+GENDERS = ["Мужской", "Женский", "Другое"]
 
-orientation_keyboard = create_keyboard(["Гетеро", "Гомо", "Би", "Пан", "Другое"])
+ORIENTATIONS = ["Гетеро", "Гомо", "Би", "Пан", "Другое"]
 
-dating_goal_keyboard = create_keyboard([
+DATING_GOALS = [
     "Серьезные отношения", 
     "Дружба", 
     "Общение", 
     "Встречи"
-])
+]
+
+gender_keyboard = create_keyboard(GENDERS)
+
+orientation_keyboard = create_keyboard(ORIENTATIONS)
+
+dating_goal_keyboard = create_keyboard(DATING_GOALS)
 
 skip_keyboard = create_keyboard(["Пропустить"], row_width=1)
 
@@ -0,0 +1,36 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Message
+
+from services.chat_session import chat_sessions
+from services.relay_pipeline import relay_pipelines
+
+class RelayOrderMiddleware(BaseMiddleware):
+    """Отмечает сообщения из чата до остальных middleware, чтобы пересылка шла в порядке message_id.
+
+    Сессия ищется так же, как в фильтре in_active_chat (с восстановлением
+    чатов после перезапуска и из общего хранилища), и передается фильтру в
+    data (relay_resolved, relay_session), чтобы не искать ее второй раз.
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Message) or not event.from_user:
+            return await handler(event, data)
+        
+        session = await chat_sessions.resolve(event.from_user.id)
+        data['relay_resolved'] = True
+        data['relay_session'] = session
+        if session is None:
+            return await handler(event, data)
+        
+        partner_id = session.partner(event.from_user.id)
+        relay_pipelines.expect(event, partner_id)
+        try:
+            return await handler(event, data)
+        finally:
+            relay_pipelines.settle(event, partner_id)
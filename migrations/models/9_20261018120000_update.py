@@ -0,0 +1,31 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "chatoutcome" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "started_at" TIMESTAMP NOT NULL,
+    "duration_seconds" REAL NOT NULL,
+    "user_messages" INT NOT NULL  DEFAULT 0,
+    "partner_messages" INT NOT NULL  DEFAULT 0,
+    "end_reason" VARCHAR(16) NOT NULL,
+    "user_reported" INT NOT NULL  DEFAULT 0,
+    "partner_reported" INT NOT NULL  DEFAULT 0,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "partner_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE,
+    "user_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE
+);
+        CREATE TABLE IF NOT EXISTS "userpreference" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "weights" JSON NOT NULL,
+    "updates" INT NOT NULL  DEFAULT 0,
+    "updated_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "user_id" INT NOT NULL UNIQUE REFERENCES "user" ("id") ON DELETE CASCADE
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "chatoutcome";
+        DROP TABLE IF EXISTS "userpreference";"""
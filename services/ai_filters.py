@@ -1,6 +1,7 @@
 import asyncio
 from typing import List, Dict, Tuple, Optional, Any
 from utils.debug import dbg
+from keyboards.registration import GENDERS, ORIENTATIONS, DATING_GOALS
 
 # Попытка импорта g4f с обработкой ошибок
 try:
@@ -76,15 +77,65 @@ def is_dating_goal_compatible(user1_data: Dict, user2_data: Dict) -> bool:
     
     return goal2 in compatible_goals.get(goal1, [])
 
+# Значения закрытых словарей анкеты (keyboards/registration.py) в нормализованном
+# виде. Id 0 - пустое значение, последний id - любое значение не из словаря:
+# функции выше сравнивают значения только со словарем, поэтому все такие
+# значения ведут себя одинаково ('?' - их представитель)
+GENDER_VALUES = ('',) + tuple(value.lower() for value in GENDERS) + ('?',)
+ORIENTATION_VALUES = ('',) + tuple(value.lower() for value in ORIENTATIONS) + ('?',)
+GOAL_VALUES = ('',) + tuple(value.lower() for value in DATING_GOALS) + ('?',)
+COMPAT_KEYS = len(GENDER_VALUES) * len(ORIENTATION_VALUES) * len(GOAL_VALUES)
+
+_GENDER_IDS = {value: i for i, value in enumerate(GENDER_VALUES)}
+_ORIENTATION_IDS = {value: i for i, value in enumerate(ORIENTATION_VALUES)}
+_GOAL_IDS = {value: i for i, value in enumerate(GOAL_VALUES)}
+
+def _value_id(ids: Dict[str, int], value: Optional[str]) -> int:
+    return ids.get((value or '').strip().lower(), len(ids) - 1)
+
+def compat_id(profile: Dict) -> int:
+    """Id сочетания (пол, ориентация, цель) профиля в таблицах совместимости"""
+    gender = _value_id(_GENDER_IDS, profile.get('gender'))
+    orientation = _value_id(_ORIENTATION_IDS, profile.get('orientation'))
+    goal = _value_id(_GOAL_IDS, profile.get('dating_goal'))
+    return (gender * len(ORIENTATION_VALUES) + orientation) * len(GOAL_VALUES) + goal
+
+def _compatibility_rows() -> Tuple[Tuple[bytes, ...], Tuple[bytes, ...]]:
+    """Полные таблицы совместимости по id сочетаний, посчитанные функциями выше"""
+    profiles = [
+        {'gender': gender, 'orientation': orientation, 'dating_goal': goal}
+        for gender in GENDER_VALUES for orientation in ORIENTATION_VALUES for goal in GOAL_VALUES
+    ]
+    orientation_rows = []
+    strict_rows = []
+    for first in profiles:
+        orientation = [is_gender_orientation_compatible(first, second) for second in profiles]
+        orientation_rows.append(bytes(orientation))
+        strict_rows.append(bytes(
+            compatible and is_dating_goal_compatible(first, second)
+            for compatible, second in zip(orientation, profiles)
+        ))
+    return tuple(orientation_rows), tuple(strict_rows)
+
+# ORIENTATION_ROWS[id1][id2] - совместимость по полу и ориентации,
+# STRICT_ROWS[id1][id2] - то же плюс совместимость целей
+ORIENTATION_ROWS, STRICT_ROWS = _compatibility_rows()
+
 # Локальный алгоритм для расчета совместимости
 def calculate_local_compatibility(user1_data: Dict, user2_data: Dict) -> float:
     """Локальный алгоритм расчета совместимости без использования внешних API"""
+    # Признаки профилей строятся один раз и хранятся рядом с кэшем профилей
+    from services.cache import profile_cache
+    from services.profile_features import orientation_compatible, goal_compatible
+    user1 = profile_cache.features_for(user1_data)
+    user2 = profile_cache.features_for(user2_data)
+    
     # КРИТИЧЕСКАЯ ПРОВЕРКА: Совместимость по полу и ориентации
-    if not is_gender_orientation_compatible(user1_data, user2_data):
+    if not orientation_compatible(user1, user2):
         return 0.0  # Полная несовместимость
     
     # КРИТИЧЕСКАЯ ПРОВЕРКА: Совместимость целей знакомства
-    if not is_dating_goal_compatible(user1_data, user2_data):
+    if not goal_compatible(user1, user2):
         return 0.0  # Полная несовместимость
     
     score = 0.4  # Базовая оценка для совместимых пар
@@ -92,40 +143,32 @@ def calculate_local_compatibility(user1_data: Dict, user2_data: Dict) -> float:
     total_factors = 0
     
     # Проверка заполненности профилей
-    required_fields = ['first_name', 'age', 'city', 'about', 'tags', 'gender', 'orientation', 'dating_goal']
-    for field in required_fields:
-        if not user1_data.get(field) or not user2_data.get(field):
-            return 0.1  # Неполный профиль получает очень низкую оценку
+    if not user1.complete or not user2.complete:
+        return 0.1  # Неполный профиль получает очень низкую оценку
     
     # Совпадение по городу
-    if user1_data.get('city') and user2_data.get('city'):
-        total_factors += 1
-        if user1_data['city'].lower() == user2_data['city'].lower():
-            matches += 1
-            score += 0.1
+    total_factors += 1
+    if user1.city_id == user2.city_id:
+        matches += 1
+        score += 0.1
     
     # Близость по возрасту
-    if user1_data.get('age') and user2_data.get('age'):
-        total_factors += 1
-        age_diff = abs(int(user1_data['age']) - int(user2_data['age']))
-        if age_diff <= 5:
-            matches += 1
-            score += 0.1
-        elif age_diff <= 10:
-            matches += 0.5
-            score += 0.05
+    total_factors += 1
+    age_diff = abs(user1.age - user2.age)
+    if age_diff <= 5:
+        matches += 1
+        score += 0.1
+    elif age_diff <= 10:
+        matches += 0.5
+        score += 0.05
     
     # Совпадение интересов
-    if user1_data.get('tags') and user2_data.get('tags'):
-        total_factors += 1
-        user1_tags = [tag.strip().lower() for tag in user1_data['tags'].split(',')]
-        user2_tags = [tag.strip().lower() for tag in user2_data['tags'].split(',')]
-        
-        common_tags = set(user1_tags) & set(user2_tags)
-        if common_tags:
-            tag_score = min(len(common_tags) / max(len(user1_tags), len(user2_tags)), 1.0)
-            matches += tag_score
-            score += tag_score * 0.2
+    total_factors += 1
+    common_tags = (user1.tag_mask & user2.tag_mask).bit_count()
+    if common_tags:
+        tag_score = min(common_tags / max(user1.tag_list_len, user2.tag_list_len), 1.0)
+        matches += tag_score
+        score += tag_score * 0.2
     
     # Нормализация оценки
     if total_factors > 0:
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+
+from services.batch_scoring import batch_scorer
+from services.queue_index import CompatibilityIndex, GOAL_RELAXED_LEVEL
+from services.search_queue import head_start
+from services.smart_matching import smart_matcher
+
+# Пара из распределения: (user_id, partner_id, оценка, уровень ослабления пары)
+Assignment = Tuple[int, int, float, int]
+
+class BatchAssigner:
+    """Глобальное распределение пар по всей очереди поиска.
+
+    Вес ребра - оценка calculate_ai_compatibility плюс бонус за ожидание
+    (с форой за премиум и рейтинг) обоих участников. Точное паросочетание максимального веса (blossom)
+    на десятках тысяч вершин не укладывается в тик, поэтому используется
+    жадное паросочетание по глобально отсортированным ребрам (дает не менее
+    половины оптимального веса). Ребра строятся блоками: группа ищущих из
+    одной корзины x окно кандидатов из совместимых корзин, оценка блока - одна
+    матричная операция, от каждого ищущего остается несколько лучших ребер.
+    """
+
+    def __init__(self, wait_bonus: float = 0.02, candidate_cap: int = 512, block_size: int = 128,
+                 edges_per_user: int = 5, rounds: int = 3, threshold: float = 0.1):
+        self.wait_bonus = wait_bonus  # Бонус к весу за минуту ожидания каждого из пары
+        self.candidate_cap = candidate_cap  # Размер окна кандидатов для одного блока
+        self.block_size = block_size
+        self.edges_per_user = edges_per_user
+        # Повторные проходы по оставшимся без пары: их лучшие ребра могли
+        # вести к уже занятым кандидатам
+        self.rounds = rounds
+        self.threshold = threshold  # Тот же порог, что и в find_best_matches
+
+    async def assign(self, searchers: Dict[int, Dict], index: CompatibilityIndex, now: float = None) -> List[Assignment]:
+        """Распределяет пары среди ищущих; ничего не меняет в очереди"""
+        now = time.time() if now is None else now
+        user_ids = [user_id for user_id in index.user_keys if user_id in searchers]
+        if len(user_ids) < 2:
+            return []
+
+        entries = [searchers[user_id] for user_id in user_ids]
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        rows = batch_scorer.rows_for([entry['profile'] for entry in entries])
+        levels = np.array([entry['relaxed_level'] for entry in entries], dtype=np.int64)
+        # Ожидание с форой за премиум и уровень рейтинга, как в SearchQueue
+        waits = np.array([
+            (now - entry['enqueued_at'] + head_start(entry['tier'], entry.get('premium', False))) / 60
+            for entry in entries
+        ])
+        # Кандидатами, как и в find_best_matches, могут быть только заполненные профили
+        complete = np.array([bool(entry['profile'].get('profile_completed')) for entry in entries])
+
+        members = {
+            key: np.array([position[user_id] for user_id in bucket if user_id in position], dtype=np.intp)
+            for key, bucket in index.buckets.items()
+        }
+
+        matched = [False] * len(user_ids)
+        assignments = []
+        for _ in range(self.rounds):
+            edges = await self._collect_edges(members, index, rows, levels, waits, complete)
+            if edges is None:
+                break
+
+            found = 0
+            for user, partner, score in zip(*edges):
+                if matched[user] or matched[partner]:
+                    continue
+                user_id, partner_id = user_ids[user], user_ids[partner]
+                if smart_matcher.blocklist.excludes(user_id, partner_id):
+                    continue
+                matched[user] = matched[partner] = True
+                level = max(entries[user]['relaxed_level'], entries[partner]['relaxed_level'])
+                assignments.append((user_id, partner_id, score, level))
+                found += 1
+            if not found:
+                break
+
+            unmatched = ~np.array(matched)
+            members = {key: users[unmatched[users]] for key, users in members.items()}
+        return assignments
+
+    async def _collect_edges(self, members: Dict, index: CompatibilityIndex, rows: np.ndarray, levels: np.ndarray,
+                             waits: np.ndarray, complete: np.ndarray):
+        """Лучшие ребра каждого ищущего, отсортированные по убыванию веса"""
+        edge_scores, edge_weights, edge_users, edge_partners = [], [], [], []
+        for key, users in members.items():
+            if not len(users):
+                continue
+            pool = [members[other] for other in index.compatible_keys(key, GOAL_RELAXED_LEVEL) if other in members]
+            if not pool:
+                continue
+            pool = np.concatenate(pool)
+            pool = pool[complete[pool]]
+            if not len(pool):
+                continue
+
+            for block_no, start in enumerate(range(0, len(users), self.block_size)):
+                block = users[start:start + self.block_size]
+                # Каждый блок видит свое окно очереди, чтобы ищущие из одной
+                # корзины не конкурировали за одних и тех же кандидатов
+                if len(pool) > self.candidate_cap:
+                    offset = block_no * self.candidate_cap % len(pool)
+                    window = pool[(offset + np.arange(self.candidate_cap)) % len(pool)]
+                else:
+                    window = pool
+
+                pair_levels = np.maximum(levels[block][:, None], levels[window][None, :])
+                scores = batch_scorer.score_rows(rows[block][:, None], rows[window][None, :], pair_levels)
+                scores[block[:, None] == window[None, :]] = 0.0
+
+                k = min(self.edges_per_user, len(window))
+                best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(scores, best, axis=1)
+                keep = best_scores > self.threshold
+                users_idx = np.broadcast_to(block[:, None], best.shape)[keep]
+                partners_idx = window[best[keep]]
+                pair_scores = best_scores[keep]
+                weights = pair_scores + self.wait_bonus * (waits[users_idx] + waits[partners_idx])
+
+                edge_scores.append(pair_scores)
+                edge_weights.append(weights)
+                edge_users.append(users_idx)
+                edge_partners.append(partners_idx)
+                # Отдаем управление циклу событий между блоками
+                await asyncio.sleep(0)
+
+        if not edge_weights:
+            return None
+
+        order = np.argsort(-np.concatenate(edge_weights), kind='stable')
+        return (
+            np.concatenate(edge_users)[order].tolist(),
+            np.concatenate(edge_partners)[order].tolist(),
+            np.concatenate(edge_scores)[order].tolist()
+        )
@@ -0,0 +1,319 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from config import MATCHING_TAG_WORDS
+from services.cache import profile_cache
+from services.cities import city_registry
+from services.preferences import preference_model, AGE_CLOSE_SPAN, OLDER_SPAN, PREFERENCE_MIN, PREFERENCE_MAX
+from services.profile_features import ProfileFeatures, HIGH_VALUE_TAG_MASK
+from services.queue_index import bucket_compatibility, GOAL_RELAXED_LEVEL
+
+# Тональность описания: нет описания / позитивное / нейтральное или негативное
+TONE_NONE, TONE_POSITIVE, TONE_NEGATIVE = 0, 1, 2
+
+MAX_LEVEL = 4
+AGE_DIFF_CAP = 21  # Любая разница больше 20 лет дает одинаковые баллы
+NO_AGE = AGE_DIFF_CAP + 1  # Индекс для пар, где у кого-то не указан возраст
+# Отношение городов пары: разные / соседние / один город
+CITY_OTHER, CITY_NEAR, CITY_SAME = 0, 1, 2
+
+def _age_points(age_diff: int, level: int) -> float:
+    if age_diff <= 3:
+        return 0.25
+    if age_diff <= 7:
+        return 0.2
+    if age_diff <= 12:
+        return 0.15
+    if age_diff <= 15 and level >= 1:
+        return 0.1
+    if age_diff <= 20 and level >= 2:
+        return 0.05
+    if level >= 4:
+        return 0.02
+    return 0.0
+
+def _base_points_table() -> np.ndarray:
+    """Сумма дискретных слагаемых (цель + возраст + город) в том же порядке сложения,
+    что и в calculate_ai_compatibility: [уровень, цели совместимы, разница возрастов, отношение городов]"""
+    table = np.zeros((MAX_LEVEL + 1, 2, NO_AGE + 1, 3))
+    for level in range(MAX_LEVEL + 1):
+        for goal_compatible in (0, 1):
+            goal = 0.3 if goal_compatible else (0.1 if level >= GOAL_RELAXED_LEVEL else 0.0)
+            for age_index in range(NO_AGE + 1):
+                age = 0.0 if age_index == NO_AGE else _age_points(age_index, level)
+                for relation in (CITY_OTHER, CITY_NEAR, CITY_SAME):
+                    if relation == CITY_SAME:
+                        city = 0.2
+                    elif relation == CITY_NEAR and level >= 2:
+                        city = 0.1
+                    else:
+                        city = 0.05 if level >= 3 else 0.0
+                    table[level, goal_compatible, age_index, relation] = goal + age + city
+    return table.ravel()
+
+BASE_POINTS = _base_points_table()
+# Вклад тональности описаний: [тон пользователя * 3 + тон кандидата]
+DESCRIPTION_POINTS = (np.array([
+    [0.3, 0.3, 0.3],
+    [0.3, 0.7, 0.4],
+    [0.3, 0.4, 0.7]
+]) * 0.1).ravel()
+
+class BatchScorer:
+    """Векторная оценка совместимости одного пользователя с N кандидатами.
+
+    Признаки профилей (ProfileFeatures) раскладываются по колонкам (возраст,
+    id города, id корзины, тональность, битовые маски тегов), поэтому строка
+    профиля строится один раз, а оценка
+    пачки кандидатов - это несколько операций NumPy. Матрица тегов не шире
+    max_tag_words слов: словарь тегов растет с каждым новым введенным тегом,
+    и общие теги с id за ее пределами досчитываются по маскам профилей
+    только для пар, где такие теги есть у обоих (ценные теги получают
+    первые id и в матрицу помещаются всегда). Арифметика повторяет
+    SmartMatchingService.calculate_ai_compatibility шаг в шаг, так что
+    результаты совпадают со скалярной версией до бита. Изученные предпочтения
+    (PreferenceModel) обоих пользователей умножают оценку пары.
+    """
+
+    def __init__(self, capacity: int = 1024, max_tag_words: int = MATCHING_TAG_WORDS):
+        self.rows: Dict[int, int] = {}  # user_id -> номер строки
+        self.row_features: List[Optional[ProfileFeatures]] = []
+        self.free_rows: List[int] = []
+
+        self.age = np.zeros(capacity, dtype=np.int64)
+        self.has_age = np.zeros(capacity, dtype=bool)
+        self.city = np.zeros(capacity, dtype=np.int32)
+        self.key = np.zeros(capacity, dtype=np.int32)
+        self.tone = np.zeros(capacity, dtype=np.int8)
+        self.has_tags = np.zeros(capacity, dtype=bool)
+        self.tag_count = np.zeros(capacity, dtype=np.int32)
+        self.tags = np.zeros((capacity, 1), dtype=np.uint64)
+        self.tag_overflow = np.zeros(capacity, dtype=bool)  # У профиля есть теги за пределами матрицы
+        self.max_tag_words = max(max_tag_words, (HIGH_VALUE_TAG_MASK.bit_length() + 63) // 64)
+        self._tag_cap_reported = False
+        self.pref = np.zeros(capacity, dtype=np.intp)  # Строка весов в preference_model.weights
+        self._ensure_tag_words(HIGH_VALUE_TAG_MASK)
+        self.high_value_mask = self._mask_words(HIGH_VALUE_TAG_MASK, self.tags.shape[1])
+
+        # Матрицы совместимости корзин, перестраиваются при появлении новых корзин
+        self._compat: Tuple[np.ndarray, np.ndarray] = (np.zeros((0, 0), dtype=bool), np.zeros((0, 0), dtype=bool))
+        self._compat_size = 0
+        # Соседство городов справочника; все id вне справочника сводятся к последней строке
+        known = city_registry.known
+        self.near = np.zeros((known + 1, known + 1), dtype=bool)
+        for city_id in range(known):
+            self.near[city_id, city_registry.neighbours(city_id)] = True
+        preference_model.listeners.append(self._on_preference_row)
+
+    def _grow(self, capacity: int):
+        for name in ('age', 'has_age', 'city', 'key', 'tone', 'has_tags', 'tag_count', 'tag_overflow', 'pref'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+        tags = np.zeros((capacity, self.tags.shape[1]), dtype=np.uint64)
+        tags[:len(self.tags)] = self.tags
+        self.tags = tags
+
+    def _ensure_tag_words(self, mask: int):
+        """Расширяет колонку тегов, чтобы в нее помещалась маска, но не больше max_tag_words"""
+        words = (mask.bit_length() + 63) // 64
+        if words > self.max_tag_words:
+            if not self._tag_cap_reported:
+                self._tag_cap_reported = True
+                print(f"Batch scorer: tag matrix capped at {self.max_tag_words * 64} tags, "
+                      f"rarer tags are compared by profile masks")
+            words = self.max_tag_words
+        if words > self.tags.shape[1]:
+            self.tags = np.pad(self.tags, ((0, 0), (0, words - self.tags.shape[1])))
+            self.high_value_mask = self._mask_words(HIGH_VALUE_TAG_MASK, words)
+
+    @staticmethod
+    def _mask_words(mask: int, words: int) -> np.ndarray:
+        """Маска тегов (int) в виде массива 64-битных слов"""
+        return np.frombuffer(mask.to_bytes(words * 8, 'little'), dtype='<u8').astype(np.uint64)
+
+    def _row(self, profile: Dict) -> int:
+        """Возвращает строку профиля, строя ее при первом обращении или смене профиля"""
+        features = profile_cache.features_for(profile)
+        row = self.rows.get(features.user_id)
+        if row is not None and self.row_features[row] is features:
+            return row
+
+        if row is None:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                row = len(self.row_features)
+                self.row_features.append(None)
+                if row >= len(self.age):
+                    self._grow(len(self.age) * 2)
+            self.rows[features.user_id] = row
+        self.row_features[row] = features
+
+        self.has_age[row] = bool(features.age)
+        self.age[row] = features.age
+        self.city[row] = features.city_id
+        self.key[row] = features.key_id
+        if not features.has_about:
+            self.tone[row] = TONE_NONE
+        else:
+            self.tone[row] = TONE_POSITIVE if features.tone_positive else TONE_NEGATIVE
+
+        self._ensure_tag_words(features.tag_mask)
+        self.has_tags[row] = bool(features.tag_mask)
+        words = self.tags.shape[1]
+        self.tags[row] = self._mask_words(features.tag_mask & ((1 << words * 64) - 1), words)
+        self.tag_overflow[row] = features.tag_mask >> words * 64 != 0
+        self.tag_count[row] = features.tag_count
+        self.pref[row] = preference_model.row(features.user_id)
+        return row
+
+    def _on_preference_row(self, user_id: int, preference_row: int):
+        row = self.rows.get(user_id)
+        if row is not None:
+            self.pref[row] = preference_row
+
+    def discard(self, user_id: int):
+        """Освобождает строку пользователя (например, при выходе из очереди)"""
+        row = self.rows.pop(user_id, None)
+        if row is not None:
+            self.row_features[row] = None
+            self.free_rows.append(row)
+
+    def _compat_matrices(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Матрицы совместимости корзин: [key_id, key_id] -> (по полу, по цели)"""
+        keys = bucket_compatibility.keys
+        if self._compat_size != len(keys):
+            relaxed = np.zeros((len(keys), len(keys)), dtype=bool)
+            strict = np.zeros((len(keys), len(keys)), dtype=bool)
+            for key_id, key in enumerate(keys):
+                relaxed[key_id] = [other in bucket_compatibility.compatible_relaxed[key] for other in keys]
+                strict[key_id] = [other in bucket_compatibility.compatible[key] for other in keys]
+            self._compat = (relaxed, strict)
+            self._compat_size = len(keys)
+        return self._compat
+
+    def rows_for(self, profiles: List[Dict]) -> np.ndarray:
+        """Номера строк для списка профилей"""
+        return np.fromiter((self._row(profile) for profile in profiles), dtype=np.intp, count=len(profiles))
+
+    def score_rows(self, users: np.ndarray, rows: np.ndarray, relaxed_level) -> np.ndarray:
+        """Оценки для пар строк users x rows (по правилам broadcasting NumPy).
+
+        relaxed_level - число или массив уровней той же формы, что и результат
+        """
+        level = np.minimum(np.asarray(relaxed_level), MAX_LEVEL)
+
+        # 1. Пол/ориентация и цели знакомства
+        orientation_ok, goal_ok = self._compat_matrices()
+        user_keys = self.key[users]
+        keys = self.key[rows]
+        goal_compatible = goal_ok[user_keys, keys]
+        valid = orientation_ok[user_keys, keys] & (goal_compatible | (level >= GOAL_RELAXED_LEVEL))
+
+        # 2-3. Возраст и город: слагаемые дискретны, поэтому берутся из таблицы
+        age_index = np.minimum(np.abs(self.age[rows] - self.age[users]), AGE_DIFF_CAP)
+        age_index = np.where(self.has_age[users] & self.has_age[rows], age_index, NO_AGE)
+        user_cities = self.city[users]
+        cities = self.city[rows]
+        outside = len(self.near) - 1
+        near = self.near[np.minimum(user_cities, outside), np.minimum(cities, outside)]
+        relation = np.where(cities == user_cities, CITY_SAME, near.astype(np.int8))
+        index = ((level * 2 + goal_compatible) * (NO_AGE + 1) + age_index) * 3 + relation
+        scores = BASE_POINTS[index]
+
+        # 4. Общие интересы: коэффициент Жаккара + бонус за ценные интересы
+        common_bits = self.tags[rows] & self.tags[users]
+        common = np.bitwise_count(common_bits).sum(axis=-1, dtype=np.int64)
+        overflow = self.tag_overflow[users] & self.tag_overflow[rows]
+        if overflow.any():
+            common = common + self._overflow_common(users, rows, overflow)
+        total = self.tag_count[rows].astype(np.int64) + self.tag_count[users] - common
+        quality = np.bitwise_count(common_bits & self.high_value_mask).sum(axis=-1, dtype=np.int64)
+        interest = np.minimum(common / np.maximum(total, 1) + quality * 0.1, 1.0)
+        interest = np.where(self.has_tags[users] & self.has_tags[rows], interest, 0.0)
+        scores = scores + interest * 0.15
+
+        # 5. Тональность описаний
+        user_tones = self.tone[users]
+        tones = self.tone[rows]
+        scores = scores + DESCRIPTION_POINTS[user_tones * 3 + tones]
+        scores = np.minimum(scores, 1.0)
+
+        # 6. Изученные предпочтения обоих: множитель стороны без весов равен 1
+        if preference_model.rows:
+            user_prefs = self.pref[users]
+            prefs = self.pref[rows]
+            user_trained, trained = user_prefs.any(), prefs.any()
+            if user_trained or trained:
+                both_age = self.has_age[users] & self.has_age[rows]
+                age_diff = self.age[rows] - self.age[users]
+                same_city = (relation == CITY_SAME).astype(float)
+                age_close = np.where(both_age, 1.0 - np.minimum(np.abs(age_diff), AGE_CLOSE_SPAN) / AGE_CLOSE_SPAN, 0.0)
+                jaccard = np.where(self.has_tags[users] & self.has_tags[rows], common / np.maximum(total, 1), 0.0)
+                same_tone = ((user_tones == tones) & (tones != TONE_NONE)).astype(float)
+                user_side = candidate_side = 1.0
+                if user_trained:
+                    user_side = self._preference_multiplier(user_prefs, (
+                        same_city, age_close, np.where(both_age, np.clip(age_diff / OLDER_SPAN, -1.0, 1.0), 0.0),
+                        jaccard, same_tone, (tones != TONE_NONE).astype(float)
+                    ))
+                if trained:
+                    candidate_side = self._preference_multiplier(prefs, (
+                        same_city, age_close, np.where(both_age, np.clip(-age_diff / OLDER_SPAN, -1.0, 1.0), 0.0),
+                        jaccard, same_tone, (user_tones != TONE_NONE).astype(float)
+                    ))
+                scores = np.minimum(scores * user_side * candidate_side, 1.0)
+
+        return np.where(valid, scores, 0.0)
+
+    def _overflow_common(self, users: np.ndarray, rows: np.ndarray, overflow: np.ndarray) -> np.ndarray:
+        """Общие теги за пределами матрицы для пар, отмеченных в overflow"""
+        extra = np.zeros(overflow.shape, dtype=np.int64)
+        users, rows = np.broadcast_arrays(users, rows)
+        shift = self.tags.shape[1] * 64
+        for index in zip(*np.nonzero(overflow)):
+            user_mask = self.row_features[users[index]].tag_mask >> shift
+            extra[index] = (user_mask & self.row_features[rows[index]].tag_mask >> shift).bit_count()
+        return extra
+
+    @staticmethod
+    def _preference_multiplier(preference_rows: np.ndarray, features: Tuple[np.ndarray, ...]) -> np.ndarray:
+        """1 + w·x в пределах PREFERENCE_MIN..PREFERENCE_MAX, сложение в порядке PreferenceModel.multiplier"""
+        weights = preference_model.weights
+        dot = 0.0
+        for k, values in enumerate(features):
+            dot = dot + weights[preference_rows, k] * values
+        return np.clip(1.0 + dot, PREFERENCE_MIN, PREFERENCE_MAX)
+
+    def score(self, user_profile: Dict, candidate_profiles: List[Dict], relaxed_level: int = 0) -> np.ndarray:
+        """Оценки совместимости пользователя со всеми кандидатами"""
+        user = self._row(user_profile)
+        rows = self.rows_for(candidate_profiles)
+        if not len(rows):
+            return np.zeros(0)
+        return self.score_rows(user, rows, relaxed_level)
+
+    def top_k(self, user_profile: Dict, candidate_profiles: List[Dict], relaxed_level: int = 0,
+              k: int = 10, threshold: float = 0.1, bonus: Optional[np.ndarray] = None) -> List[Tuple[Dict, float]]:
+        """Лучшие k кандидатов выше порога в порядке убывания оценки.
+
+        bonus - добавка к оценке каждого кандидата только для ранжирования
+        (например, за ожидание); порог и возвращаемые оценки - без нее
+        """
+        scores = self.score(user_profile, candidate_profiles, relaxed_level)
+        if not len(scores):
+            return []
+        rank = scores if bonus is None else np.where(scores > threshold, scores + bonus, -np.inf)
+        # Стабильная сортировка сохраняет порядок кандидатов при равных оценках
+        order = np.argsort(-rank, kind='stable')
+        result = []
+        for i in order[:k]:
+            if scores[i] <= threshold:
+                break
+            result.append((candidate_profiles[i], float(scores[i])))
+        return result
+
+# Глобальный экземпляр
+batch_scorer = BatchScorer()
@@ -0,0 +1,96 @@
+from collections import deque
+from typing import Deque, Dict, Set
+
+from config import RECENT_PARTNERS
+
+class Blocklist:
+    """Кого не подбирать пользователю: черный список и недавние собеседники.
+
+    Черный список - множество на пользователя, хранится в БД (BlockedUser)
+    и действует в обе стороны: заблокированный тоже не получит того, кто
+    его заблокировал. Недавние собеседники - кольцевой буфер последних
+    recent_size партнеров в памяти, чтобы сразу после чата не попасть к
+    тому же человеку. Обе проверки в excludes() - O(1).
+    """
+
+    def __init__(self, recent_size: int = RECENT_PARTNERS):
+        self.recent_size = recent_size
+        self.blocked: Dict[int, Set[int]] = {}  # user_id -> кого заблокировал
+        self.blocked_by: Dict[int, Set[int]] = {}  # user_id -> кто заблокировал его
+        self.recent: Dict[int, Deque[int]] = {}  # user_id -> последние собеседники
+
+    def excludes(self, user_id: int, candidate_id: int) -> bool:
+        blocked = self.blocked.get(user_id)
+        if blocked and candidate_id in blocked:
+            return True
+        blocked_by = self.blocked_by.get(user_id)
+        if blocked_by and candidate_id in blocked_by:
+            return True
+        recent = self.recent.get(user_id)
+        return bool(recent) and candidate_id in recent
+
+    def is_blocked(self, user_id: int, blocked_user_id: int) -> bool:
+        return blocked_user_id in self.blocked.get(user_id, ())
+
+    def add(self, user_id: int, blocked_user_id: int) -> bool:
+        """Добавляет в черный список в памяти; False, если уже там"""
+        blocked = self.blocked.setdefault(user_id, set())
+        if blocked_user_id in blocked:
+            return False
+        blocked.add(blocked_user_id)
+        self.blocked_by.setdefault(blocked_user_id, set()).add(user_id)
+        return True
+
+    def discard(self, user_id: int, blocked_user_id: int) -> bool:
+        blocked = self.blocked.get(user_id)
+        if not blocked or blocked_user_id not in blocked:
+            return False
+        blocked.discard(blocked_user_id)
+        self.blocked_by[blocked_user_id].discard(user_id)
+        return True
+
+    async def block(self, user_id: int, blocked_user_id: int, reason: str = None):
+        """Добавляет в черный список и сохраняет в БД"""
+        if not self.add(user_id, blocked_user_id):
+            return
+        try:
+            from database.models import User, BlockedUser
+            users = {user.tg_id: user for user in await User.filter(tg_id__in=[user_id, blocked_user_id])}
+            if len(users) == 2:
+                await BlockedUser.get_or_create(user=users[user_id], blocked=users[blocked_user_id], defaults={'reason': reason})
+        except Exception as e:
+            print(f"Error saving block {user_id} -> {blocked_user_id}: {e}")
+
+    async def unblock(self, user_id: int, blocked_user_id: int):
+        if not self.discard(user_id, blocked_user_id):
+            return
+        try:
+            from database.models import BlockedUser
+            await BlockedUser.filter(user__tg_id=user_id, blocked__tg_id=blocked_user_id).delete()
+        except Exception as e:
+            print(f"Error removing block {user_id} -> {blocked_user_id}: {e}")
+
+    def remember_partner(self, user_id: int, partner_id: int):
+        """Запоминает собеседника обоим; самый старый вытесняется из буфера"""
+        for uid, other in ((user_id, partner_id), (partner_id, user_id)):
+            recent = self.recent.get(uid)
+            if recent is None:
+                recent = self.recent[uid] = deque(maxlen=self.recent_size)
+            if other in recent:
+                recent.remove(other)
+            recent.append(other)
+
+    async def load(self):
+        """Загружает черный список и недавних собеседников из БД"""
+        from database.models import BlockedUser, ChatOutcome
+        pairs = await BlockedUser.all().values_list('user__tg_id', 'blocked__tg_id')
+        for user_id, blocked_user_id in pairs:
+            self.add(user_id, blocked_user_id)
+        # Недавние собеседники - по последним итогам чатов, от старых к новым
+        outcomes = await ChatOutcome.all().order_by('-id').limit(10_000).values_list('user__tg_id', 'partner__tg_id')
+        for user_id, partner_id in reversed(outcomes):
+            self.remember_partner(user_id, partner_id)
+        print(f"Loaded {len(pairs)} blocks and {len(outcomes)} recent chats")
+
+# Глобальный экземпляр
+blocklist = Blocklist()
@@ -2,6 +2,8 @@ import asyncio
 from typing import List, Dict, Optional
 from database.models import User, Profile
 from services.cache import profile_cache
+from services.cities import city_registry
+from services.outbound import BROADCAST, outbound_priority
 
 class BroadcastService:
     def __init__(self):
@@ -19,12 +21,16 @@ class BroadcastService:
         return await self._send_broadcast(bot, users, message)
     
     async def send_to_city(self, bot, city: str, message: str) -> Dict:
+        # Сравниваем id городов из справочника, а не строки. Город не из
+        # справочника регистрируется так же, как при разборе профиля
+        city_id = city_registry.id(city)
+        
         users = await User.filter(is_active=True).all()
         city_users = []
         
         for user in users:
             profile = await profile_cache.get_profile(user.tg_id)
-            if profile and profile.get('city', '').lower() == city.lower():
+            if profile and profile_cache.features_for(profile).city_id == city_id:
                 city_users.append(user)
         
         return await self._send_broadcast(bot, city_users, message)
@@ -88,47 +94,48 @@ class BroadcastService:
         failed = 0
         errors = []
         
-        for user in users:
-            try:
-                if media:
-                    media_item = media[0]
-                    if media_item['type'] == 'photo':
-                        await bot.send_photo(
-                            user.tg_id, 
-                            media_item['file_id'], 
-                            caption=text, 
-                            reply_markup=reply_markup,
-                            parse_mode="Markdown"
-                        )
-                    elif media_item['type'] == 'video':
-                        await bot.send_video(
+        # Рассылка - младший класс планировщика исходящих запросов: темп задает он
+        with outbound_priority(BROADCAST):
+            for user in users:
+                try:
+                    if media:
+                        media_item = media[0]
+                        if media_item['type'] == 'photo':
+                            await bot.send_photo(
+                                user.tg_id, 
+                                media_item['file_id'], 
+                                caption=text, 
+                                reply_markup=reply_markup,
+                                parse_mode="Markdown"
+                            )
+                        elif media_item['type'] == 'video':
+                            await bot.send_video(
+                                user.tg_id, 
+                                media_item['file_id'], 
+                                caption=text, 
+                                reply_markup=reply_markup,
+                                parse_mode="Markdown"
+                            )
+                        elif media_item['type'] == 'document':
+                            await bot.send_document(
+                                user.tg_id, 
+                                media_item['file_id'], 
+                                caption=text, 
+                                reply_markup=reply_markup,
+                                parse_mode="Markdown"
+                            )
+                    else:
+                        await bot.send_message(
                             user.tg_id, 
-                            media_item['file_id'], 
-                            caption=text, 
+                            text, 
                             reply_markup=reply_markup,
                             parse_mode="Markdown"
                         )
-                    elif media_item['type'] == 'document':
-                        await bot.send_document(
-                            user.tg_id, 
-                            media_item['file_id'], 
-                            caption=text, 
-                            reply_markup=reply_markup,
-                            parse_mode="Markdown"
-                        )
-                else:
-                    await bot.send_message(
-                        user.tg_id, 
-                        text, 
-                        reply_markup=reply_markup,
-                        parse_mode="Markdown"
-                    )
                 
-                sent += 1
-                await asyncio.sleep(0.05)  # Защита от rate limit
-            except Exception as e:
-                failed += 1
-                errors.append(f"User {user.tg_id}: {str(e)}")
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    errors.append(f"User {user.tg_id}: {str(e)}")
         
         return {
             'total': len(users),
@@ -142,14 +149,15 @@ class BroadcastService:
         failed = 0
         errors = []
         
-        for user in users:
-            try:
-                await bot.send_message(user.tg_id, message, parse_mode="Markdown")
-                sent += 1
-                await asyncio.sleep(0.05)  # Защита от rate limit
-            except Exception as e:
-                failed += 1
-                errors.append(f"User {user.tg_id}: {str(e)}")
+        # Рассылка - младший класс планировщика исходящих запросов: темп задает он
+        with outbound_priority(BROADCAST):
+            for user in users:
+                try:
+                    await bot.send_message(user.tg_id, message, parse_mode="Markdown")
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    errors.append(f"User {user.tg_id}: {str(e)}")
         
         return {
             'total': len(users),
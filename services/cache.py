@@ -1,13 +1,27 @@
 import json
 import time
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple
 from database.models import User, Profile
+from services.profile_features import ProfileFeatures
 
 class ProfileCache:
-    def __init__(self, ttl: int = 300):  # 5 минут TTL
+    """Кэш профилей и их признаков для подбора.
+
+    Через ttl секунд профиль перечитывается из базы, но признаки и их
+    версия меняются, только если поля профиля изменились, - иначе
+    кэшированные объяснения пар с ним перестали бы находиться. Профили,
+    которые никто не запрашивал дольше retain секунд, удаляются целиком.
+    """
+
+    def __init__(self, ttl: int = 300, retain: int = 3600):  # 5 минут TTL, час хранения
         self.cache: Dict[int, Dict] = {}
+        self.features: Dict[int, ProfileFeatures] = {}  # Предрасчитанные признаки для подбора
+        # Признаки для словарей, которых уже нет в кэше: user_id -> (version словаря, признаки, время)
+        self.detached: Dict[int, Tuple[int, ProfileFeatures, float]] = {}
         self.timestamps: Dict[int, float] = {}
         self.ttl = ttl
+        self.retain = retain
+        self._next_cleanup = 0.0
     
     def _is_expired(self, user_id: int) -> bool:
         if user_id not in self.timestamps:
@@ -17,6 +31,9 @@ class ProfileCache:
     async def get_profile(self, user_id: int) -> Optional[Dict]:
         if user_id in self.cache and not self._is_expired(user_id):
             return self.cache[user_id]
+        # Не чаще раза в TTL убираем давно не запрашиваемое и признаки старых словарей
+        if time.time() >= self._next_cleanup:
+            self.clear_expired()
         
         # Загружаем из БД
         user = await User.filter(tg_id=user_id).first()
@@ -43,23 +60,84 @@ class ProfileCache:
             'profile_completed': profile.profile_completed
         }
         
-        self.cache[user_id] = profile_data
+        old_profile = self.cache.get(user_id)
+        features = self.features.get(user_id)
+        if old_profile is not None and features is not None and old_profile == dict(profile_data, version=features.version):
+            # Профиль не менялся: оставляем прежние словарь и признаки, чтобы
+            # не сбрасывать их версию и кэшированные объяснения пар
+            profile_data = old_profile
+        else:
+            if old_profile is not None and features is not None:
+                # Старый словарь может еще лежать в очереди поиска
+                self.detached[user_id] = (features.version, features, time.time())
+            features = self.features[user_id] = ProfileFeatures(profile_data)
+            profile_data['version'] = features.version
+            self.cache[user_id] = profile_data
         self.timestamps[user_id] = time.time()
         return profile_data
     
+    async def get_features(self, user_id: int) -> Optional[ProfileFeatures]:
+        profile = await self.get_profile(user_id)
+        if not profile:
+            return None
+        return self.features_for(profile)
+    
+    def features_for(self, profile: Dict) -> ProfileFeatures:
+        """Признаки для словаря профиля.
+
+        Словарь сверяется с закэшированным по полю version (версия его
+        признаков): у ожидающих в очереди остается словарь на момент
+        постановки, и после перезагрузки кэша признаки и их версия должны
+        остаться прежними. Признаки устаревшего словаря хранятся отдельно до
+        истечения TTL, чтобы не строить их заново. Словари без user_id или
+        version (собранные не get_profile) не кэшируются: признаки для них
+        строятся при каждом вызове.
+        """
+        user_id = profile.get('user_id')
+        version = profile.get('version')
+        features = self.features.get(user_id)
+        if features is not None and (features.version == version or self.cache.get(user_id) is profile):
+            return features
+        detached = self.detached.get(user_id)
+        if detached is not None and detached[0] == version:
+            return detached[1]
+        features = ProfileFeatures(profile)
+        if user_id is not None and version is not None:
+            self.detached[user_id] = (version, features, time.time())
+        return features
+    
     def invalidate(self, user_id: int):
         self.cache.pop(user_id, None)
+        self.features.pop(user_id, None)
+        self.detached.pop(user_id, None)
         self.timestamps.pop(user_id, None)
     
+    def clear(self):
+        self.cache.clear()
+        self.features.clear()
+        self.detached.clear()
+        self.timestamps.clear()
+    
     def clear_expired(self):
+        """Удаляет профили, не запрашиваемые дольше retain, и признаки старых словарей старше TTL.
+
+        Профиль, у которого истек только TTL, остается: при перезагрузке с
+        ним сверяются поля, чтобы не менять версию неизмененного профиля.
+        """
         current_time = time.time()
+        self._next_cleanup = current_time + self.ttl
         expired_keys = [
             user_id for user_id, timestamp in self.timestamps.items()
-            if current_time - timestamp > self.ttl
+            if current_time - timestamp > self.retain
         ]
         for key in expired_keys:
-            self.cache.pop(key, None)
-            self.timestamps.pop(key, None)
+            self.invalidate(key)
+        expired_detached = [
+            user_id for user_id, (_, _, timestamp) in self.detached.items()
+            if current_time - timestamp > self.ttl
+        ]
+        for key in expired_detached:
+            del self.detached[key]
 
 # Глобальный экземпляр кэша
 profile_cache = ProfileCache()
\ No newline at end of file
@@ -0,0 +1,204 @@
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from services.match_state import MatchStateBackend, match_state
+from services.relay_pipeline import relay_pipelines
+from config import CHAT_LOG_LIMIT, CHAT_LOG_MAX_ENTRIES, CHAT_LOG_IDLE_TTL
+
+# Типы сообщений в логе чата; в записи хранится индекс
+MESSAGE_TYPES = ('text', 'photo', 'video', 'voice', 'sticker', 'document')
+TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES)}
+# Более длинный текст попадает в лог обрезанным
+TRANSCRIPT_TEXT_LIMIT = 1000
+
+# Запись лога: (время, сторона отправителя 0/1, код типа, текст)
+TranscriptEntry = Tuple[float, int, int, str]
+
+class ChatSession:
+    """Состояние одного чата, общее для обоих собеседников.
+
+    Одна запись на чат вместо отдельных словарей у каждого middleware:
+    счетчики сообщений и жалобы по сторонам (для обучения подбора),
+    качество переписки и согласия на 18+ (ConversationTracker) и лог
+    сообщений (ChatLogger, хранит ChatTranscripts; None - лога нет или
+    он освобожден). Сторона 0 - user_id, сторона 1 - partner_id.
+    restored - чат начат до перезапуска или в другом процессе, начало и
+    счетчики неизвестны.
+    """
+
+    __slots__ = ('user_id', 'partner_id', 'started_at', 'last_activity', 'messages', 'reported',
+                 'quality_score', 'adult_consent', 'log', 'restored')
+
+    def __init__(self, user_id: int, partner_id: int, started_at: float = None, restored: bool = False):
+        self.user_id = user_id
+        self.partner_id = partner_id
+        self.started_at = started_at or time.time()
+        self.last_activity = self.started_at
+        self.messages = [0, 0]
+        self.reported = [False, False]
+        self.quality_score = 0.0
+        self.adult_consent = [False, False]
+        self.log: Optional[Deque[TranscriptEntry]] = None
+        self.restored = restored
+
+    def side(self, user_id: int) -> int:
+        return 0 if user_id == self.user_id else 1
+
+    def partner(self, user_id: int) -> int:
+        return self.partner_id if user_id == self.user_id else self.user_id
+
+    def note_message(self, user_id: int):
+        self.messages[self.side(user_id)] += 1
+        self.last_activity = time.time()
+
+    def note_report(self, user_id: int):
+        self.reported[self.side(user_id)] = True
+
+    def transcript(self) -> List[Dict]:
+        """Лог переписки в виде [{'user_id', 'message', 'timestamp', 'type'}] для разбора жалоб"""
+        senders = (self.user_id, self.partner_id)
+        return [
+            {'user_id': senders[side], 'message': text, 'timestamp': ts, 'type': MESSAGE_TYPES[type_code]}
+            for ts, side, type_code, text in self.log or ()
+        ]
+
+    def stats(self) -> Dict:
+        """Показатели переписки для деанона и 18+ режима"""
+        days_chatting = (time.time() - self.started_at) / 86400
+        total = self.messages[0] + self.messages[1]
+        return {
+            'messages_count': total,
+            'days_chatting': days_chatting,
+            'quality_score': self.quality_score,
+            'can_deanon': total >= 30 and days_chatting >= 2 and self.quality_score > 2.0,
+            'can_adult_chat': all(self.adult_consent) and self.quality_score > 1.0,
+            'adult_consent': list(self.adult_consent)
+        }
+
+class ChatTranscripts:
+    """Логи переписки чатов для разбора жалоб.
+
+    Лог чата - кольцевой буфер deque(maxlen=per_chat) компактных записей
+    (время, сторона, код типа, текст): новая запись вытесняет самую
+    старую без копирования. Чаты с логами упорядочены по последнему
+    сообщению; при каждой записи освобождаются логи чатов, молчащих
+    дольше idle_ttl, и самых давно молчащих сверх max_entries записей
+    на все чаты. Лог завершенного чата освобождается вместе с сессией.
+    """
+
+    def __init__(self, per_chat: int = CHAT_LOG_LIMIT, max_entries: int = CHAT_LOG_MAX_ENTRIES,
+                 idle_ttl: float = CHAT_LOG_IDLE_TTL):
+        self.per_chat = per_chat
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        # Сессии с логами -> время последнего сообщения, от давних к недавним
+        self.active: OrderedDict = OrderedDict()
+        self.entries = 0
+        self.evicted = 0  # Логов, освобожденных по простою или общему лимиту
+
+    def append(self, session: ChatSession, user_id: int, text: str, msg_type: str, now: float = None):
+        now = now or time.time()
+        log = session.log
+        if log is None:
+            log = session.log = deque(maxlen=self.per_chat)
+        if len(log) < self.per_chat:
+            self.entries += 1
+        log.append((now, session.side(user_id), TYPE_CODES[msg_type], text[:TRANSCRIPT_TEXT_LIMIT]))
+        self.active[session] = now
+        self.active.move_to_end(session)
+        self.evict(now)
+
+    def evict(self, now: float = None):
+        """Освобождает логи молчащих чатов и давних сверх общего лимита"""
+        now = now or time.time()
+        while self.active:
+            session, last_message = next(iter(self.active.items()))
+            if self.entries <= self.max_entries and now - last_message < self.idle_ttl:
+                break
+            self.drop(session)
+            self.evicted += 1
+
+    def drop(self, session: ChatSession):
+        self.active.pop(session, None)
+        if session.log is not None:
+            self.entries -= len(session.log)
+            session.log = None
+
+    def footprint(self) -> int:
+        """Сколько байт занимают логи: буферы, записи, время и тексты"""
+        total = sys.getsizeof(self.active)
+        for session in self.active:
+            total += sys.getsizeof(session.log)
+            for entry in session.log:
+                total += sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[3])
+        return total
+
+    def __len__(self) -> int:
+        return len(self.active)
+
+class ChatSessions:
+    """Чаты процесса: одна ChatSession доступна по id любого из собеседников.
+
+    Кто с кем в чате, по-прежнему решает хранилище состояния подбора
+    (match_state), а здесь - локальные данные чата. Сессия создается при
+    подборе пары (start), для чатов после перезапуска и из других
+    процессов - при первом сообщении (resolve), и освобождается в одном
+    месте - при завершении чата (finish) вместе с логом и очередями
+    пересылки. С общим хранилищем чат могут
+    завершить в другом процессе, поэтому resolve сверяется с ним.
+    """
+
+    def __init__(self, state: MatchStateBackend = match_state, transcripts: ChatTranscripts = None):
+        self.state = state
+        self.transcripts = transcripts if transcripts is not None else chat_transcripts
+        self.sessions: Dict[int, ChatSession] = {}
+
+    def start(self, user_id: int, partner_id: int, started_at: float = None, restored: bool = False) -> ChatSession:
+        session = ChatSession(user_id, partner_id, started_at, restored)
+        self.sessions[user_id] = self.sessions[partner_id] = session
+        return session
+
+    def get(self, user_id: int) -> Optional[ChatSession]:
+        return self.sessions.get(user_id)
+
+    async def resolve(self, user_id: int) -> Optional[ChatSession]:
+        """Сессия текущего чата пользователя; None - он не в чате"""
+        session = self.sessions.get(user_id)
+        if session is not None and not self.state.shared:
+            return session
+        partner_id = await self.state.partner_of(user_id)
+        if session is not None and session.partner(user_id) == partner_id:
+            return session
+        if session is not None:
+            self.end(user_id)
+        if partner_id is None:
+            return None
+        return self.start(user_id, partner_id, restored=True)
+
+    def end(self, user_id: int) -> Optional[ChatSession]:
+        """Освобождает сессию для обоих собеседников"""
+        session = self.sessions.pop(user_id, None)
+        if session is None:
+            return None
+        if self.sessions.get(session.partner(user_id)) is session:
+            del self.sessions[session.partner(user_id)]
+        self.transcripts.drop(session)
+        relay_pipelines.drop(session.user_id, session.partner_id)
+        return session
+
+    async def finish(self, user_id: int) -> Tuple[Optional[int], Optional[ChatSession]]:
+        """Завершает чат пользователя: (бывший собеседник, сессия чата)"""
+        partner_id = await self.state.end_chat(user_id)
+        session = self.end(user_id)
+        if session is not None and session.partner(user_id) != partner_id:
+            session = None
+        return partner_id, session
+
+    def __len__(self) -> int:
+        return len(self.sessions) // 2
+
+# Глобальные экземпляры
+chat_transcripts = ChatTranscripts()
+chat_sessions = ChatSessions()
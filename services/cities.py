@@ -0,0 +1,97 @@
+import json
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+from config import NEARBY_CITY_KM
+
+CITIES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cities.json')
+
+_PREFIX = re.compile(r'^(г\.|г |город )')
+_SEPARATORS = re.compile(r'[\s\-_]+')
+
+def normalize_city(text: str) -> str:
+    """Приводит название города к виду для сравнения: "г. Ростов-на-Дону " -> "ростов на дону" """
+    text = (text or '').strip().lower().replace('ё', 'е')
+    text = _PREFIX.sub('', text).strip(' .,')
+    return _SEPARATORS.sub(' ', text)
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу (формула гаверсинусов)"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+class CityRegistry:
+    """Справочник городов с каноническими целочисленными id.
+
+    Города из data/cities.json получают id 0..known-1 в порядке файла,
+    их названия и псевдонимы ("Msk", "мск", "г. Москва") сводятся к одному
+    id. Города не из справочника получают id по нормализованному названию
+    при первом появлении. Таблица соседних городов (ближе nearby_km)
+    строится один раз при загрузке и хранится битовыми масками.
+    """
+
+    def __init__(self, path: str = CITIES_PATH, nearby_km: float = NEARBY_CITY_KM):
+        self.ids: Dict[str, int] = {}  # нормализованное название или псевдоним -> id
+        self.names: List[str] = []  # id -> название для показа
+        self.nearby_km = nearby_km
+
+        cities = []
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                cities = json.load(f)
+        else:
+            print(f"Справочник городов не найден: {path}")
+
+        for city_id, city in enumerate(cities):
+            self.names.append(city['name'])
+            for alias in [city['name']] + city.get('aliases', []):
+                self.ids.setdefault(normalize_city(alias), city_id)
+        self.known = len(cities)
+
+        # near_masks[id] >> other & 1 - города на расстоянии не больше nearby_km
+        self.near_masks: List[int] = [0] * self.known
+        for i, first in enumerate(cities):
+            for j in range(i + 1, len(cities)):
+                second = cities[j]
+                if distance_km(first['lat'], first['lon'], second['lat'], second['lon']) <= nearby_km:
+                    self.near_masks[i] |= 1 << j
+                    self.near_masks[j] |= 1 << i
+
+    def id(self, text: str) -> int:
+        """Id города; неизвестный город регистрируется по нормализованному названию"""
+        name = normalize_city(text)
+        city_id = self.ids.get(name)
+        if city_id is None:
+            city_id = self.ids[name] = len(self.names)
+            self.names.append((text or '').strip())
+        return city_id
+
+    def lookup(self, text: str) -> Optional[int]:
+        """Id города без регистрации нового"""
+        return self.ids.get(normalize_city(text))
+
+    def name(self, city_id: int) -> str:
+        return self.names[city_id]
+
+    def canonical_name(self, text: str) -> str:
+        """Название из справочника для известного города, иначе введенный текст"""
+        city_id = self.lookup(text)
+        if city_id is not None and city_id < self.known:
+            return self.names[city_id]
+        return (text or '').strip()
+
+    def is_near(self, first_id: int, second_id: int) -> bool:
+        """Разные города из справочника не дальше nearby_km друг от друга"""
+        return first_id < self.known and self.near_masks[first_id] >> second_id & 1 == 1
+
+    def neighbours(self, city_id: int) -> List[int]:
+        if city_id >= self.known:
+            return []
+        mask = self.near_masks[city_id]
+        return [other for other in range(self.known) if mask >> other & 1]
+
+# Глобальный экземпляр
+city_registry = CityRegistry()
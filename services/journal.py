@@ -0,0 +1,101 @@
+import asyncio
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+class MatchJournal:
+    """Журнал очереди поиска и чатов в SQLite.
+
+    Каждое изменение состояния подбора дописывается строкой в таблицу
+    events: enqueue, dequeue, pair, end. Записи копятся в памяти и
+    сбрасываются одной транзакцией раз в flush_interval секунд или при
+    накоплении batch_size штук, поэтому подбор не ждет диск. При падении
+    теряются только изменения последнего интервала.
+
+    При запуске replay() проигрывает журнал и возвращает очередь и чаты,
+    а compact() заменяет журнал их снимком, чтобы он не рос бесконечно.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[Tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, kind TEXT NOT NULL, "
+            "user_id INTEGER NOT NULL, partner_id INTEGER, tier TEXT, enqueued_at REAL)"
+        )
+        self.db.commit()
+
+    def append(self, kind: str, user_id: int, partner_id: int = None, tier: str = None, enqueued_at: float = None):
+        self._pending.append((time.time(), kind, user_id, partner_id, tier, enqueued_at))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """Записывает накопленные события одной транзакцией"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO events (ts, kind, user_id, partner_id, tier, enqueued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    pending
+                )
+        except sqlite3.Error as e:
+            print(f"Match journal write error: {e}")
+
+    def replay(self) -> Tuple[Dict[int, Tuple[str, float]], Dict[int, int]]:
+        """Очередь {user_id: (уровень, время постановки)} и чаты {user_id: partner_id} по журналу"""
+        self.flush()
+        queue: Dict[int, Tuple[str, float]] = {}
+        chats: Dict[int, int] = {}
+        rows = self.db.execute("SELECT kind, user_id, partner_id, tier, enqueued_at FROM events ORDER BY seq")
+        for kind, user_id, partner_id, tier, enqueued_at in rows:
+            if kind == 'enqueue':
+                queue[user_id] = (tier, enqueued_at)
+            elif kind == 'dequeue':
+                queue.pop(user_id, None)
+            elif kind == 'pair':
+                queue.pop(user_id, None)
+                queue.pop(partner_id, None)
+                chats[user_id] = partner_id
+                chats[partner_id] = user_id
+            elif kind == 'end':
+                partner_id = chats.pop(user_id, None)
+                if partner_id is not None:
+                    chats.pop(partner_id, None)
+        return queue, chats
+
+    def compact(self, queue: Dict[int, Tuple[str, float]], chats: Dict[int, int]):
+        """Заменяет журнал снимком текущего состояния"""
+        self.flush()
+        now = time.time()
+        rows = [(now, 'enqueue', user_id, None, tier, enqueued_at) for user_id, (tier, enqueued_at) in queue.items()]
+        rows += [(now, 'pair', user_id, partner_id, None, None) for user_id, partner_id in chats.items() if user_id < partner_id]
+        with self.db:
+            self.db.execute("DELETE FROM events")
+            self.db.executemany(
+                "INSERT INTO events (ts, kind, user_id, partner_id, tier, enqueued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def close(self):
+        self.flush()
+        self.db.close()
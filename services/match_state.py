@@ -0,0 +1,404 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from config import STATE_BACKEND, REDIS_URL, MATCH_JOURNAL_PATH
+from services.journal import MatchJournal
+
+class StateBackendError(Exception):
+    """Ошибка хранилища состояния подбора (ответ -ERR, обрыв соединения)"""
+
+class MatchStateBackend:
+    """Общее состояние подбора: кто стоит в очереди и кто с кем в чате.
+
+    Все изменения, затрагивающие двух пользователей, атомарны: pair()
+    создает чат, только если оба еще в очереди и ни один не в чате, поэтому
+    несколько процессов с одним хранилищем не могут выдать одному человеку
+    двух собеседников. shared=True означает, что очередь могут менять другие
+    процессы и локальную копию очереди нужно периодически сверять.
+    """
+
+    shared = False
+
+    async def add_searcher(self, user_id: int, tier: str, enqueued_at: float) -> bool:
+        """Ставит в очередь; False, если пользователь уже ищет или в чате"""
+        raise NotImplementedError
+
+    async def remove_searcher(self, user_id: int) -> bool:
+        raise NotImplementedError
+
+    async def is_searching(self, user_id: int) -> bool:
+        raise NotImplementedError
+
+    async def searchers(self) -> Dict[int, Tuple[str, float]]:
+        """Вся очередь: {user_id: (уровень рейтинга, время постановки)}"""
+        raise NotImplementedError
+
+    async def queue_size(self) -> int:
+        raise NotImplementedError
+
+    async def tier_count(self, tier: str) -> int:
+        raise NotImplementedError
+
+    async def pair(self, user_id: int, partner_id: int) -> bool:
+        """Атомарно убирает обоих из очереди и создает чат"""
+        raise NotImplementedError
+
+    async def partner_of(self, user_id: int) -> Optional[int]:
+        raise NotImplementedError
+
+    async def end_chat(self, user_id: int) -> Optional[int]:
+        """Завершает чат пользователя и возвращает id бывшего собеседника"""
+        raise NotImplementedError
+
+    async def chat_count(self) -> int:
+        """Число активных чатов (пар)"""
+        raise NotImplementedError
+
+    async def restore(self) -> Optional[Tuple[Dict[int, Tuple[str, float]], Dict[int, int]]]:
+        """Загружает состояние, сохраненное до перезапуска процесса.
+
+        Возвращает восстановленные (очередь, чаты) или None, если
+        восстанавливать нечего или состояние и так пережило перезапуск.
+        """
+        return None
+
+    async def close(self):
+        pass
+
+class MemoryStateBackend(MatchStateBackend):
+    """Состояние в памяти одного процесса.
+
+    Между await операции не прерываются, поэтому атомарность pair()
+    обеспечивается однопоточностью цикла событий. Если задан journal_path,
+    restore() при запуске бота загружает очередь и чаты из журнала
+    (MatchJournal) и дальше дописывает в него каждое изменение; без вызова
+    restore() (скрипты, бенчмарки) состояние живет только в памяти.
+    """
+
+    def __init__(self, journal_path: str = None):
+        self.queue: Dict[int, Tuple[str, float]] = {}
+        self.tier_counts: Dict[str, int] = {}
+        self.chats: Dict[int, int] = {}  # {user_id: partner_id}, по записи на каждого из пары
+        self.journal_path = journal_path
+        self.journal: Optional[MatchJournal] = None
+
+    async def restore(self) -> Optional[Tuple[Dict[int, Tuple[str, float]], Dict[int, int]]]:
+        if not self.journal_path or self.journal is not None:
+            return None
+        self.journal = MatchJournal(self.journal_path)
+        self.queue, self.chats = self.journal.replay()
+        self.tier_counts = {}
+        for tier, _ in self.queue.values():
+            self.tier_counts[tier] = self.tier_counts.get(tier, 0) + 1
+        self.journal.compact(self.queue, self.chats)
+        print(f"Match state restored: {len(self.queue)} searching, {len(self.chats) // 2} chats")
+        return dict(self.queue), dict(self.chats)
+
+    async def add_searcher(self, user_id: int, tier: str, enqueued_at: float) -> bool:
+        if user_id in self.queue or user_id in self.chats:
+            return False
+        self.queue[user_id] = (tier, enqueued_at)
+        self.tier_counts[tier] = self.tier_counts.get(tier, 0) + 1
+        if self.journal:
+            self.journal.append('enqueue', user_id, tier=tier, enqueued_at=enqueued_at)
+        return True
+
+    async def remove_searcher(self, user_id: int) -> bool:
+        if not self._remove(user_id):
+            return False
+        if self.journal:
+            self.journal.append('dequeue', user_id)
+        return True
+
+    def _remove(self, user_id: int) -> bool:
+        entry = self.queue.pop(user_id, None)
+        if entry is None:
+            return False
+        self.tier_counts[entry[0]] -= 1
+        return True
+
+    async def is_searching(self, user_id: int) -> bool:
+        return user_id in self.queue
+
+    async def searchers(self) -> Dict[int, Tuple[str, float]]:
+        return dict(self.queue)
+
+    async def queue_size(self) -> int:
+        return len(self.queue)
+
+    async def tier_count(self, tier: str) -> int:
+        return self.tier_counts.get(tier, 0)
+
+    async def pair(self, user_id: int, partner_id: int) -> bool:
+        if user_id == partner_id or user_id in self.chats or partner_id in self.chats:
+            return False
+        if user_id not in self.queue or partner_id not in self.queue:
+            return False
+        self._remove(user_id)
+        self._remove(partner_id)
+        self.chats[user_id] = partner_id
+        self.chats[partner_id] = user_id
+        if self.journal:
+            self.journal.append('pair', user_id, partner_id)
+        return True
+
+    async def partner_of(self, user_id: int) -> Optional[int]:
+        return self.chats.get(user_id)
+
+    async def end_chat(self, user_id: int) -> Optional[int]:
+        partner_id = self.chats.pop(user_id, None)
+        if partner_id is not None:
+            self.chats.pop(partner_id, None)
+            if self.journal:
+                self.journal.append('end', user_id)
+        return partner_id
+
+    async def chat_count(self) -> int:
+        return len(self.chats) // 2
+
+    async def close(self):
+        if self.journal:
+            self.journal.close()
+
+class RespConnection:
+    """Одно соединение по протоколу Redis (RESP2) поверх asyncio streams"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> 'RespConnection':
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def execute(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self.writer.write(b''.join(parts))
+        await self.writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self.reader.readline()
+        if not line:
+            raise StateBackendError("Соединение с хранилищем закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise StateBackendError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise StateBackendError(f"Неизвестный ответ: {line!r}")
+
+    def close(self):
+        self.writer.close()
+
+class RedisStateBackend(MatchStateBackend):
+    """Состояние в Redis (или любом сервере с протоколом RESP и WATCH/MULTI/EXEC).
+
+    Ключи (prefix по умолчанию "mm:"):
+        q          hash  user_id -> "уровень|время постановки"
+        qt         hash  уровень -> число ищущих
+        s:<id>     флаг "в очереди", по нему WATCH для атомарных переходов
+        c:<id>     id собеседника
+        nchats     число активных чатов
+
+    Переходы, затрагивающие несколько ключей, выполняются оптимистичной
+    транзакцией: WATCH флагов обоих пользователей, проверка, MULTI/EXEC.
+    Если другой процесс успел изменить флаги, EXEC возвращает nil и
+    транзакция повторяется с новой проверкой.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = 'mm:', pool_size: int = 4, max_retries: int = 16):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        # WATCH действует в пределах соединения, поэтому каждая операция
+        # берет соединение из пула целиком
+        self._pool: Optional[asyncio.Queue] = None
+        self._opened = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _key(self, *parts) -> str:
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    async def _acquire(self) -> RespConnection:
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool.empty() and self._opened < self.pool_size:
+                connection = await RespConnection.open(self.host, self.port)
+                if self.password:
+                    await connection.execute('AUTH', self.password)
+                if self.db:
+                    await connection.execute('SELECT', self.db)
+                self._opened += 1
+                return connection
+        return await self._pool.get()
+
+    def _release(self, connection: RespConnection, broken: bool = False):
+        if broken:
+            connection.close()
+            self._opened -= 1
+        else:
+            self._pool.put_nowait(connection)
+
+    async def _run(self, operation):
+        """Выполняет operation(connection) на соединении из пула"""
+        connection = await self._acquire()
+        try:
+            result = await operation(connection)
+        except BaseException:
+            # Соединение могло остаться посреди MULTI или с непрочитанным ответом
+            self._release(connection, broken=True)
+            raise
+        self._release(connection)
+        return result
+
+    async def _transaction(self, connection: RespConnection, watch: List[str], prepare) -> Optional[bool]:
+        """WATCH keys -> prepare(connection) возвращает команды или None -> MULTI/EXEC с повторами"""
+        for _ in range(self.max_retries):
+            await connection.execute('WATCH', *watch)
+            commands = await prepare(connection)
+            if commands is None:
+                await connection.execute('UNWATCH')
+                return False
+            await connection.execute('MULTI')
+            for command in commands:
+                await connection.execute(*command)
+            if await connection.execute('EXEC') is not None:
+                return True
+        raise StateBackendError(f"Транзакция не прошла за {self.max_retries} попыток: {watch}")
+
+    async def add_searcher(self, user_id: int, tier: str, enqueued_at: float) -> bool:
+        searching, chat = self._key('s', user_id), self._key('c', user_id)
+
+        async def prepare(connection):
+            if any(await connection.execute('MGET', searching, chat)):
+                return None
+            return [
+                ('SET', searching, 1),
+                ('HSET', self._key('q'), user_id, f"{tier}|{enqueued_at!r}"),
+                ('HINCRBY', self._key('qt'), tier, 1)
+            ]
+        return await self._run(lambda connection: self._transaction(connection, [searching, chat], prepare))
+
+    async def remove_searcher(self, user_id: int) -> bool:
+        searching = self._key('s', user_id)
+
+        async def prepare(connection):
+            value = await connection.execute('HGET', self._key('q'), user_id)
+            if value is None:
+                return None
+            return [
+                ('DEL', searching),
+                ('HDEL', self._key('q'), user_id),
+                ('HINCRBY', self._key('qt'), value.split('|')[0], -1)
+            ]
+        return await self._run(lambda connection: self._transaction(connection, [searching], prepare))
+
+    async def is_searching(self, user_id: int) -> bool:
+        return await self._run(lambda connection: connection.execute('EXISTS', self._key('s', user_id))) == 1
+
+    async def searchers(self) -> Dict[int, Tuple[str, float]]:
+        flat = await self._run(lambda connection: connection.execute('HGETALL', self._key('q')))
+        result = {}
+        for user_id, value in zip(flat[::2], flat[1::2]):
+            tier, enqueued_at = value.split('|')
+            result[int(user_id)] = (tier, float(enqueued_at))
+        return result
+
+    async def queue_size(self) -> int:
+        return await self._run(lambda connection: connection.execute('HLEN', self._key('q')))
+
+    async def tier_count(self, tier: str) -> int:
+        value = await self._run(lambda connection: connection.execute('HGET', self._key('qt'), tier))
+        return int(value or 0)
+
+    async def pair(self, user_id: int, partner_id: int) -> bool:
+        if user_id == partner_id:
+            return False
+        keys = [self._key('s', user_id), self._key('s', partner_id), self._key('c', user_id), self._key('c', partner_id)]
+
+        async def prepare(connection):
+            user_searching, partner_searching, user_chat, partner_chat = await connection.execute('MGET', *keys)
+            if not user_searching or not partner_searching or user_chat or partner_chat:
+                return None
+            user_value, partner_value = await connection.execute('HMGET', self._key('q'), user_id, partner_id)
+            if user_value is None or partner_value is None:
+                return None
+            return [
+                ('DEL', keys[0], keys[1]),
+                ('HDEL', self._key('q'), user_id, partner_id),
+                ('HINCRBY', self._key('qt'), user_value.split('|')[0], -1),
+                ('HINCRBY', self._key('qt'), partner_value.split('|')[0], -1),
+                ('SET', keys[2], partner_id),
+                ('SET', keys[3], user_id),
+                ('INCR', self._key('nchats'))
+            ]
+        return await self._run(lambda connection: self._transaction(connection, keys, prepare))
+
+    async def partner_of(self, user_id: int) -> Optional[int]:
+        value = await self._run(lambda connection: connection.execute('GET', self._key('c', user_id)))
+        return int(value) if value is not None else None
+
+    async def end_chat(self, user_id: int) -> Optional[int]:
+        chat = self._key('c', user_id)
+        ended = {}
+
+        async def prepare(connection):
+            partner_id = await connection.execute('GET', chat)
+            if partner_id is None:
+                return None
+            ended['partner_id'] = int(partner_id)
+            return [('DEL', chat, self._key('c', partner_id)), ('DECR', self._key('nchats'))]
+
+        if await self._run(lambda connection: self._transaction(connection, [chat], prepare)):
+            return ended['partner_id']
+        return None
+
+    async def chat_count(self) -> int:
+        value = await self._run(lambda connection: connection.execute('GET', self._key('nchats')))
+        return int(value or 0)
+
+    async def close(self):
+        if self._pool is None:
+            return
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        self._opened = 0
+
+def create_backend(kind: str = STATE_BACKEND, url: str = REDIS_URL, journal_path: str = MATCH_JOURNAL_PATH) -> MatchStateBackend:
+    # Redis сам переживает перезапуск бота, журнал нужен только состоянию в памяти
+    if kind == 'redis':
+        return RedisStateBackend(url)
+    if kind != 'memory':
+        print(f"Неизвестный STATE_BACKEND={kind}, используется memory")
+    return MemoryStateBackend(journal_path)
+
+# Глобальный экземпляр
+match_state = create_backend()
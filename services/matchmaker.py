@@ -0,0 +1,567 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple, Callable, Awaitable
+
+from services.smart_matching import smart_matcher, AGE_WINDOWS, age_window_bound
+from services.queue_index import GOAL_RELAXED_LEVEL, bucket_key
+from services.search_queue import SearchQueue
+from services.batch_scoring import batch_scorer
+from services.batch_assignment import BatchAssigner
+from services.match_state import MatchStateBackend, MemoryStateBackend
+from services.chat_session import chat_sessions
+from services.wait_estimator import WaitEstimator
+from config import MATCHING_MODE, MATCHING_TICK_INTERVAL, MATCHING_WAIT_BONUS, MATCHING_ADAPTIVE_RELAXATION
+
+logger = logging.getLogger(__name__)
+
+class Matchmaker:
+    """Единый подборщик собеседников.
+
+    Вместо отдельной фоновой задачи на каждого ищущего работает один актор,
+    который просыпается только при входе/выходе из очереди и по дедлайнам
+    ослабления критериев. Новичок сравнивается с очередью один раз при входе,
+    а ожидающий пересматривается только когда растет его уровень ослабления.
+
+    Пары создает только актор, по одной за раз; обработчики меняют очередь
+    только через enqueue(), dequeue() и relax(). Кто ищет и кто с кем в чате,
+    хранит MatchStateBackend, а здесь - его копия с индексом корзин для подбора.
+    """
+
+    def __init__(self, relax_interval: int = 60, max_relaxed_level: int = 4, mode: str = 'greedy',
+                 tick_interval: float = 2.0, wait_bonus: float = 0.02, adaptive: bool = True):
+        self.relax_interval = relax_interval  # Секунд на каждый уровень ослабления
+        self.max_relaxed_level = max_relaxed_level
+        self.mode = mode
+        self.tick_interval = tick_interval
+        self.wait_bonus = wait_bonus
+        self.adaptive = adaptive
+        self.adaptive_skips = 0  # Сколько раз уровень ослабления подняли досрочно
+        self.estimator = WaitEstimator()
+        self.assigner = BatchAssigner(wait_bonus=wait_bonus)
+        self._next_tick = 0.0
+        # Ищущие: {user_id: {'profile', 'tier', 'enqueued_at', 'relaxed_level', 'bot', 'message', 'state'}}
+        self.searchers: Dict[int, Dict] = {}
+        self.search_queue = SearchQueue()
+        self.index = self.search_queue.index
+        self.state: MatchStateBackend = MemoryStateBackend()
+        self._next_sync = 0.0
+        self.on_match: Optional[Callable[..., Awaitable]] = None
+        self._events: Optional[asyncio.Queue] = None
+        self._deadlines: List[Tuple[float, int, int]] = []  # (время, user_id, уровень)
+        self._ready: List[Tuple[float, int, int]] = []  # (ключ приоритета, user_id, уровень; 0 - вход)
+        # Резервы на время создания чата: user_id -> исход pair() (True - чат создан)
+        self.reserved: Dict[int, asyncio.Future] = {}
+        # Локальные enqueue/dequeue для сверки с общим хранилищем: кто меняется
+        # прямо сейчас и номер последнего завершенного изменения каждого
+        self._changing: Set[int] = set()
+        self._changed: Dict[int, int] = {}
+        self._change_seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._notify_tasks = set()
+
+    def setup(self, search_queue: SearchQueue, state: MatchStateBackend, on_match: Callable[..., Awaitable]):
+        """Подключает хранилище состояния и обработчик уведомления о паре"""
+        self.search_queue = search_queue
+        self.index = search_queue.index
+        self.state = state
+        self.on_match = on_match
+
+    def _ensure_running(self):
+        if self._events is None:
+            self._events = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def is_searching(self, user_id: int) -> bool:
+        return user_id in self.searchers
+
+    async def enqueue(self, user_id: int, profile: Dict, tier: str, bot, message=None, state=None) -> bool:
+        """Ставит пользователя в очередь и будит актор; False, если он уже ищет или в чате"""
+        if user_id in self.searchers or user_id in self._changing:
+            return False
+        enqueued_at = time.time()
+        self._begin_change(user_id)
+        try:
+            if not await self.state.add_searcher(user_id, tier, enqueued_at):
+                return False
+        finally:
+            self._end_change(user_id)
+        premium = bool(profile.get('is_premium'))
+        self.searchers[user_id] = {
+            'profile': profile,
+            'tier': tier,
+            'premium': premium,
+            'enqueued_at': self.search_queue.add(user_id, tier, profile, enqueued_at, premium),
+            'relaxed_level': 0,
+            'bot': bot,
+            'message': message,
+            'state': state
+        }
+        self.estimator.arrived(bucket_key(profile), enqueued_at)
+        self._ensure_running()
+        self._events.put_nowait(('arrival', user_id))
+        return True
+
+    def resume(self, user_id: int, profile: Dict, tier: str, enqueued_at: float, bot, message=None, state=None):
+        """Возвращает в подбор ищущего, который уже есть в хранилище (после перезапуска).
+
+        Уровень ослабления считается по исходному времени постановки, как
+        если бы поиск не прерывался.
+        """
+        if user_id in self.searchers:
+            return
+        premium = bool(profile.get('is_premium'))
+        self.searchers[user_id] = {
+            'profile': profile,
+            'tier': tier,
+            'premium': premium,
+            'enqueued_at': self.search_queue.add(user_id, tier, profile, enqueued_at, premium),
+            'relaxed_level': self._level_for(enqueued_at),
+            'bot': bot,
+            'message': message,
+            'state': state
+        }
+        self._ensure_running()
+        self._events.put_nowait(('arrival', user_id))
+
+    def estimate_wait(self, profile: Dict, user_id: int = None) -> Optional[float]:
+        """Ожидаемое время до собеседника для ищущего с таким профилем, сек; None - неизвестно.
+
+        Без user_id (оценка для корзины в целом) доступным считается любой
+        ожидающий из совместимых корзин.
+        """
+        key = bucket_key(profile)
+        bucket = self.index.buckets.get(key, ())
+        waiting = len(bucket) - (user_id in bucket)
+        if user_id is None:
+            available = self.index.has_candidates(profile, 0)
+        else:
+            available = self._has_acceptable_candidate(user_id, profile)
+        return self.estimator.estimate(key, waiting, available)
+
+    def _has_acceptable_candidate(self, user_id: int, profile: Dict) -> bool:
+        """Есть ли в совместимых корзинах ожидающий, с которым _try_match создал бы чат.
+
+        Как и в _try_match, сначала смотрится возрастное окно уровня 0, и
+        только если в нем никого нет - остальные кандидаты.
+        """
+        candidate_ids = self.index.candidate_list(profile, 0, exclude=user_id)
+        window = AGE_WINDOWS.get(0)
+        if window is not None and profile.get('age'):
+            in_window = self.index.candidate_list_in_age_window(profile, 0, int(profile['age']), window, exclude=user_id)
+            if in_window is not None:
+                if self._any_above_threshold(user_id, profile, in_window):
+                    return True
+                checked = set(in_window)
+                candidate_ids = [candidate_id for candidate_id in candidate_ids if candidate_id not in checked]
+        return self._any_above_threshold(user_id, profile, candidate_ids)
+
+    def _any_above_threshold(self, user_id: int, profile: Dict, candidate_ids: List[int]) -> bool:
+        """Кто-то из кандидатов проходит фильтры и порог оценки find_best_matches"""
+        excludes = smart_matcher.blocklist.excludes
+        by_level: Dict[int, List[Dict]] = {}
+        for candidate_id in candidate_ids:
+            candidate = self.searchers.get(candidate_id)
+            if not candidate or excludes(user_id, candidate_id) or not candidate['profile'].get('profile_completed'):
+                continue
+            by_level.setdefault(candidate['relaxed_level'], []).append(candidate['profile'])
+        return any(batch_scorer.top_k(profile, candidates, level, k=1) for level, candidates in by_level.items())
+
+    def _level_for(self, enqueued_at: float) -> int:
+        return min(int((time.time() - enqueued_at) // self.relax_interval), self.max_relaxed_level)
+
+    async def dequeue(self, user_id: int) -> bool:
+        """Убирает пользователя из очереди (отмена поиска, выход и т.п.).
+
+        Если для него как раз создается чат, сначала дожидается исхода.
+        False - в очереди его уже нет: например, собеседник найден.
+        """
+        self._begin_change(user_id)
+        try:
+            reservation = self.reserved.get(user_id)
+            if reservation is not None:
+                await asyncio.shield(reservation)
+            self._remove(user_id)
+            removed = await self.state.remove_searcher(user_id)
+        finally:
+            self._end_change(user_id)
+        if self._events is not None:
+            self._events.put_nowait(('departure', user_id))
+        return removed
+
+    async def relax(self, user_id: int, level: int = None) -> bool:
+        """Сразу поднимает уровень ослабления ищущего (по умолчанию до максимального).
+
+        Сам подбор с новым уровнем делает актор, как при наступлении
+        дедлайна; False, если пользователь не ищет в этом процессе.
+        """
+        entry = self.searchers.get(user_id)
+        if not entry or self._events is None:
+            return False
+        level = self.max_relaxed_level if level is None else min(level, self.max_relaxed_level)
+        if entry['relaxed_level'] < level:
+            entry['relaxed_level'] = level
+            self._events.put_nowait(('relax', user_id))
+        return True
+
+    def _begin_change(self, user_id: int):
+        self._changing.add(user_id)
+
+    def _end_change(self, user_id: int):
+        self._changing.discard(user_id)
+        self._change_seq += 1
+        self._changed[user_id] = self._change_seq
+
+    def _changed_since(self, user_id: int, seq: int) -> bool:
+        """Меняется ли пользователь локально сейчас или менялся после изменения с номером seq"""
+        return user_id in self._changing or self._changed.get(user_id, 0) > seq
+
+    def _reserve(self, user_id: int, partner_id: int) -> Optional[asyncio.Future]:
+        """Резервирует обоих под создание чата; None, если кто-то уже занят или ушел"""
+        if user_id == partner_id or user_id in self.reserved or partner_id in self.reserved:
+            return None
+        if user_id not in self.searchers or partner_id not in self.searchers:
+            return None
+        reservation = asyncio.get_running_loop().create_future()
+        self.reserved[user_id] = self.reserved[partner_id] = reservation
+        return reservation
+
+    async def _pair(self, user_id: int, partner_id: int) -> bool:
+        """Создает чат и убирает обоих из очереди; False, если кого-то уже забрали.
+
+        Вызывается только актором под резервом обоих пользователей.
+        """
+        paired = await self.state.pair(user_id, partner_id)
+        if paired:
+            chat_sessions.start(user_id, partner_id)
+            smart_matcher.blocklist.remember_partner(user_id, partner_id)
+        # Не в паре - значит, в общем хранилище его уже нет в очереди (или он в чате)
+        for uid in (user_id, partner_id):
+            if paired or not await self.state.is_searching(uid):
+                self._remove(uid)
+        return paired
+
+    def _remove(self, user_id: int):
+        self.searchers.pop(user_id, None)
+        self.search_queue.remove(user_id)
+        batch_scorer.discard(user_id)
+
+    async def _run(self):
+        while True:
+            wake_at = None
+            if self._deadlines:
+                wake_at = self._deadlines[0][0]
+            # Тик распределения нужен, только когда в очереди есть хотя бы пара
+            if self.mode == 'batch' and len(self.searchers) >= 2:
+                wake_at = self._next_tick if wake_at is None else min(wake_at, self._next_tick)
+            # Общую очередь сверяем, пока в ней есть кто-то из этого процесса
+            if self.state.shared and self.searchers:
+                wake_at = self._next_sync if wake_at is None else min(wake_at, self._next_sync)
+            # После ошибки в куче могли остаться необслуженные - не ждем нового события
+            if self._ready:
+                wake_at = time.time()
+            timeout = None if wake_at is None else max(0.0, wake_at - time.time())
+            try:
+                kind, user_id = await asyncio.wait_for(self._events.get(), timeout)
+            except asyncio.TimeoutError:
+                kind, user_id = None, None
+
+            # Все накопившиеся входы и наступившие дедлайны попадают в одну
+            # кучу и обслуживаются по приоритету, а не по порядку событий.
+            # События разбираются до любых await, чтобы ошибка дальше их не потеряла
+            while kind is not None:
+                if kind == 'arrival':
+                    self._push_ready(user_id, 0)
+                elif kind == 'relax' and user_id in self.searchers:
+                    self._push_ready(user_id, self.searchers[user_id]['relaxed_level'])
+                kind, user_id = self._events.get_nowait() if not self._events.empty() else (None, None)
+            # Уход из очереди ничего не пересчитывает: устаревшие дедлайны
+            # отбрасываются лениво при извлечении из кучи
+            self._collect_deadlines()
+            try:
+                if self.state.shared and time.time() >= self._next_sync:
+                    await self._sync_shared()
+                await self._serve_ready()
+                if self.mode == 'batch' and time.time() >= self._next_tick:
+                    await self._batch_tick()
+            except Exception:
+                # Сверка и тик уже сдвинули свои сроки, а ищущие остаются в куче
+                # и очереди: следующая итерация продолжит с того же места
+                logger.exception("Matchmaker loop error")
+
+    def _push_ready(self, user_id: int, level: int):
+        key = self.search_queue.priority_key(user_id)
+        if key is not None:
+            heapq.heappush(self._ready, (key, user_id, level))
+
+    def _collect_deadlines(self):
+        now = time.time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, user_id, level = heapq.heappop(self._deadlines)
+            entry = self.searchers.get(user_id)
+            if not entry or entry['relaxed_level'] >= level:
+                continue
+            entry['relaxed_level'] = level
+            self._push_ready(user_id, level)
+
+    async def _serve_ready(self):
+        """Попытки подбора в порядке приоритета ищущих.
+
+        Приоритет - ожидание плюс фора за премиум и уровень рейтинга (см.
+        SearchQueue): накопившиеся входы и повышения уровня разбираются из
+        кучи по нему, а при выборе собеседника к оценке кандидата
+        добавляется wait_bonus за минуту его ожидания с форой.
+        """
+        while self._ready:
+            _, user_id, _ = heapq.heappop(self._ready)
+            entry = self.searchers.get(user_id)
+            if not entry:
+                continue
+            try:
+                if await self._serve(user_id, entry):
+                    continue
+            except Exception:
+                logger.exception(f"Matchmaker failed to serve {user_id}")
+                await self._recover(user_id)
+                if user_id not in self.searchers:
+                    continue
+
+            # Сообщение о прогрессе обновит общий обходчик (services/search_progress.py)
+            # После входа следующий уровень считается от текущего: восстановленный
+            # после перезапуска ищущий входит сразу с уровнем по времени ожидания.
+            # Так же и после ошибки: ищущий будет пересмотрен на следующем уровне
+            next_level = entry['relaxed_level'] + 1
+            if next_level <= self.max_relaxed_level:
+                next_deadline = entry['enqueued_at'] + self.relax_interval * next_level
+                heapq.heappush(self._deadlines, (next_deadline, user_id, next_level))
+
+    async def _serve(self, user_id: int, entry: Dict) -> bool:
+        """Одна попытка подбора с повышением уровня по пустым корзинам; True - чат создан"""
+        if self.mode == 'greedy' and await self._try_match(user_id):
+            return True
+        level = self._adaptive_level(user_id, entry)
+        if level > entry['relaxed_level']:
+            entry['relaxed_level'] = level
+            self.adaptive_skips += 1
+            if self.mode == 'greedy' and await self._try_match(user_id):
+                return True
+        return False
+
+    async def _recover(self, user_id: int):
+        """Сверяет с хранилищем ищущего, подбор которого упал.
+
+        Если pair() в хранилище успел пройти (или пользователь ушел), локальная
+        копия его больше не держит; иначе он остается ждать следующего уровня.
+        """
+        try:
+            if not await self.state.is_searching(user_id):
+                self._remove(user_id)
+        except Exception:
+            logger.exception(f"Matchmaker failed to check {user_id} after an error")
+
+    def _adaptive_level(self, user_id: int, entry: Dict) -> int:
+        """Уровень ослабления с учетом пустых корзин.
+
+        Если совместимых по цели ищущих нет, а по частоте входов следующий
+        появится позже, чем цель ослабнет по расписанию, ждать нет смысла:
+        уровень сразу поднимается до GOAL_RELAXED_LEVEL (если с ним есть кого
+        подобрать). Частоты входов по корзинам ведет WaitEstimator; по нему
+        же estimate_wait оценивает ожидание нового ищущего.
+        """
+        level = entry['relaxed_level']
+        # Сразу после запуска частот еще нет, и пустая корзина ничего не значит
+        if not self.adaptive or level >= GOAL_RELAXED_LEVEL or not self.estimator.has_history():
+            return level
+        profile = entry['profile']
+        if self.index.has_candidates(profile, level, exclude=user_id):
+            return level
+        if not self.index.has_candidates(profile, GOAL_RELAXED_LEVEL, exclude=user_id):
+            return level
+        scheduled = entry['enqueued_at'] + self.relax_interval * GOAL_RELAXED_LEVEL - time.time()
+        if self.estimator.next_compatible_arrival(bucket_key(profile), level) < scheduled:
+            return level
+        return GOAL_RELAXED_LEVEL
+
+    async def _try_match(self, user_id: int) -> bool:
+        """Сравнивает одного пользователя с текущей очередью и создает чат"""
+        entry = self.searchers.get(user_id)
+        if not entry:
+            return False
+
+        profile = entry['profile']
+        best = None
+        window = AGE_WINDOWS.get(entry['relaxed_level'])
+        if window is not None and profile.get('age'):
+            # Сначала только возрастное окно собственного уровня. Уровень пары
+            # может быть выше, поэтому потолок оценки вне окна берется для
+            # максимального уровня (с запасом на предпочтения и наибольший бонус
+            # за ожидание в очереди); не превысили его - смотрим всю очередь
+            in_window = self.index.candidate_list_in_age_window(
+                profile, GOAL_RELAXED_LEVEL, int(profile['age']), window, exclude=user_id
+            )
+            if in_window is not None:
+                best = await self._best_candidate(user_id, entry, in_window)
+                bound = (age_window_bound(window, self.max_relaxed_level) * smart_matcher.preferences.max_gain(user_id) +
+                         self._wait_bonus_of(self.search_queue.max_effective_wait()))
+                if best and best[4] <= bound:
+                    best = None
+        if best is None:
+            best = await self._best_candidate(
+                user_id, entry, self.index.candidate_list(profile, GOAL_RELAXED_LEVEL, exclude=user_id)
+            )
+
+        if not best:
+            return False
+
+        partner_id, score, reasons, level, _ = best
+        # Во время оценки кто-то мог отменить поиск или уже попасть в чат
+        if user_id not in self.searchers:
+            return False
+        if partner_id not in self.searchers:
+            return await self._try_match(user_id)
+
+        if await self._create_chat(user_id, partner_id, score, reasons, level):
+            return True
+        # Собеседника забрал другой процесс: _pair() уже убрал его из локальной очереди
+        if user_id in self.searchers and partner_id not in self.searchers:
+            return await self._try_match(user_id)
+        return False
+
+    def _wait_bonus_of(self, effective_wait: float) -> float:
+        return self.wait_bonus * effective_wait / 60
+
+    async def _best_candidate(self, user_id: int, entry: Dict, candidate_ids: List[int]) -> Optional[Tuple[int, float, List[str], int, float]]:
+        """Лучший кандидат из списка: (partner_id, оценка, причины, уровень пары, оценка с бонусом)"""
+        # Пара оценивается по более мягкому из двух уровней ослабления.
+        # Кандидаты берутся только из совместимых корзин; корзины с другой
+        # целью допустимы лишь когда уровень пары снимает требование цели
+        strict_keys = self.index.compatible_keys(bucket_key(entry['profile']), 0)
+        excludes = smart_matcher.blocklist.excludes
+        now = time.time()
+        by_level: Dict[int, List[int]] = {}
+        bonuses: Dict[int, float] = {}
+        for candidate_id in candidate_ids:
+            if excludes(user_id, candidate_id):
+                continue
+            candidate = self.searchers[candidate_id]
+            level = max(entry['relaxed_level'], candidate['relaxed_level'])
+            if level < GOAL_RELAXED_LEVEL and self.index.user_keys[candidate_id] not in strict_keys:
+                continue
+            by_level.setdefault(level, []).append(candidate_id)
+            bonuses[candidate_id] = self._wait_bonus_of(self.search_queue.effective_wait(candidate_id, now))
+
+        best = None
+        for level, candidates in by_level.items():
+            matches = await smart_matcher.find_best_matches(user_id, candidates, level, bonuses)
+            if not matches:
+                continue
+            partner_id, score, reasons = matches[0]
+            weight = score + bonuses[partner_id]
+            # При равном весе выигрывает тот, кто раньше в списке, независимо от группы
+            if (best is None or weight > best[4] or
+                    (weight == best[4] and candidate_ids.index(partner_id) < candidate_ids.index(best[0]))):
+                best = (partner_id, score, reasons, level, weight)
+        return best
+
+    async def _batch_tick(self):
+        """Глобальное распределение пар по всей очереди (режим batch).
+
+        В этом режиме пары не создаются при входе: раз в tick_interval
+        секунд вся очередь распределяется глобально (см. BatchAssigner).
+        Кто отменяет поиск быстрее тика, пары не получит, поэтому режим
+        оправдан, только когда ожидание в очереди много больше tick_interval.
+        """
+        self._next_tick = time.time() + self.tick_interval
+        started = time.perf_counter()
+        assignments = await self.assigner.assign(self.searchers, self.index)
+        for user_id, partner_id, score, level in assignments:
+            # Пока шло распределение, кто-то мог отменить поиск
+            if user_id not in self.searchers or partner_id not in self.searchers:
+                continue
+            reasons = await smart_matcher.explain_match(
+                self.searchers[user_id]['profile'], self.searchers[partner_id]['profile'], score
+            )
+            await self._create_chat(user_id, partner_id, score, reasons, level)
+        if assignments:
+            print(f"Batch tick: {len(assignments)} pairs in {time.perf_counter() - started:.3f}s")
+
+    async def _sync_shared(self):
+        """Сверяет локальную копию очереди с общим хранилищем.
+
+        Ушедших (в том числе спаренных другими процессами) убирает, ищущих из
+        других процессов добавляет как кандидатов. Их уровень ослабления
+        считается по времени постановки, а дедлайнами занимается процесс,
+        который их поставил в очередь.
+
+        Если хранилище общее для нескольких процессов, сверка идет раз в
+        tick_interval, а пара создается только после атомарного pair()
+        в хранилище (см. _pair).
+        """
+        self._next_sync = time.time() + self.tick_interval
+        # Снимок очереди мог устареть, пока шел ответ: своих пользователей,
+        # которые встали в очередь или вышли из нее после запроса, не трогаем.
+        # Иначе сверка убрала бы только что вставшего или вернула бы
+        # выходящего как ищущего из другого процесса, без бота и FSM
+        seq = self._change_seq
+        shared = await self.state.searchers()
+        changed = self._changed_since
+        for user_id in [user_id for user_id in self.searchers if user_id not in shared and not changed(user_id, seq)]:
+            self._remove(user_id)
+
+        from services.cache import profile_cache
+        for user_id, (tier, enqueued_at) in shared.items():
+            if user_id in self.searchers or changed(user_id, seq):
+                continue
+            profile = await profile_cache.get_profile(user_id)
+            if not profile or user_id in self.searchers or changed(user_id, seq):
+                continue
+            premium = bool(profile.get('is_premium'))
+            self.searchers[user_id] = {
+                'profile': profile,
+                'tier': tier,
+                'premium': premium,
+                'enqueued_at': self.search_queue.add(user_id, tier, profile, enqueued_at, premium),
+                'relaxed_level': self._level_for(enqueued_at),
+                'bot': None,
+                'message': None,
+                'state': None
+            }
+            self.estimator.arrived(bucket_key(profile))
+        # Более ранние изменения следующая сверка уже увидит в хранилище
+        self._changed = {user_id: change for user_id, change in self._changed.items() if change > seq}
+
+    async def _create_chat(self, user_id: int, partner_id: int, score: float, reasons: List[str], level: int) -> bool:
+        """Создает чат под резервом обоих пользователей.
+
+        Пока идет pair(), оба в reserved: dequeue() дожидается исхода и
+        сообщает, успел ли пользователь выйти из очереди или уже попал в чат.
+        """
+        reservation = self._reserve(user_id, partner_id)
+        if reservation is None:
+            return False
+        entry = self.searchers[user_id]
+        partner_entry = self.searchers[partner_id]
+        paired = False
+        try:
+            paired = await self._pair(user_id, partner_id)
+        finally:
+            del self.reserved[user_id], self.reserved[partner_id]
+            reservation.set_result(paired)
+        if not paired:
+            return False
+        now = time.time()
+        for matched in (entry, partner_entry):
+            self.estimator.matched(bucket_key(matched['profile']), now - matched['enqueued_at'], now)
+        print(f"Chat created: {user_id} <-> {partner_id} (score: {score:.2f}, relaxed_level: {level})")
+
+        if self.on_match:
+            task = asyncio.create_task(self.on_match(entry, partner_entry, user_id, partner_id, score, reasons, level))
+            self._notify_tasks.add(task)
+            task.add_done_callback(self._notify_tasks.discard)
+        return True
+
+# Глобальный экземпляр
+matchmaker = Matchmaker(mode=MATCHING_MODE, tick_interval=MATCHING_TICK_INTERVAL, wait_bonus=MATCHING_WAIT_BONUS,
+                        adaptive=MATCHING_ADAPTIVE_RELAXATION)
@@ -0,0 +1,295 @@
+import asyncio
+import contextvars
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    OUTBOUND_RATE, OUTBOUND_RELAY_RESERVE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES
+)
+
+# Классы приоритета исходящих запросов, от старшего к младшему
+RELAY, NOTIFY, PROGRESS, BROADCAST = range(4)
+PRIORITY_NAMES = ('relay', 'notify', 'progress', 'broadcast')
+# Фоновые классы не трогают резерв ведра и замолкают после ответа 429
+BACKGROUND = (PROGRESS, BROADCAST)
+
+ChatId = Union[int, str]
+
+_priority = contextvars.ContextVar('outbound_priority', default=NOTIFY)
+_admitted = contextvars.ContextVar('outbound_admitted', default=False)
+
+@contextmanager
+def outbound_priority(priority: int, admitted: bool = False):
+    """Класс приоритета запросов к Bot API внутри блока (без него - уведомления).
+
+    admitted - токен на первый запрос уже получен через acquire, и
+    планировщик его повторно не ждет.
+    """
+    priority_token = _priority.set(priority)
+    admitted_token = _admitted.set(admitted)
+    try:
+        yield
+    finally:
+        _admitted.reset(admitted_token)
+        _priority.reset(priority_token)
+
+class OutboundBudget:
+    """Ведро токенов: rate токенов в секунду, не больше burst"""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+
+    def available(self, now: float = None) -> float:
+        now = now or time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self.tokens
+
+    def try_take(self, count: int = 1, reserve: float = 0.0, now: float = None) -> bool:
+        """Берет count токенов, если после этого в ведре останется reserve"""
+        if self.available(now) - count < reserve:
+            return False
+        self.tokens -= count
+        return True
+
+    def delay(self, count: int = 1, reserve: float = 0.0, now: float = None) -> float:
+        """Через сколько секунд try_take(count, reserve) сможет выдать токены"""
+        return max(0.0, (reserve + count - self.available(now)) / self.rate)
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Планировщик всех исходящих запросов бота (middleware сессии Bot).
+
+    Telegram ограничивает бота примерно 30 сообщениями в секунду на всех
+    получателей и около одного в секунду в один чат, а превышение
+    оборачивается ответами 429 для всех отправок разом. Поэтому каждый
+    запрос с chat_id ждет токен из общего ведра и из ведра своего чата
+    (пересылка - только сразу после 429 в этом чате, см. _chat_limited).
+    Ждущие выстроены по классам: пересылка в чатах, уведомления, прогресс
+    поиска, рассылки; токен достается старшему классу, а внутри класса -
+    по очереди, пропуская тех, чей чат еще исчерпал свой лимит. Фоновые
+    классы оставляют в общем ведре резерв, чтобы всплеск переписки не
+    ждал их. Класс задается контекстом outbound_priority.
+
+    На 429 чат ставится на паузу по retry_after, фоновые классы замолкают
+    на то же время, а запрос повторяется до max_retries раз.
+    """
+
+    def __init__(self, rate: float = OUTBOUND_RATE, burst: float = None, relay_reserve: float = OUTBOUND_RELAY_RESERVE,
+                 chat_rate: float = OUTBOUND_CHAT_RATE, chat_burst: float = OUTBOUND_CHAT_BURST,
+                 max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.budget = OutboundBudget(rate, burst)
+        self.reserve = self.budget.burst * relay_reserve  # Сколько токенов фоновые классы не трогают
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.chats: Dict[ChatId, OutboundBudget] = {}
+        self.chat_paused: Dict[ChatId, float] = {}  # Чат -> до какого момента не писать (retry_after)
+        self.background_paused_until = 0.0
+        # Ждущие по классам: (future, chat_id, время постановки)
+        self.queues: List[Deque[Tuple[asyncio.Future, Optional[ChatId], float]]] = [deque() for _ in PRIORITY_NAMES]
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = math.inf
+        self._grants_since_prune = 0
+        # Метрики по классам
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.waited = [0.0] * len(PRIORITY_NAMES)  # Суммарное ожидание токена, сек
+        self.max_wait = [0.0] * len(PRIORITY_NAMES)
+        self.retries = [0] * len(PRIORITY_NAMES)  # Повторов после 429
+        self.released = [0] * len(PRIORITY_NAMES)  # Возвращенных токенов (release)
+        self.flood_waits = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        # getUpdates, answerCallbackQuery, getChat и т.п. в лимиты отправки не входят
+        if chat_id is None or method.__api_method__.startswith('get'):
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        admitted = _admitted.get()
+        _admitted.set(False)
+        attempt = 0
+        while True:
+            if not admitted:
+                await self.acquire(priority, chat_id)
+            admitted = False
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after(chat_id, e.retry_after)
+                self.retries[priority] += 1
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                print(f"Flood control on {method.__api_method__} to {chat_id}: retry after {e.retry_after}s")
+
+    async def acquire(self, priority: int, chat_id: Optional[ChatId] = None):
+        """Ждет разрешения отправить один запрос класса priority в чат chat_id"""
+        now = time.monotonic()
+        # Без очереди - только если старшие и свой класс никого не ждут
+        if not any(self.queues[:priority + 1]) and self._grant(priority, chat_id, now):
+            self._record(priority, 0.0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.queues[priority].append((future, chat_id, now))
+        self._dispatch()
+        # Отмена (например, по таймауту) отменяет future, и раздача его пропустит
+        await future
+
+    def release(self, priority: int, chat_id: Optional[ChatId] = None):
+        """Возвращает токен, полученный через acquire, но не потраченный на запрос"""
+        self.budget.tokens = min(self.budget.burst, self.budget.tokens + 1)
+        bucket = self.chats.get(chat_id) if chat_id is not None else None
+        if bucket is not None:
+            bucket.tokens = min(bucket.burst, bucket.tokens + 1)
+        self.sent[priority] -= 1
+        self.released[priority] += 1
+        if any(self.queues):
+            self._dispatch()
+
+    def retry_after(self, chat_id: Optional[ChatId], seconds: float):
+        """Telegram ответил 429: чат и фоновые классы ждут retry_after секунд"""
+        until = time.monotonic() + seconds
+        self.flood_waits += 1
+        if chat_id is not None:
+            self.chat_paused[chat_id] = max(self.chat_paused.get(chat_id, 0.0), until)
+            # Лимит чата исчерпан: после паузы отправки в него идут по одной
+            bucket = self.chats.get(chat_id)
+            if bucket is not None:
+                bucket.available()
+                bucket.tokens = min(bucket.tokens, 0.0)
+        self.background_paused_until = max(self.background_paused_until, until)
+
+    def _grant(self, priority: int, chat_id: Optional[ChatId], now: float) -> bool:
+        if priority in BACKGROUND and now < self.background_paused_until:
+            return False
+        bucket = None
+        if chat_id is not None:
+            if self.chat_paused.get(chat_id, 0.0) > now:
+                return False
+            bucket = self.chats.get(chat_id)
+            if bucket is not None and self._chat_limited(priority, chat_id, now) and bucket.available(now) < 1:
+                return False
+        if not self.budget.try_take(1, self.reserve if priority in BACKGROUND else 0.0, now):
+            return False
+        if chat_id is not None:
+            if bucket is None:
+                bucket = self.chats[chat_id] = OutboundBudget(self.chat_rate, self.chat_burst)
+            bucket.try_take(1, 0.0, now)
+        self._grants_since_prune += 1
+        if self._grants_since_prune >= 1000:
+            self._prune(now)
+        return True
+
+    def _chat_limited(self, priority: int, chat_id: ChatId, now: float) -> bool:
+        """Ждет ли запрос ведра своего чата.
+
+        Пересылка - живая переписка, и ее короткие пачки Telegram пропускает:
+        она ведро чата не ждет, но тратит из него, чтобы остальные классы в
+        тот же чат шли реже. Исключение - чат после 429: пока его ведро не
+        наполнилось бы заново, пересылка тоже идет по ведру, иначе скопившаяся
+        за паузу пачка разом снова упрется в лимит.
+        """
+        if priority != RELAY:
+            return True
+        return now < self.chat_paused.get(chat_id, 0.0) + self.chat_burst / self.chat_rate
+
+    def _ready_at(self, priority: int, chat_id: Optional[ChatId], now: float) -> float:
+        """Когда ждущего можно будет пропустить, если никто не займет токены раньше"""
+        ready = now + self.budget.delay(1, self.reserve if priority in BACKGROUND else 0.0, now)
+        if priority in BACKGROUND:
+            ready = max(ready, self.background_paused_until)
+        if chat_id is not None:
+            ready = max(ready, self.chat_paused.get(chat_id, 0.0))
+            bucket = self.chats.get(chat_id)
+            if bucket is not None and self._chat_limited(priority, chat_id, now):
+                ready = max(ready, now + bucket.delay(1, 0.0, now))
+        return ready
+
+    def _record(self, priority: int, wait: float):
+        self.sent[priority] += 1
+        self.waited[priority] += wait
+        self.max_wait[priority] = max(self.max_wait[priority], wait)
+
+    def _dispatch(self):
+        """Раздает токены ждущим по старшинству классов и заводит таймер до следующей раздачи"""
+        now = time.monotonic()
+        wake = math.inf
+        for priority, queue in enumerate(self.queues):
+            index = 0
+            while index < len(queue):
+                future, chat_id, enqueued_at = queue[index]
+                if future.done():
+                    del queue[index]
+                    continue
+                if self.budget.available(now) < 1:
+                    # Общее ведро пусто - младшим тем более не достанется
+                    wake = min(wake, now + self.budget.delay(1, 0.0, now))
+                    self._schedule(wake, now)
+                    return
+                if self._grant(priority, chat_id, now):
+                    del queue[index]
+                    self._record(priority, now - enqueued_at)
+                    future.set_result(None)
+                    continue
+                wake = min(wake, self._ready_at(priority, chat_id, now))
+                index += 1
+        if wake < math.inf:
+            self._schedule(wake, now)
+
+    def _schedule(self, wake: float, now: float):
+        if self._timer is not None:
+            if self._timer_at <= wake:
+                return
+            self._timer.cancel()
+        self._timer_at = wake
+        self._timer = asyncio.get_running_loop().call_later(max(wake - now, 0.001), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._timer_at = math.inf
+        self._dispatch()
+
+    def _prune(self, now: float):
+        """Забывает чаты, чьи ведра снова полны и паузы истекли"""
+        self._grants_since_prune = 0
+        for chat_id in [chat_id for chat_id, bucket in self.chats.items() if bucket.available(now) >= bucket.burst]:
+            del self.chats[chat_id]
+        refill = self.chat_burst / self.chat_rate  # Пока не прошло, пауза нужна _chat_limited
+        for chat_id in [chat_id for chat_id, until in self.chat_paused.items() if until + refill <= now]:
+            del self.chat_paused[chat_id]
+
+    def queue_depth(self, priority: int) -> int:
+        return sum(1 for future, _, _ in self.queues[priority] if not future.done())
+
+    def stats(self) -> Dict:
+        """Метрики для админки и бенчмарков"""
+        now = time.monotonic()
+        return {
+            'tokens': self.budget.available(now),
+            'flood_waits': self.flood_waits,
+            'paused_chats': sum(1 for until in self.chat_paused.values() if until > now),
+            'background_paused': max(0.0, self.background_paused_until - now),
+            'classes': {
+                name: {
+                    'queued': self.queue_depth(priority),
+                    'sent': self.sent[priority],
+                    'mean_wait': self.waited[priority] / self.sent[priority] if self.sent[priority] else 0.0,
+                    'max_wait': self.max_wait[priority],
+                    'retries': self.retries[priority],
+                    'released': self.released[priority]
+                }
+                for priority, name in enumerate(PRIORITY_NAMES)
+            }
+        }
+
+# Глобальный экземпляр
+outbound_scheduler = OutboundScheduler()
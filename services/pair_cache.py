@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from services.profile_features import ProfileFeatures
+
+# (меньший user_id, больший user_id, версия первого, версия второго)
+PairKey = Tuple[int, int, int, int]
+
+class PairExplanationCache:
+    """Ограниченный симметричный кэш объяснений подбора пар.
+
+    Хранит причины, которые зависят только от профилей пары (возраст,
+    город, цели, интересы); оценка пары сюда не входит - она зависит от
+    уровня ослабления и бонусов и дешевле пересчитывается векторно. Ключ
+    включает версии признаков обоих профилей, поэтому после правки профиля
+    старые записи просто перестают находиться и вытесняются как самые давно
+    использованные.
+    """
+
+    def __init__(self, max_size: int = 50_000):
+        self.max_size = max_size
+        self.entries: "OrderedDict[PairKey, List[str]]" = OrderedDict()  # ключ -> причины
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(user: ProfileFeatures, candidate: ProfileFeatures) -> PairKey:
+        if user.user_id <= candidate.user_id:
+            return (user.user_id, candidate.user_id, user.version, candidate.version)
+        return (candidate.user_id, user.user_id, candidate.version, user.version)
+
+    def get(self, key: PairKey) -> Optional[List[str]]:
+        reasons = self.entries.get(key)
+        if reasons is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return reasons
+
+    def put(self, key: PairKey, reasons: List[str]):
+        self.entries[key] = reasons
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+# Глобальный экземпляр
+pair_cache = PairExplanationCache()
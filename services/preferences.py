@@ -0,0 +1,119 @@
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+
+from services.profile_features import ProfileFeatures
+
+# Признаки пары с точки зрения пользователя: что он ценит в собеседнике
+PREFERENCE_FEATURES = ('same_city', 'age_close', 'older', 'interests', 'same_tone', 'has_about')
+# Диапазоны признаков - для оценки сверху множителя пары
+FEATURE_RANGES = ((0.0, 1.0), (0.0, 1.0), (-1.0, 1.0), (0.0, 1.0), (0.0, 1.0), (0.0, 1.0))
+AGE_CLOSE_SPAN = 20  # Разница возрастов, при которой близость возраста равна нулю
+OLDER_SPAN = 10  # Разница возрастов, при которой признак "старше" насыщается
+
+PREFERENCE_MIN = 0.5  # Множитель оценки пары от предпочтений одного пользователя
+PREFERENCE_MAX = 1.5
+LEARNING_RATE = 0.1
+WEIGHT_LIMIT = 1.0
+
+def pair_features(user: ProfileFeatures, partner: ProfileFeatures) -> List[float]:
+    """Признаки собеседника partner с точки зрения user (порядок PREFERENCE_FEATURES)"""
+    age_close = older = 0.0
+    if user.age and partner.age:
+        age_diff = partner.age - user.age
+        age_close = 1.0 - min(abs(age_diff), AGE_CLOSE_SPAN) / AGE_CLOSE_SPAN
+        older = min(max(age_diff / OLDER_SPAN, -1.0), 1.0)
+
+    interests = 0.0
+    if user.tag_mask and partner.tag_mask:
+        common = (user.tag_mask & partner.tag_mask).bit_count()
+        interests = common / (user.tag_count + partner.tag_count - common)
+
+    same_tone = 1.0 if user.has_about and partner.has_about and user.tone_positive == partner.tone_positive else 0.0
+    return [
+        1.0 if user.city_id == partner.city_id else 0.0,
+        age_close,
+        older,
+        interests,
+        same_tone,
+        1.0 if partner.has_about else 0.0
+    ]
+
+class PreferenceModel:
+    """Изученные предпочтения пользователей: вектор весов по PREFERENCE_FEATURES.
+
+    Оценка пары умножается на 1 + w·x (в пределах PREFERENCE_MIN..PREFERENCE_MAX),
+    где x - признаки собеседника, а w - веса пользователя. Веса лежат
+    строками одной матрицы: BatchScorer берет их по номеру строки без
+    копирования, а обновление после чата - это O(число признаков).
+    Строка 0 - нулевые веса для всех, о ком еще ничего не известно.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.rows: Dict[int, int] = {}  # user_id -> строка весов
+        self.weights = np.zeros((capacity, len(PREFERENCE_FEATURES)))
+        self.updates: Dict[int, int] = {}  # user_id -> число учтенных чатов
+        # Вызываются при появлении строки весов у пользователя: (user_id, строка)
+        self.listeners: List[Callable[[int, int], None]] = []
+        # Наибольший множитель среди всех пользователей (не уменьшается)
+        self.max_multiplier = 1.0
+
+    def row(self, user_id: int) -> int:
+        return self.rows.get(user_id, 0)
+
+    def _ensure_row(self, user_id: int) -> int:
+        row = self.rows.get(user_id)
+        if row is None:
+            row = len(self.rows) + 1
+            if row >= len(self.weights):
+                self.weights = np.concatenate([self.weights, np.zeros_like(self.weights)])
+            self.rows[user_id] = row
+            for listener in self.listeners:
+                listener(user_id, row)
+        return row
+
+    def multiplier(self, user: ProfileFeatures, partner: ProfileFeatures) -> float:
+        """Множитель оценки partner для user; порядок операций как в BatchScorer"""
+        row = self.rows.get(user.user_id)
+        if row is None:
+            return 1.0
+        weights = self.weights[row]
+        dot = 0.0
+        for weight, value in zip(weights.tolist(), pair_features(user, partner)):
+            dot = dot + weight * value
+        return min(max(1.0 + dot, PREFERENCE_MIN), PREFERENCE_MAX)
+
+    def upper_bound(self, user_id: int) -> float:
+        """Наибольший возможный множитель пользователя по всем собеседникам"""
+        row = self.rows.get(user_id)
+        if row is None:
+            return 1.0
+        gain = sum(max(weight * low, weight * high) for weight, (low, high) in zip(self.weights[row].tolist(), FEATURE_RANGES))
+        return min(max(1.0 + gain, PREFERENCE_MIN), PREFERENCE_MAX)
+
+    def max_gain(self, user_id: int) -> float:
+        """Во сколько раз предпочтения могут поднять оценку любой пары с user_id"""
+        return self.upper_bound(user_id) * self.max_multiplier
+
+    def update(self, user_id: int, features: List[float], reward: float):
+        """Шаг обучения после чата: reward от -1 (плохо) до 1 (хорошо)"""
+        row = self._ensure_row(user_id)
+        weights = self.weights[row]
+        weights += LEARNING_RATE * reward * np.asarray(features)
+        np.clip(weights, -WEIGHT_LIMIT, WEIGHT_LIMIT, out=weights)
+        self.updates[user_id] = self.updates.get(user_id, 0) + 1
+        self.max_multiplier = max(self.max_multiplier, self.upper_bound(user_id))
+
+    def set(self, user_id: int, weights: List[float], updates: int = 0):
+        """Загружает сохраненные веса"""
+        if len(weights) != len(PREFERENCE_FEATURES):
+            return
+        row = self._ensure_row(user_id)
+        self.weights[row] = weights
+        self.updates[user_id] = updates
+        self.max_multiplier = max(self.max_multiplier, self.upper_bound(user_id))
+
+    def get(self, user_id: int) -> Tuple[List[float], int]:
+        return self.weights[self.row(user_id)].tolist(), self.updates.get(user_id, 0)
+
+# Глобальный экземпляр
+preference_model = PreferenceModel()
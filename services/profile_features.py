@@ -0,0 +1,110 @@
+import itertools
+from typing import Dict, List
+from services.ai_filters import compat_id, ORIENTATION_ROWS, STRICT_ROWS
+from services.cities import city_registry
+from services.queue_index import bucket_compatibility, bucket_key
+
+# Интересы, совпадение по которым дает бонус
+HIGH_VALUE_INTERESTS = {'спорт', 'музыка', 'кино', 'путешествия', 'книги', 'искусство', 'наука'}
+# Ключевые слова для анализа тональности описаний
+POSITIVE_WORDS = ['добрый', 'веселый', 'активный', 'позитивный', 'открытый', 'дружелюбный']
+NEGATIVE_WORDS = ['грустный', 'замкнутый', 'серьезный', 'интроверт']
+
+# Поля, без которых профиль считается неполным
+REQUIRED_FIELDS = ['first_name', 'age', 'city', 'about', 'tags', 'gender', 'orientation', 'dating_goal']
+
+class Interner:
+    """Выдает строкам компактные целочисленные id"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def id(self, value: str) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def value(self, value_id: int) -> str:
+        return self.values[value_id]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+gender_ids = Interner()
+orientation_ids = Interner()
+goal_ids = Interner()
+# Словарь интересов: нормализованный тег -> номер бита в маске профиля
+tag_vocabulary = Interner()
+
+def tags_mask(tags) -> int:
+    mask = 0
+    for tag in tags:
+        mask |= 1 << tag_vocabulary.id(tag)
+    return mask
+
+def mask_tags(mask: int) -> List[str]:
+    """Теги маски в порядке их появления в словаре"""
+    tags = []
+    while mask:
+        low_bit = mask & -mask
+        tags.append(tag_vocabulary.value(low_bit.bit_length() - 1))
+        mask ^= low_bit
+    return tags
+
+HIGH_VALUE_TAG_MASK = tags_mask(sorted(HIGH_VALUE_INTERESTS))
+
+# Каждая сборка признаков получает новую версию: после правки профиля
+# кэшированные объяснения пар с его участием перестают совпадать по ключу
+_versions = itertools.count(1)
+
+class ProfileFeatures:
+    """Компактный набор признаков профиля для подбора.
+
+    Строится один раз при загрузке или изменении профиля, после чего
+    сравнение двух профилей сводится к операциям над целыми числами.
+    """
+
+    __slots__ = (
+        'user_id', 'version', 'age', 'city_id', 'gender_id', 'orientation_id', 'goal_id', 'key_id', 'compat_id',
+        'tag_mask', 'tag_count', 'tag_list_len', 'has_about', 'positive', 'negative', 'tone_positive',
+        'rating', 'complete'
+    )
+
+    def __init__(self, profile: Dict):
+        self.user_id = profile.get('user_id')
+        self.version = next(_versions)
+        age = profile.get('age')
+        self.age = int(age) if age else 0
+        self.city_id = city_registry.id(profile.get('city'))
+        self.gender_id = gender_ids.id((profile.get('gender') or '').strip().lower())
+        self.orientation_id = orientation_ids.id((profile.get('orientation') or '').strip().lower())
+        self.goal_id = goal_ids.id((profile.get('dating_goal') or '').strip().lower())
+        self.key_id = bucket_compatibility.key_id(bucket_key(profile))
+        self.compat_id = compat_id(profile)
+
+        tags = profile.get('tags') or ''
+        tag_list = [tag.strip().lower() for tag in tags.split(',')] if tags else []
+        # Размеры пересечения и объединения считаются через popcount масок
+        self.tag_mask = tags_mask(tag_list)
+        self.tag_count = self.tag_mask.bit_count()
+        self.tag_list_len = len(tag_list)
+
+        about = (profile.get('about') or '').lower()
+        self.has_about = bool(about)
+        self.positive = sum(1 for word in POSITIVE_WORDS if word in about)
+        self.negative = sum(1 for word in NEGATIVE_WORDS if word in about)
+        self.tone_positive = self.positive > self.negative
+
+        self.rating = profile.get('rating', 100)
+        self.complete = all(profile.get(field) for field in REQUIRED_FIELDS)
+
+def orientation_compatible(user: ProfileFeatures, candidate: ProfileFeatures) -> bool:
+    """То же, что is_gender_orientation_compatible, но по таблице"""
+    return ORIENTATION_ROWS[user.compat_id][candidate.compat_id] == 1
+
+def goal_compatible(user: ProfileFeatures, candidate: ProfileFeatures) -> bool:
+    """Совместимость по полу/ориентации и целям (is_dating_goal_compatible) по таблице"""
+    return STRICT_ROWS[user.compat_id][candidate.compat_id] == 1
@@ -0,0 +1,187 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple, Iterable, Iterator
+from services.ai_filters import compat_id, ORIENTATION_ROWS, STRICT_ROWS
+from keyboards.registration import GENDERS, ORIENTATIONS, DATING_GOALS
+
+# Корзина очереди: (пол, ориентация, цель знакомства) в нормализованном виде
+BucketKey = Tuple[str, str, str]
+
+# С этого уровня ослабления цели знакомства перестают быть обязательными
+GOAL_RELAXED_LEVEL = 3
+
+def bucket_key(profile: Dict) -> BucketKey:
+    return (
+        (profile.get('gender') or '').strip().lower(),
+        (profile.get('orientation') or '').strip().lower(),
+        (profile.get('dating_goal') or '').strip().lower()
+    )
+
+def _key_profile(key: BucketKey) -> Dict:
+    return {'gender': key[0], 'orientation': key[1], 'dating_goal': key[2]}
+
+class BucketCompatibility:
+    """Таблица совместимости корзин (пол, ориентация, цель).
+
+    Каждой корзине выдается целочисленный id и множество корзин, с которыми
+    она может дать ненулевую оценку: строгое (с учетом цели) и с ослабленной
+    целью. Таблица пополняется при появлении нестандартных значений.
+    """
+
+    def __init__(self):
+        self.key_ids: Dict[BucketKey, int] = {}
+        self.keys: List[BucketKey] = []
+        self.compatible: Dict[BucketKey, Set[BucketKey]] = {}
+        self.compatible_relaxed: Dict[BucketKey, Set[BucketKey]] = {}
+        # Те же множества в виде битовых масок по id корзин
+        self.strict_masks: List[int] = []
+        self.relaxed_masks: List[int] = []
+        for gender in GENDERS:
+            for orientation in ORIENTATIONS:
+                for goal in DATING_GOALS:
+                    self.key_id((gender.lower(), orientation.lower(), goal.lower()))
+
+    def key_id(self, key: BucketKey) -> int:
+        """Возвращает id корзины, при необходимости добавляя ее в таблицу"""
+        key_id = self.key_ids.get(key)
+        if key_id is not None:
+            return key_id
+
+        key_id = len(self.keys)
+        self.key_ids[key] = key_id
+        self.keys.append(key)
+        self.compatible[key] = set()
+        self.compatible_relaxed[key] = set()
+        self.strict_masks.append(0)
+        self.relaxed_masks.append(0)
+        key_compat = compat_id(_key_profile(key))
+        for other in self.keys:
+            other_compat = compat_id(_key_profile(other))
+            for a, b, a_compat, b_compat in ((key, other, key_compat, other_compat), (other, key, other_compat, key_compat)):
+                if not ORIENTATION_ROWS[a_compat][b_compat]:
+                    continue
+                self.compatible_relaxed[a].add(b)
+                self.relaxed_masks[self.key_ids[a]] |= 1 << self.key_ids[b]
+                if STRICT_ROWS[a_compat][b_compat]:
+                    self.compatible[a].add(b)
+                    self.strict_masks[self.key_ids[a]] |= 1 << self.key_ids[b]
+        return key_id
+
+    def compatible_keys(self, key: BucketKey, relaxed_level: int = 0) -> Set[BucketKey]:
+        self.key_id(key)
+        if relaxed_level >= GOAL_RELAXED_LEVEL:
+            return self.compatible_relaxed[key]
+        return self.compatible[key]
+
+# Глобальная таблица совместимости
+bucket_compatibility = BucketCompatibility()
+
+class CompatibilityIndex:
+    """Индекс очереди поиска по корзинам (пол, ориентация, цель).
+
+    Кандидаты берутся только из корзин, совместимых с профилем ищущего.
+    На уровнях ослабления 3-4 расширяется только измерение цели знакомства.
+    Внутри корзины пользователи с указанным возрастом дополнительно лежат
+    в списке, отсортированном по возрасту, для выборки по возрастному окну.
+    """
+
+    def __init__(self, compatibility: BucketCompatibility = None):
+        self.compatibility = compatibility or bucket_compatibility
+        self.buckets: Dict[BucketKey, Dict[int, None]] = {}  # Корзина -> упорядоченное множество user_id
+        self.user_keys: Dict[int, BucketKey] = {}
+        self.ages: Dict[BucketKey, List[Tuple[int, int, int]]] = {}  # Корзина -> [(возраст, порядковый номер, user_id)]
+        self.user_ages: Dict[int, Tuple[int, int]] = {}  # user_id -> (возраст, порядковый номер)
+        self._seq = 0
+
+    def add(self, user_id: int, profile: Dict):
+        key = bucket_key(profile)
+        self.compatibility.key_id(key)
+        self.remove(user_id)
+        self.buckets.setdefault(key, {})[user_id] = None
+        self.user_keys[user_id] = key
+        age = profile.get('age')
+        if age:
+            # Порядковый номер восстанавливает порядок входа при выборке по окну
+            self._seq += 1
+            self.user_ages[user_id] = (int(age), self._seq)
+            insort(self.ages.setdefault(key, []), (int(age), self._seq, user_id))
+
+    def remove(self, user_id: int):
+        key = self.user_keys.pop(user_id, None)
+        if key is None:
+            return
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.pop(user_id, None)
+            if not bucket:
+                del self.buckets[key]
+        age = self.user_ages.pop(user_id, None)
+        if age is not None:
+            ages = self.ages[key]
+            del ages[bisect_left(ages, (age[0], age[1], user_id))]
+            if not ages:
+                del self.ages[key]
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.user_keys
+
+    def compatible_keys(self, key: BucketKey, relaxed_level: int = 0) -> Set[BucketKey]:
+        return self.compatibility.compatible_keys(key, relaxed_level)
+
+    def _compatible_buckets(self, profile: Dict, relaxed_level: int) -> Iterator[Tuple[BucketKey, Dict[int, None]]]:
+        keys = self.compatible_keys(bucket_key(profile), relaxed_level)
+        # Обходим меньшее из двух множеств: непустые корзины или совместимые ключи
+        if len(self.buckets) < len(keys):
+            for key, bucket in self.buckets.items():
+                if key in keys:
+                    yield key, bucket
+        else:
+            for key in keys:
+                bucket = self.buckets.get(key)
+                if bucket:
+                    yield key, bucket
+
+    def candidates(self, profile: Dict, relaxed_level: int = 0) -> Iterable[int]:
+        """Кандидаты только из корзин, совместимых с профилем на данном уровне"""
+        for _, bucket in self._compatible_buckets(profile, relaxed_level):
+            yield from bucket
+
+    def has_candidates(self, profile: Dict, relaxed_level: int = 0, exclude: int = None) -> bool:
+        """Есть ли в совместимых корзинах кто-то, кроме exclude"""
+        for _, bucket in self._compatible_buckets(profile, relaxed_level):
+            if len(bucket) > 1 or exclude not in bucket:
+                return True
+        return False
+
+    def candidate_list(self, profile: Dict, relaxed_level: int = 0, exclude: int = None) -> List[int]:
+        return [user_id for user_id in self.candidates(profile, relaxed_level) if user_id != exclude]
+
+    def candidate_list_in_age_window(self, profile: Dict, relaxed_level: int, age: int, window: int,
+                                     exclude: int = None, max_share: float = 0.75) -> Optional[List[int]]:
+        """Кандидаты с возрастом в [age - window, age + window] в том же порядке,
+        что и у candidate_list (пользователи без возраста не попадают).
+
+        Если окно захватывает больше max_share кандидатов, выборка по окну
+        не окупается и возвращается None.
+        """
+        ranges = []
+        total = in_window = 0
+        for key, bucket in self._compatible_buckets(profile, relaxed_level):
+            total += len(bucket)
+            ages = self.ages.get(key)
+            if not ages:
+                continue
+            start = bisect_left(ages, (age - window,))
+            end = bisect_left(ages, (age + window + 1,))
+            in_window += end - start
+            ranges.append((bucket, ages, start, end))
+        if in_window > total * max_share:
+            return None
+
+        result = []
+        for bucket, ages, start, end in ranges:
+            if end - start == len(bucket):
+                result.extend(user_id for user_id in bucket if user_id != exclude)
+            else:
+                in_range = sorted(ages[start:end], key=lambda item: item[1])
+                result.extend(user_id for _, _, user_id in in_range if user_id != exclude)
+        return result
@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import types
+
+from config import RELAY_QUEUE_SIZE, RELAY_MAX_HOLD
+
+class RelayPipelines:
+    """Очереди пересылки в чатах: у каждой пары отправитель-получатель своя очередь и свой обработчик.
+
+    Обработчик сообщения только ставит его в очередь собеседника и сразу
+    возвращается, поэтому медленная отправка видео не держит ни его, ни
+    другие чаты. Обработчик получателя отправляет по одному сообщению в
+    порядке message_id и начинает следующую отправку только после ответа
+    на предыдущую: Telegram упорядочивает сообщения по приходу запросов,
+    и две одновременные отправки одному получателю могут переставиться.
+    Разные чаты при этом отправляются параллельно.
+
+    Сообщения пачки доходят до очереди вразнобой: у каждого свой путь через
+    middleware и базу. Поэтому каждое сообщение из чата отмечается при
+    входе (expect) и снимается после обработки (settle), а очередь не
+    начинает отправку, пока более раннее сообщение того же отправителя еще
+    обрабатывается, но не дольше max_hold секунд. Без ранних сообщений в
+    обработке отправка начинается сразу.
+
+    Очередь ограничена queue_size; в переполненную сообщение не ставится,
+    и отправителя просят подождать, а не копят задачи. Обработчик живет,
+    пока в очереди или в отправке что-то есть. При завершении чата его
+    очереди сбрасываются (drop), чтобы ждущие сообщения не ушли бывшему
+    собеседнику.
+    """
+
+    def __init__(self, queue_size: int = RELAY_QUEUE_SIZE, max_hold: float = RELAY_MAX_HOLD):
+        self.queue_size = queue_size
+        self.max_hold = max_hold
+        self.deliver: Optional[Callable[[types.Message, int], Awaitable]] = None
+        # (отправитель, получатель) -> куча (message_id, порядок постановки, сообщение)
+        self.pending: Dict[Tuple[int, int], List[Tuple[int, int, types.Message]]] = {}
+        # (отправитель, получатель) -> {message_id: начало обработки} для сообщений, еще не дошедших до очереди
+        self.expected: Dict[Tuple[int, int], Dict[int, float]] = {}
+        self.workers: Dict[Tuple[int, int], asyncio.Task] = {}
+        # Будит обработчик очереди, когда в нее пришло сообщение или закончилась обработка раннего
+        self._wakeups: Dict[Tuple[int, int], asyncio.Event] = {}
+        self._order = itertools.count()
+        self.relayed = 0
+        self.rejected = 0  # Не принятых из-за переполненной очереди
+        self.dropped = 0  # Сброшенных при завершении чата
+        self.max_depth = 0
+
+    def setup(self, deliver: Callable[[types.Message, int], Awaitable]):
+        """deliver(message, partner_id) отправляет одно сообщение и сам сообщает отправителю об ошибках"""
+        self.deliver = deliver
+
+    def submit(self, message: types.Message, partner_id: int) -> bool:
+        """Ставит сообщение в очередь собеседника; False - очередь полна"""
+        key = (message.from_user.id, partner_id)
+        queue = self.pending.setdefault(key, [])
+        if len(queue) >= self.queue_size:
+            self.rejected += 1
+            return False
+        heapq.heappush(queue, (message.message_id, next(self._order), message))
+        self.max_depth = max(self.max_depth, len(queue))
+        if key not in self.workers:
+            self._wakeups[key] = asyncio.Event()
+            self.workers[key] = asyncio.create_task(self._work(key, queue, self._wakeups[key]))
+        else:
+            self._wakeups[key].set()
+        return True
+
+    def expect(self, message: types.Message, partner_id: int):
+        """Сообщение из чата начало обрабатываться; более поздние подождут его"""
+        self.expected.setdefault((message.from_user.id, partner_id), {})[message.message_id] = time.monotonic()
+
+    def settle(self, message: types.Message, partner_id: int):
+        """Обработка сообщения закончилась (поставлено в очередь или нет)"""
+        key = (message.from_user.id, partner_id)
+        expected = self.expected.get(key)
+        if expected is None:
+            return
+        expected.pop(message.message_id, None)
+        if not expected:
+            del self.expected[key]
+        wakeup = self._wakeups.get(key)
+        if wakeup is not None:
+            wakeup.set()
+
+    def drop(self, user_id: int, partner_id: int):
+        """Сбрасывает еще не отправленные сообщения чата в обе стороны"""
+        for key in ((user_id, partner_id), (partner_id, user_id)):
+            queue = self.pending.get(key)
+            if queue:
+                self.dropped += len(queue)
+                # Очищаем на месте: список держит обработчик, он завершится сам
+                queue.clear()
+
+    def _hold(self, key: Tuple[int, int], message_id: int) -> float:
+        """Сколько еще ждать сообщения с меньшим message_id, которые обрабатываются; 0 - не ждать"""
+        expected = self.expected.get(key)
+        if not expected:
+            return 0.0
+        now = time.monotonic()
+        return max((started + self.max_hold - now for earlier, started in expected.items() if earlier < message_id),
+                   default=0.0)
+
+    async def _work(self, key: Tuple[int, int], queue: List[Tuple[int, int, types.Message]], wakeup: asyncio.Event):
+        partner_id = key[1]
+        try:
+            while queue:
+                hold = self._hold(key, queue[0][0])
+                if hold > 0:
+                    # Ждем, пока более раннее сообщение дойдет до очереди или выйдет срок
+                    wakeup.clear()
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), hold)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                _, _, message = heapq.heappop(queue)
+                # Следующая отправка начинается только после ответа на эту
+                await self._send(message, partner_id)
+        finally:
+            del self.workers[key]
+            del self._wakeups[key]
+            if not queue:
+                self.pending.pop(key, None)
+
+    async def _send(self, message: types.Message, partner_id: int):
+        try:
+            await self.deliver(message, partner_id)
+        except Exception as e:
+            print(f"Relay to {partner_id} failed: {e}")
+        self.relayed += 1
+
+    def depth(self) -> int:
+        """Сообщений во всех очередях"""
+        return sum(len(queue) for queue in self.pending.values())
+
+    async def stop(self, timeout: float = 5.0):
+        """Дает очередям доотправиться при остановке бота"""
+        if self.workers:
+            await asyncio.wait(list(self.workers.values()), timeout=timeout)
+
+# Глобальный экземпляр
+relay_pipelines = RelayPipelines()
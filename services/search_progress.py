@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services.outbound import OutboundScheduler, PROGRESS, outbound_priority, outbound_scheduler
+from config import SEARCH_PROGRESS_INTERVAL
+
+class SearchProgressTicker:
+    """Один обходчик сообщений о прогрессе поиска вместо задачи на каждого ищущего.
+
+    Раз в interval секунд берет снимок очереди (snapshot) и рисует текст
+    каждому ищущему (render). Сообщение правится, только если текст
+    изменился. Правки идут через планировщик исходящих запросов классом
+    PROGRESS: обход ждет разрешения на каждую до начала следующего, а если
+    не дождался - следующий обход начинается с того, на ком остановился
+    этот, чтобы никто не ждал правки дольше других. Ушедшему из очереди,
+    пока ждали разрешения, правка не отправляется, а токен возвращается.
+    Последний показанный текст хранится в записи ищущего (progress_text).
+    """
+
+    def __init__(self, interval: float = SEARCH_PROGRESS_INTERVAL, scheduler: OutboundScheduler = outbound_scheduler):
+        self.interval = interval
+        self.scheduler = scheduler
+        self.searchers: Dict[int, Dict] = {}
+        self.snapshot: Optional[Callable[[], Awaitable[Dict]]] = None
+        self.render: Optional[Callable[[Dict, Dict], Optional[str]]] = None
+        self.edit: Optional[Callable[[Dict, str], Awaitable]] = None
+        self._resume_at: Optional[int] = None  # На ком остановился прошлый обход
+        self._task: Optional[asyncio.Task] = None
+        self._edit_tasks = set()
+        self.edits = 0
+        self.deferred = 0
+
+    def setup(self, searchers: Dict[int, Dict], snapshot: Callable[[], Awaitable[Dict]],
+              render: Callable[[Dict, Dict], Optional[str]], edit: Callable[[Dict, str], Awaitable]):
+        """searchers - записи ищущих подборщика; render возвращает None, если показывать нечего"""
+        self.searchers = searchers
+        self.snapshot = snapshot
+        self.render = render
+        self.edit = edit
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Search progress error: {e}")
+            await asyncio.sleep(max(0.0, started + self.interval - time.monotonic()))
+
+    def _order(self) -> List[int]:
+        user_ids = list(self.searchers)
+        if self._resume_at in self.searchers:
+            position = user_ids.index(self._resume_at)
+            user_ids = user_ids[position:] + user_ids[:position]
+        return user_ids
+
+    async def tick(self):
+        """Один обход ищущих; правки отправляются параллельно, не дожидаясь друг друга"""
+        if not self.searchers:
+            return
+        deadline = time.monotonic() + self.interval
+        stats = await self.snapshot()
+        order = self._order()
+        self._resume_at = None
+        for user_id in order:
+            entry = self.searchers.get(user_id)
+            if not entry or not entry.get('message'):
+                continue
+            text = self.render(entry, stats)
+            if text is None or text == entry.get('progress_text'):
+                continue
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self.scheduler.acquire(PROGRESS, user_id), remaining)
+            except asyncio.TimeoutError:
+                self.deferred += 1
+                self._resume_at = user_id
+                return
+            # Пока ждали токен, пользователь мог найти собеседника или отменить
+            # поиск: токен возвращается в бюджет следующим по очереди
+            if self.searchers.get(user_id) is not entry:
+                self.scheduler.release(PROGRESS, user_id)
+                continue
+            entry['progress_text'] = text
+            self.edits += 1
+            task = asyncio.create_task(self._edit(user_id, entry, text))
+            self._edit_tasks.add(task)
+            task.add_done_callback(self._edit_tasks.discard)
+
+    async def _edit(self, user_id: int, entry: Dict, text: str):
+        # Задача стартует не сразу - ищущий мог уйти и за это время
+        if self.searchers.get(user_id) is not entry:
+            self.scheduler.release(PROGRESS, user_id)
+            self.edits -= 1
+            return
+        try:
+            # Разрешение уже получено в tick
+            with outbound_priority(PROGRESS, admitted=True):
+                await self.edit(entry, text)
+        except Exception as e:
+            print(f"Progress update error for {user_id}: {e}")
+
+# Глобальный экземпляр
+search_progress = SearchProgressTicker()
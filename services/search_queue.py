@@ -0,0 +1,114 @@
+import heapq
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.queue_index import CompatibilityIndex
+
+# Уровни рейтинга в порядке приоритета
+RATING_TIERS = ("high", "medium", "low")
+
+# Фора в секундах ожидания: приоритет - это ожидание плюс фора, поэтому
+# премиум и высокий рейтинг обслуживаются раньше, но любой ожидающий со
+# временем обгоняет новичков с форой (защита от голодания)
+TIER_HEAD_START = {"high": 60.0, "medium": 30.0, "low": 0.0}
+PREMIUM_HEAD_START = 120.0
+
+def head_start(tier: str, premium: bool) -> float:
+    return TIER_HEAD_START.get(tier, 0.0) + (PREMIUM_HEAD_START if premium else 0.0)
+
+class SearchQueue:
+    """Очередь поиска собеседника.
+
+    Проверка наличия и удаление за O(1), обход в порядке входа, время
+    постановки в очередь для каждого пользователя. Размер очереди и число
+    ищущих по уровням рейтинга поддерживаются на ходу, а индекс корзин
+    (пол, ориентация, цель) обновляется вместе с очередью.
+
+    Приоритет ищущего - ожидание плюс фора (head_start). Ключ кучи
+    enqueued_at - фора от времени не зависит, поэтому куча не перестраивается
+    по мере ожидания, а ее вершина - ищущий с наибольшим приоритетом.
+    """
+
+    def __init__(self, tiers: Tuple[str, ...] = RATING_TIERS):
+        self.entries: Dict[int, Tuple[str, float]] = {}  # user_id -> (уровень, время постановки)
+        self.tier_counts: Dict[str, int] = {tier: 0 for tier in tiers}
+        self.index = CompatibilityIndex()
+        self.priority_keys: Dict[int, float] = {}  # user_id -> enqueued_at - фора
+        self._heap: List[Tuple[float, int]] = []  # Ушедшие удаляются лениво
+
+    def add(self, user_id: int, tier: str, profile: Dict = None, enqueued_at: float = None,
+            premium: bool = False) -> float:
+        """Ставит пользователя в очередь и возвращает время постановки"""
+        if user_id in self.entries:
+            return self.entries[user_id][1]
+        enqueued_at = time.time() if enqueued_at is None else enqueued_at
+        self.entries[user_id] = (tier, enqueued_at)
+        self.tier_counts[tier] = self.tier_counts.get(tier, 0) + 1
+        if profile is not None:
+            self.index.add(user_id, profile)
+        key = enqueued_at - head_start(tier, premium)
+        self.priority_keys[user_id] = key
+        heapq.heappush(self._heap, (key, user_id))
+        return enqueued_at
+
+    def remove(self, user_id: int) -> bool:
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self.tier_counts[entry[0]] -= 1
+        self.index.remove(user_id)
+        self.priority_keys.pop(user_id)
+        # Куча чистится, когда ушедших в ней становится больше живых
+        if len(self._heap) > 2 * len(self.priority_keys) + 64:
+            self._heap = [(key, uid) for uid, key in self.priority_keys.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def priority_key(self, user_id: int) -> Optional[float]:
+        """Ключ приоритета: меньше - раньше обслуживается"""
+        return self.priority_keys.get(user_id)
+
+    def top(self) -> Optional[Tuple[float, int]]:
+        """(ключ, user_id) ищущего с наибольшим приоритетом"""
+        heap = self._heap
+        while heap and self.priority_keys.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def effective_wait(self, user_id: int, now: float = None) -> float:
+        """Ожидание с учетом форы, секунд"""
+        now = time.time() if now is None else now
+        return now - self.priority_keys[user_id]
+
+    def max_effective_wait(self, now: float = None) -> float:
+        top = self.top()
+        if top is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return now - top[0]
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.entries)
+
+    def tier_of(self, user_id: int) -> Optional[str]:
+        entry = self.entries.get(user_id)
+        return entry[0] if entry else None
+
+    def enqueued_at(self, user_id: int) -> Optional[float]:
+        entry = self.entries.get(user_id)
+        return entry[1] if entry else None
+
+    def count(self, tier: str) -> int:
+        return self.tier_counts.get(tier, 0)
+
+    def users(self, tier: str = None) -> Iterator[int]:
+        """Пользователи в порядке входа, при необходимости только одного уровня"""
+        for user_id, (user_tier, _) in self.entries.items():
+            if tier is None or user_tier == tier:
+                yield user_id
@@ -1,169 +1,211 @@
 import asyncio
 from typing import List, Dict, Optional, Tuple
+from services.blocklist import blocklist
+from services.chat_session import ChatSession
 from services.cache import profile_cache
-from services.ai_filters import is_gender_orientation_compatible, is_dating_goal_compatible
+from services.cities import city_registry
+from services.pair_cache import pair_cache
+from services.preferences import preference_model, pair_features
+from services.profile_features import ProfileFeatures, HIGH_VALUE_TAG_MASK, mask_tags, orientation_compatible, goal_compatible
 import time
 
+# Разница возрастов, до которой пара еще получает баллы за возраст, по уровню
+# ослабления (на уровне 4 баллы дает любая разница)
+AGE_WINDOWS = {0: 12, 1: 15, 2: 20, 3: 20}
+# Наибольшая оценка без баллов за возраст: цель 0.3 + город 0.2 + интересы 0.15 + описания 0.07
+MAX_SCORE_WITHOUT_AGE = 0.72
+
+def age_window_bound(window: int, relaxed_level: int) -> float:
+    """Потолок оценки кандидата с разницей возраста больше window (или без возраста)
+    для пар с уровнем ослабления не выше relaxed_level"""
+    age_points = 0.0
+    if relaxed_level >= 4:
+        age_points = 0.02
+    if relaxed_level >= 2 and window < 20:
+        age_points = 0.05
+    if relaxed_level >= 1 and window < 15:
+        age_points = 0.1
+    if window < 12:
+        age_points = 0.15
+    # Запас на погрешность сложения float
+    return MAX_SCORE_WITHOUT_AGE + age_points + 1e-9
+
+# Чат, после которого пользователь считается довольным: 10 минут и 20 сообщений с каждой стороны
+GOOD_CHAT_DURATION = 600
+GOOD_CHAT_MESSAGES = 20
+QUICK_EXIT = 60  # Вышел из чата быстрее - собеседник не понравился
+
+def chat_reward(duration: float, own_messages: int, partner_messages: int, ended_by_self: bool, reported: bool) -> float:
+    """Оценка чата одной стороной: от -1 (не понравился) до 1 (понравился)"""
+    if reported:
+        return -1.0
+    if ended_by_self and duration < QUICK_EXIT:
+        return -1.0
+    engagement = (0.5 * min(duration / GOOD_CHAT_DURATION, 1.0) +
+                  0.5 * min(min(own_messages, partner_messages) / GOOD_CHAT_MESSAGES, 1.0))
+    return 2 * engagement - 1
+
 class SmartMatchingService:
     def __init__(self):
-        self.blacklist: Dict[int, List[int]] = {}
-        self.match_history: Dict[int, List[int]] = {}  # История матчей пользователя
-        self.user_preferences: Dict[int, Dict] = {}  # Изученные предпочтения
+        self.blocklist = blocklist  # Черный список и недавние собеседники
+        self.preferences = preference_model  # Изученные предпочтения
     
     def add_to_blacklist(self, user_id: int, blocked_user_id: int):
-        if user_id not in self.blacklist:
-            self.blacklist[user_id] = []
-        if blocked_user_id not in self.blacklist[user_id]:
-            self.blacklist[user_id].append(blocked_user_id)
+        self.blocklist.add(user_id, blocked_user_id)
     
     def is_blacklisted(self, user_id: int, candidate_id: int) -> bool:
-        return candidate_id in self.blacklist.get(user_id, [])
+        """Пару нельзя подбирать: черный список (в любую сторону) или недавний собеседник"""
+        return self.blocklist.excludes(user_id, candidate_id)
     
-    def learn_from_interaction(self, user_id: int, partner_id: int, interaction_quality: str):
-        """Обучение на основе качества взаимодействия"""
-        if user_id not in self.user_preferences:
-            self.user_preferences[user_id] = {'positive_traits': {}, 'negative_traits': {}}
+    async def record_chat_end(self, user_id: int, partner_id: int, session: Optional[ChatSession], reason: str = "ended"):
+        """Итог чата, который завершил user_id: сохраняет его и обучает предпочтения обоих"""
+        # Чаты, начатые до перезапуска или в другом процессе, без статистики - учиться не на чем
+        if session is None or session.restored:
+            return
         
-        # Получаем профиль партнера для анализа
-        # Здесь можно добавить логику обучения на основе успешных/неуспешных матчей
+        side = session.side(user_id)
+        messages, partner_messages = session.messages[side], session.messages[1 - side]
+        reported, partner_reported = session.reported[side], session.reported[1 - side]
+        started_at = session.started_at
+        duration = time.time() - started_at
+        
+        await self.learn_from_interaction(user_id, partner_id, chat_reward(duration, messages, partner_messages, True, reported))
+        # На того, на кого пожаловались, его собственная оценка чата не влияет
+        if not partner_reported and not reported:
+            await self.learn_from_interaction(partner_id, user_id, chat_reward(duration, partner_messages, messages, False, False))
+        
+        try:
+            from database.models import User, ChatOutcome, UserPreference
+            from datetime import datetime, timezone
+            users = {user.tg_id: user for user in await User.filter(tg_id__in=[user_id, partner_id])}
+            if len(users) < 2:
+                return
+            await ChatOutcome.create(
+                user=users[user_id], partner=users[partner_id],
+                started_at=datetime.fromtimestamp(started_at, timezone.utc), duration_seconds=duration,
+                user_messages=messages, partner_messages=partner_messages, end_reason=reason,
+                user_reported=reported, partner_reported=partner_reported
+            )
+            for uid in (user_id, partner_id):
+                weights, updates = self.preferences.get(uid)
+                if updates:
+                    await UserPreference.update_or_create(user=users[uid], defaults={'weights': weights, 'updates': updates})
+        except Exception as e:
+            print(f"Error saving chat outcome: {e}")
+    
+    async def learn_from_interaction(self, user_id: int, partner_id: int, reward: float):
+        """Обучение на основе качества взаимодействия: reward от -1 до 1"""
+        user_profile = await profile_cache.get_profile(user_id)
+        partner_profile = await profile_cache.get_profile(partner_id)
+        if not user_profile or not partner_profile:
+            return
+        features = pair_features(profile_cache.features_for(user_profile), profile_cache.features_for(partner_profile))
+        self.preferences.update(user_id, features, reward)
+    
+    async def load_preferences(self):
+        """Загружает изученные предпочтения из БД"""
+        from database.models import UserPreference
+        rows = await UserPreference.all().values_list('user__tg_id', 'weights', 'updates')
+        for user_id, weights, updates in rows:
+            self.preferences.set(user_id, weights, updates)
+        print(f"Loaded preferences for {len(rows)} users")
     
     async def calculate_ai_compatibility(self, user_profile: Dict, candidate_profile: Dict, relaxed_level: int = 0) -> float:
         """Интеллектуальный расчет совместимости с учетом ослабления правил"""
+        user = profile_cache.features_for(user_profile)
+        candidate = profile_cache.features_for(candidate_profile)
         
         # Базовые проверки (всегда обязательны)
-        if not is_gender_orientation_compatible(user_profile, candidate_profile):
+        if not orientation_compatible(user, candidate):
             return 0.0
         
         score = 0.0
-        factors = []
         
         # 1. Совместимость целей (критично для уровней 0-2)
-        goal_compatible = is_dating_goal_compatible(user_profile, candidate_profile)
-        if relaxed_level < 3 and not goal_compatible:
+        goals_match = goal_compatible(user, candidate)
+        if relaxed_level < 3 and not goals_match:
             return 0.0
         
-        if goal_compatible:
+        if goals_match:
             score += 0.3
-            factors.append("цели совпадают")
         elif relaxed_level >= 3:
             score += 0.1
-            factors.append("цели частично совместимы")
         
         # 2. Возрастная совместимость (с постепенным ослаблением)
-        if user_profile.get('age') and candidate_profile.get('age'):
-            age_diff = abs(int(user_profile['age']) - int(candidate_profile['age']))
+        if user.age and candidate.age:
+            age_diff = abs(user.age - candidate.age)
             
             if age_diff <= 3:
                 score += 0.25
-                factors.append("идеальный возраст")
             elif age_diff <= 7:
                 score += 0.2
-                factors.append("хороший возраст")
             elif age_diff <= 12:
                 score += 0.15
-                factors.append("приемлемый возраст")
             elif relaxed_level >= 1 and age_diff <= 15:
                 score += 0.1
-                factors.append("расширенный возраст")
             elif relaxed_level >= 2 and age_diff <= 20:
                 score += 0.05
-                factors.append("широкий возрастной диапазон")
             elif relaxed_level >= 4:
                 score += 0.02
-                factors.append("любой возраст")
         
-        # 3. Географическая близость
-        same_city = user_profile.get('city', '').lower() == candidate_profile.get('city', '').lower()
-        if same_city:
+        # 3. Географическая близость: соседние города со 2-го уровня, любые - с 3-го
+        if user.city_id == candidate.city_id:
             score += 0.2
-            factors.append("тот же город")
-        elif relaxed_level >= 2:
+        elif relaxed_level >= 2 and city_registry.is_near(user.city_id, candidate.city_id):
+            score += 0.1
+        elif relaxed_level >= 3:
             score += 0.05
-            factors.append("разные города")
-        
-        # 4. Общие интересы (ИИ-анализ)
-        interest_score = await self._analyze_interests_compatibility(
-            user_profile.get('tags', ''), 
-            candidate_profile.get('tags', ''),
-            user_profile.get('about', ''),
-            candidate_profile.get('about', '')
-        )
-        score += interest_score * 0.15
-        if interest_score > 0.5:
-            factors.append("много общих интересов")
-        elif interest_score > 0.2:
-            factors.append("есть общие интересы")
-        
-        # 5. Анализ описаний профилей
-        description_score = await self._analyze_personality_compatibility(
-            user_profile.get('about', ''),
-            candidate_profile.get('about', '')
-        )
-        score += description_score * 0.1
-        if description_score > 0.6:
-            factors.append("совместимые личности")
-        
-        print(f"AI compatibility: {score:.2f} - {', '.join(factors)}")
-        return min(score, 1.0)
-    
-    async def _analyze_interests_compatibility(self, tags1: str, tags2: str, about1: str, about2: str) -> float:
-        """ИИ-анализ совместимости интересов"""
-        if not tags1 or not tags2:
-            return 0.0
         
-        # Простой анализ пересечения тегов
-        tags1_set = set(tag.strip().lower() for tag in tags1.split(','))
-        tags2_set = set(tag.strip().lower() for tag in tags2.split(','))
+        # 4. Общие интересы
+        score += self._interests_compatibility(user, candidate) * 0.15
         
-        common_tags = tags1_set & tags2_set
-        total_tags = tags1_set | tags2_set
+        # 5. Анализ описаний профилей
+        score += self._personality_compatibility(user, candidate) * 0.1
+        score = min(score, 1.0)
         
-        if not total_tags:
+        # 6. Изученные предпочтения обоих
+        return min(score * self.preferences.multiplier(user, candidate) * self.preferences.multiplier(candidate, user), 1.0)
+    
+    def _interests_compatibility(self, user: ProfileFeatures, candidate: ProfileFeatures) -> float:
+        """Совместимость интересов: коэффициент Жаккара + бонус за ценные интересы"""
+        if not user.tag_mask or not candidate.tag_mask:
             return 0.0
         
-        base_score = len(common_tags) / len(total_tags)
+        common_tags = user.tag_mask & candidate.tag_mask
+        common_count = common_tags.bit_count()
+        total_tags = user.tag_count + candidate.tag_count - common_count
+        base_score = common_count / total_tags
         
         # Бонус за качественные совпадения
         quality_bonus = 0.0
-        high_value_interests = {'спорт', 'музыка', 'кино', 'путешествия', 'книги', 'искусство', 'наука'}
-        quality_matches = common_tags & high_value_interests
+        quality_matches = (common_tags & HIGH_VALUE_TAG_MASK).bit_count()
         if quality_matches:
-            quality_bonus = len(quality_matches) * 0.1
+            quality_bonus = quality_matches * 0.1
         
         return min(base_score + quality_bonus, 1.0)
     
-    async def _analyze_personality_compatibility(self, about1: str, about2: str) -> float:
-        """ИИ-анализ совместимости личностей по описаниям"""
-        if not about1 or not about2:
+    def _personality_compatibility(self, user: ProfileFeatures, candidate: ProfileFeatures) -> float:
+        """Совместимость личностей по тональности описаний"""
+        if not user.has_about or not candidate.has_about:
             return 0.3  # Нейтральная оценка при отсутствии данных
         
-        # Простой анализ тональности и ключевых слов
-        positive_words = ['добрый', 'веселый', 'активный', 'позитивный', 'открытый', 'дружелюбный']
-        negative_words = ['грустный', 'замкнутый', 'серьезный', 'интроверт']
-        
-        about1_lower = about1.lower()
-        about2_lower = about2.lower()
-        
-        # Анализ тональности
-        pos1 = sum(1 for word in positive_words if word in about1_lower)
-        pos2 = sum(1 for word in positive_words if word in about2_lower)
-        neg1 = sum(1 for word in negative_words if word in about1_lower)
-        neg2 = sum(1 for word in negative_words if word in about2_lower)
-        
-        # Совместимость по тональности
-        if (pos1 > neg1 and pos2 > neg2) or (neg1 >= pos1 and neg2 >= pos2):
+        if user.tone_positive == candidate.tone_positive:
             return 0.7  # Схожая тональность
         else:
             return 0.4  # Разная тональность может быть дополняющей
     
-    async def find_best_matches(self, user_id: int, candidate_ids: List[int], relaxed_level: int = 0) -> List[Tuple[int, float, List[str]]]:
-        """Находит лучших кандидатов с ИИ-анализом"""
+    async def find_best_matches(self, user_id: int, candidate_ids: List[int], relaxed_level: int = 0,
+                                bonuses: Dict[int, float] = None) -> List[Tuple[int, float, List[str]]]:
+        """Находит лучших кандидатов с ИИ-анализом.
+
+        bonuses - добавки к оценке для ранжирования (приоритет ожидающих),
+        в результате остаются исходные оценки
+        """
         user_profile = await profile_cache.get_profile(user_id)
         if not user_profile:
             return []
         
-        matches = []
-        
+        candidates = []
         for candidate_id in candidate_ids:
             if candidate_id == user_id or self.is_blacklisted(user_id, candidate_id):
                 continue
@@ -171,49 +213,68 @@ class SmartMatchingService:
             candidate_profile = await profile_cache.get_profile(candidate_id)
             if not candidate_profile or not candidate_profile.get('profile_completed'):
                 continue
-            
-            # ИИ-анализ совместимости
-            score = await self.calculate_ai_compatibility(user_profile, candidate_profile, relaxed_level)
-            
-            if score > 0.1:  # Минимальный порог
-                # Генерируем объяснение совместимости
-                explanation = await self._generate_match_explanation(user_profile, candidate_profile, score)
-                matches.append((candidate_id, score, explanation))
-        
-        # Сортируем по убыванию совместимости
-        matches.sort(key=lambda x: x[1], reverse=True)
-        return matches[:10]  # Топ-10
+            candidates.append(candidate_profile)
+        
+        # Оценка всех кандидатов одним векторным проходом (результат совпадает
+        # с calculate_ai_compatibility). Пересчитать вектор дешевле, чем искать
+        # каждую пару в кэше, поэтому кэшируются только объяснения для топ-10
+        from services.batch_scoring import batch_scorer
+        bonus = None
+        if bonuses:
+            import numpy as np
+            bonus = np.fromiter((bonuses.get(profile['user_id'], 0.0) for profile in candidates),
+                                dtype=float, count=len(candidates))
+        matches = []
+        for candidate_profile, score in batch_scorer.top_k(user_profile, candidates, relaxed_level, k=10, bonus=bonus):
+            explanation = await self.explain_match(user_profile, candidate_profile, score)
+            matches.append((candidate_profile['user_id'], score, explanation))
+        return matches
+    
+    async def explain_match(self, user_profile: Dict, candidate_profile: Dict, score: float) -> List[str]:
+        """Объяснение подбора пары; причины, зависящие только от профилей, берутся из кэша"""
+        key = pair_cache.key(profile_cache.features_for(user_profile), profile_cache.features_for(candidate_profile))
+        reasons = pair_cache.get(key)
+        if reasons is None:
+            reasons = self._pair_reasons(user_profile, candidate_profile)
+            pair_cache.put(key, reasons)
+        return self._with_score_reason(reasons, score)
     
-    async def _generate_match_explanation(self, user_profile: Dict, candidate_profile: Dict, score: float) -> List[str]:
-        """Генерирует объяснение почему пользователи совместимы"""
+    def _pair_reasons(self, user_profile: Dict, candidate_profile: Dict) -> List[str]:
+        """Причины, которые зависят только от профилей пары, а не от оценки"""
+        user = profile_cache.features_for(user_profile)
+        candidate = profile_cache.features_for(candidate_profile)
         reasons = []
         
         # Возраст
-        if user_profile.get('age') and candidate_profile.get('age'):
-            age_diff = abs(int(user_profile['age']) - int(candidate_profile['age']))
+        if user.age and candidate.age:
+            age_diff = abs(user.age - candidate.age)
             if age_diff <= 3:
                 reasons.append("очень близкий возраст")
             elif age_diff <= 7:
                 reasons.append("подходящий возраст")
         
         # Город
-        if user_profile.get('city', '').lower() == candidate_profile.get('city', '').lower():
+        if user.city_id == candidate.city_id:
             reasons.append("из одного города")
+        elif city_registry.is_near(user.city_id, candidate.city_id):
+            reasons.append("из соседних городов")
         
         # Цели
-        if user_profile.get('dating_goal', '').lower() == candidate_profile.get('dating_goal', '').lower():
+        if user.goal_id == candidate.goal_id:
             reasons.append("одинаковые цели знакомства")
         
         # Интересы
-        if user_profile.get('tags') and candidate_profile.get('tags'):
-            user_tags = set(tag.strip().lower() for tag in user_profile['tags'].split(','))
-            candidate_tags = set(tag.strip().lower() for tag in candidate_profile['tags'].split(','))
-            common = user_tags & candidate_tags
-            if len(common) >= 2:
-                reasons.append(f"общие интересы: {', '.join(list(common)[:3])}")
-            elif len(common) == 1:
-                reasons.append(f"общий интерес: {list(common)[0]}")
+        common = mask_tags(user.tag_mask & candidate.tag_mask)
+        if len(common) >= 2:
+            reasons.append(f"общие интересы: {', '.join(common[:3])}")
+        elif len(common) == 1:
+            reasons.append(f"общий интерес: {common[0]}")
         
+        return reasons
+    
+    def _with_score_reason(self, reasons: List[str], score: float) -> List[str]:
+        """Добавляет к причинам общую совместимость; оценка зависит от уровня ослабления и бонусов"""
+        reasons = list(reasons)
         if score > 0.7:
             reasons.append("высокая совместимость")
         elif score > 0.5:
@@ -77,6 +77,9 @@ class UpdateService:
     
     async def restart_bot(self):
         """Перезапуск бота"""
+        # execv не возвращается: дописываем журнал очереди и чатов до замены процесса
+        from services.match_state import match_state
+        await match_state.close()
         os.execv(sys.executable, ['python'] + sys.argv)
 
 update_service = UpdateService()
\ No newline at end of file
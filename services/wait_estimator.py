@@ -0,0 +1,108 @@
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from services.queue_index import BucketKey, bucket_compatibility
+from config import WAIT_ESTIMATE_HALF_LIFE
+
+# Сколько (затухающих) входов по всем корзинам нужно, чтобы доверять частотам
+MIN_HISTORY = 20
+
+class WaitEstimator:
+    """Скользящая статистика очереди по корзинам (пол, ориентация, цель).
+
+    По каждой корзине хранятся экспоненциально затухающие счетчики входов
+    в очередь, подобранных пар и суммарного ожидания подобранных: значение
+    умножается на exp(-dt / tau) и прибавляет событие, а деленное на tau
+    дает частоту событий за последние ~half_life секунд. Памяти - три
+    числа на корзину, обновление - O(1).
+
+    Ожидание нового ищущего оценивается так:
+    - в совместимых корзинах кто-то ждет - подбор сразу при входе;
+    - из его корзины уже ждут - по закону Литтла, (ждущих + 1) / частота пар;
+    - иначе - время до прихода совместимого собеседника по частоте входов.
+    """
+
+    def __init__(self, half_life: float = WAIT_ESTIMATE_HALF_LIFE):
+        self.tau = half_life / math.log(2)
+        # Корзина -> [значение, время обновления]
+        self.arrivals: Dict[BucketKey, List[float]] = {}
+        self.matches: Dict[BucketKey, List[float]] = {}
+        self.waits: Dict[BucketKey, List[float]] = {}  # Затухающая сумма ожиданий подобранных, сек
+
+    def _bump(self, counters: Dict[BucketKey, List[float]], key: BucketKey, amount: float, now: float):
+        counter = counters.get(key)
+        if counter is None:
+            counters[key] = [amount, now]
+            return
+        counter[0] = counter[0] * math.exp(-(now - counter[1]) / self.tau) + amount
+        counter[1] = now
+
+    def _value(self, counters: Dict[BucketKey, List[float]], key: BucketKey, now: float) -> float:
+        counter = counters.get(key)
+        if counter is None:
+            return 0.0
+        return counter[0] * math.exp(-(now - counter[1]) / self.tau)
+
+    def arrived(self, key: BucketKey, now: float = None):
+        self._bump(self.arrivals, key, 1.0, now or time.time())
+
+    def matched(self, key: BucketKey, waited: float, now: float = None):
+        now = now or time.time()
+        self._bump(self.matches, key, 1.0, now)
+        self._bump(self.waits, key, max(waited, 0.0), now)
+
+    def has_history(self, now: float = None) -> bool:
+        """Достаточно ли недавних входов, чтобы по частотам судить о пустых корзинах"""
+        now = now or time.time()
+        return sum(self._value(self.arrivals, key, now) for key in self.arrivals) >= MIN_HISTORY
+
+    def arrival_rate(self, key: BucketKey, now: float = None) -> float:
+        """Входов в корзину в секунду"""
+        return self._value(self.arrivals, key, now or time.time()) / self.tau
+
+    def match_rate(self, key: BucketKey, now: float = None) -> float:
+        """Подобранных из корзины в секунду"""
+        return self._value(self.matches, key, now or time.time()) / self.tau
+
+    def mean_wait(self, key: BucketKey, now: float = None) -> Optional[float]:
+        """Среднее ожидание подобранных из корзины за последнее время"""
+        now = now or time.time()
+        matches = self._value(self.matches, key, now)
+        if matches < 1e-9:
+            return None
+        return self._value(self.waits, key, now) / matches
+
+    def compatible_arrival_rate(self, key: BucketKey, relaxed_level: int = 0, now: float = None) -> float:
+        """Входов в секунду по всем корзинам, совместимым с key на уровне ослабления"""
+        now = now or time.time()
+        return sum(self.arrival_rate(other, now) for other in bucket_compatibility.compatible_keys(key, relaxed_level))
+
+    def next_compatible_arrival(self, key: BucketKey, relaxed_level: int = 0, now: float = None) -> float:
+        """Ожидаемое время до входа совместимого собеседника, сек (inf - давно никого)"""
+        rate = self.compatible_arrival_rate(key, relaxed_level, now)
+        return 1 / rate if rate > 0 else math.inf
+
+    def estimate(self, key: BucketKey, waiting: int, has_candidates: bool, now: float = None) -> Optional[float]:
+        """Ожидаемое ожидание нового ищущего из корзины key, сек; None - статистики нет.
+
+        waiting - сколько из этой корзины уже ждут, has_candidates - есть ли
+        в очереди совместимые с ним ищущие.
+        """
+        if has_candidates:
+            return 0.0
+        now = now or time.time()
+        match_rate = self.match_rate(key, now)
+        if waiting and match_rate > 0:
+            return (waiting + 1) / match_rate
+        next_arrival = self.next_compatible_arrival(key, 0, now)
+        return None if math.isinf(next_arrival) else next_arrival
+
+    def summary(self, now: float = None) -> Tuple[float, float, List[Tuple[BucketKey, float, float, Optional[float]]]]:
+        """Входов и пар в минуту по всем корзинам и [(корзина, входов/мин, пар/мин, среднее ожидание)]"""
+        now = now or time.time()
+        buckets = []
+        for key in set(self.arrivals) | set(self.matches):
+            buckets.append((key, self.arrival_rate(key, now) * 60, self.match_rate(key, now) * 60, self.mean_wait(key, now)))
+        buckets.sort(key=lambda item: item[1], reverse=True)
+        return sum(item[1] for item in buckets), sum(item[2] for item in buckets), buckets
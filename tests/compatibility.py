@@ -0,0 +1,44 @@
+"""Сравнение таблиц совместимости со строковыми проверками.
+
+Общий код tests/test_compatibility_table.py и python -m benchmarks.compatibility_table.
+"""
+import itertools
+from typing import Dict, Iterable, List, Tuple
+
+from keyboards.registration import GENDERS, ORIENTATIONS, DATING_GOALS
+from services.ai_filters import (
+    is_gender_orientation_compatible, is_dating_goal_compatible, compat_id, ORIENTATION_ROWS, STRICT_ROWS
+)
+from services.profile_features import ProfileFeatures, orientation_compatible, goal_compatible
+
+def spellings(values):
+    """Значения словаря в разных написаниях плюс пустое и чужие значения"""
+    result = ['', 'кто-то', 'Other']
+    for value in values:
+        result += [value, value.upper(), f"  {value.lower()} "]
+    return result
+
+def spelling_profiles() -> List[Dict]:
+    """Все сочетания написаний пола, ориентации и цели"""
+    return [
+        {'gender': gender, 'orientation': orientation, 'dating_goal': goal}
+        for gender, orientation, goal in itertools.product(spellings(GENDERS), spellings(ORIENTATIONS), spellings(DATING_GOALS))
+    ]
+
+def mismatches(pairs: Iterable[Tuple[Dict, Dict]]) -> List[Tuple[Dict, Dict]]:
+    """Пары, для которых таблицы расходятся со строковыми проверками"""
+    prepared: Dict[int, Tuple[ProfileFeatures, int]] = {}  # id(профиль) -> (признаки, compat_id)
+    result = []
+    for first, second in pairs:
+        for profile in (first, second):
+            if id(profile) not in prepared:
+                prepared[id(profile)] = (ProfileFeatures(profile), compat_id(profile))
+        first_features, first_id = prepared[id(first)]
+        second_features, second_id = prepared[id(second)]
+        expected = is_gender_orientation_compatible(first, second)
+        expected_strict = expected and is_dating_goal_compatible(first, second)
+        if (bool(ORIENTATION_ROWS[first_id][second_id]) != expected or bool(STRICT_ROWS[first_id][second_id]) != expected_strict or
+                orientation_compatible(first_features, second_features) != expected or
+                goal_compatible(first_features, second_features) != expected_strict):
+            result.append((first, second))
+    return result
@@ -0,0 +1,61 @@
+"""Синтетические профили для тестов и бенчмарков (python -m benchmarks.*)."""
+import random
+import time
+from typing import Dict, List
+
+from keyboards.registration import GENDERS, ORIENTATIONS, DATING_GOALS
+from services.cache import profile_cache
+from services.profile_features import ProfileFeatures, HIGH_VALUE_INTERESTS, POSITIVE_WORDS, NEGATIVE_WORDS
+
+# Вместе с пригородами и вариантами написания, которые справочник сводит к одному городу
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород',
+          'Челябинск', 'Самара', 'Омск', 'Ростов-на-Дону', 'Уфа', 'Красноярск', 'Воронеж', 'Пермь',
+          'Химки', 'Подольск', 'Гатчина', 'мск', 'Питер', 'г. Казань']
+CITY_WEIGHTS = [30, 15, 6, 6, 5, 5, 4, 4, 4, 4, 4, 4, 3, 3, 2, 2, 1, 3, 2, 1]
+
+OTHER_INTERESTS = ['игры', 'аниме', 'кулинария', 'фотография', 'танцы', 'йога', 'программирование',
+                   'театр', 'животные', 'походы', 'бег', 'настолки', 'сериалы', 'рисование', 'мода']
+INTERESTS = sorted(HIGH_VALUE_INTERESTS) + OTHER_INTERESTS
+
+GENDER_WEIGHTS = [48, 48, 4]
+ORIENTATION_WEIGHTS = [70, 8, 14, 4, 4]
+NEUTRAL_WORDS = ['люблю', 'ищу', 'интересного', 'собеседника', 'гулять', 'по', 'вечерам']
+
+def make_profile(user_id: int, rng: random.Random) -> Dict:
+    """Один синтетический профиль со значениями из клавиатур регистрации"""
+    words = rng.sample(NEUTRAL_WORDS, 3)
+    if rng.random() < 0.5:
+        words.append(rng.choice(POSITIVE_WORDS))
+    if rng.random() < 0.25:
+        words.append(rng.choice(NEGATIVE_WORDS))
+    rng.shuffle(words)
+    return {
+        'user_id': user_id,
+        'first_name': f'user{user_id}',
+        'age': min(max(int(rng.gauss(27, 7)), 18), 70),
+        'city': rng.choices(CITIES, CITY_WEIGHTS)[0],
+        'about': ' '.join(words) if rng.random() < 0.9 else None,
+        'tags': ', '.join(rng.sample(INTERESTS, rng.randint(1, 6))) if rng.random() < 0.95 else None,
+        'gender': rng.choices(GENDERS, GENDER_WEIGHTS)[0],
+        'orientation': rng.choices(ORIENTATIONS, ORIENTATION_WEIGHTS)[0],
+        'dating_goal': rng.choice(DATING_GOALS),
+        'rating': min(int(rng.lognormvariate(5.3, 0.6)), 1000),  # Медиана около 200
+        'is_premium': rng.random() < 0.1,
+        'is_active': True,
+        'profile_completed': True
+    }
+
+def make_profiles(count: int, seed: int = 1, first_id: int = 1_000_000) -> List[Dict]:
+    rng = random.Random(seed)
+    return [make_profile(first_id + i, rng) for i in range(count)]
+
+def fill_profile_cache(profiles: List[Dict]):
+    """Кладет профили и их признаки в кэш, как будто они уже загружены из БД"""
+    now = time.time()
+    # Бенчмарк не должен упираться в TTL кэша
+    profile_cache.ttl = 10 ** 9
+    for profile in profiles:
+        profile_cache.cache[profile['user_id']] = profile
+        features = profile_cache.features[profile['user_id']] = ProfileFeatures(profile)
+        profile['version'] = features.version
+        profile_cache.timestamps[profile['user_id']] = now
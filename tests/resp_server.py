@@ -0,0 +1,180 @@
+"""Минимальный сервер с протоколом Redis (RESP2) для проверок без Redis.
+
+    python -m tests.resp_server --port 6390
+
+Поддерживает команды, которыми пользуется RedisStateBackend: строки,
+счетчики, хэши и оптимистичные транзакции WATCH/MULTI/EXEC. Все команды
+выполняются в одном цикле событий, поэтому каждая атомарна, а EXEC
+проверяет версии ключей под WATCH так же, как настоящий Redis.
+"""
+import argparse
+import asyncio
+import itertools
+from typing import Dict, List, Optional
+
+class RespServer:
+    def __init__(self):
+        self.data: Dict[bytes, object] = {}  # bytes или dict для хэшей
+        self.versions: Dict[bytes, int] = {}  # Версия ключа растет при каждой записи
+        self._clock = itertools.count(1)
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        self.server = await asyncio.start_server(self._client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _touch(self, *keys: bytes):
+        for key in keys:
+            self.versions[key] = next(self._clock)
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        watched: Dict[bytes, int] = {}
+        queued: Optional[List[List[bytes]]] = None
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                name = command[0].upper()
+                if name == b'MULTI':
+                    queued = []
+                    reply = b'+OK\r\n'
+                elif name == b'DISCARD':
+                    queued, watched = None, {}
+                    reply = b'+OK\r\n'
+                elif name == b'EXEC':
+                    if queued is None:
+                        reply = b'-ERR EXEC without MULTI\r\n'
+                    elif any(self.versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = b'*-1\r\n'
+                    else:
+                        replies = [self._execute(queued_command) for queued_command in queued]
+                        reply = b'*%d\r\n' % len(replies) + b''.join(replies)
+                    queued, watched = None, {}
+                elif queued is not None:
+                    queued.append(command)
+                    reply = b'+QUEUED\r\n'
+                elif name == b'WATCH':
+                    for key in command[1:]:
+                        watched.setdefault(key, self.versions.get(key, 0))
+                    reply = b'+OK\r\n'
+                elif name == b'UNWATCH':
+                    watched = {}
+                    reply = b'+OK\r\n'
+                else:
+                    reply = self._execute(command)
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Клиент отключился или сервер останавливают
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value) -> bytes:
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, int):
+            value = str(value).encode()
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _hash(self, key: bytes) -> dict:
+        return self.data.setdefault(key, {})
+
+    def _execute(self, command: List[bytes]) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        data = self.data
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name in (b'SELECT', b'AUTH'):
+            return b'+OK\r\n'
+        if name == b'FLUSHDB':
+            for key in list(data):
+                self._touch(key)
+            data.clear()
+            return b'+OK\r\n'
+        if name == b'GET':
+            return self._bulk(data.get(args[0]))
+        if name == b'MGET':
+            return b'*%d\r\n' % len(args) + b''.join(self._bulk(data.get(key)) for key in args)
+        if name == b'SET':
+            data[args[0]] = args[1]
+            self._touch(args[0])
+            return b'+OK\r\n'
+        if name == b'DEL':
+            removed = [key for key in args if data.pop(key, None) is not None]
+            self._touch(*removed)
+            return b':%d\r\n' % len(removed)
+        if name == b'EXISTS':
+            return b':%d\r\n' % sum(1 for key in args if key in data)
+        if name in (b'INCR', b'DECR', b'INCRBY'):
+            step = int(args[1]) if name == b'INCRBY' else (1 if name == b'INCR' else -1)
+            value = int(data.get(args[0], b'0')) + step
+            data[args[0]] = str(value).encode()
+            self._touch(args[0])
+            return b':%d\r\n' % value
+        if name == b'HSET':
+            fields = self._hash(args[0])
+            added = 0
+            for field, value in zip(args[1::2], args[2::2]):
+                added += field not in fields
+                fields[field] = value
+            self._touch(args[0])
+            return b':%d\r\n' % added
+        if name == b'HGET':
+            return self._bulk(data.get(args[0], {}).get(args[1]))
+        if name == b'HMGET':
+            fields = data.get(args[0], {})
+            return b'*%d\r\n' % (len(args) - 1) + b''.join(self._bulk(fields.get(field)) for field in args[1:])
+        if name == b'HDEL':
+            fields = data.get(args[0], {})
+            removed = sum(1 for field in args[1:] if fields.pop(field, None) is not None)
+            if not fields:
+                data.pop(args[0], None)
+            self._touch(args[0])
+            return b':%d\r\n' % removed
+        if name == b'HLEN':
+            return b':%d\r\n' % len(data.get(args[0], {}))
+        if name == b'HGETALL':
+            fields = data.get(args[0], {})
+            return b'*%d\r\n' % (len(fields) * 2) + b''.join(
+                self._bulk(part) for item in fields.items() for part in item
+            )
+        if name == b'HINCRBY':
+            fields = self._hash(args[0])
+            value = int(fields.get(args[1], b'0')) + int(args[2])
+            fields[args[1]] = str(value).encode()
+            self._touch(args[0])
+            return b':%d\r\n' % value
+        return b'-ERR unknown command ' + name + b'\r\n'
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+
+    server = RespServer()
+    port = await server.start(args.host, args.port)
+    print(f"RESP server on {args.host}:{port}")
+    await server.server.serve_forever()
+
+if __name__ == '__main__':
+    asyncio.run(main())
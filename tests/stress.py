@@ -0,0 +1,142 @@
+"""Одновременные поиски тысяч пользователей и проверка инвариантов подбора.
+
+Общий код tests/test_pairing_stress.py и python -m benchmarks.pairing_stress
+(описание проверок - в бенчмарке).
+"""
+import asyncio
+import contextlib
+import io
+import random
+import time
+from typing import Dict, List, Set, Tuple
+
+from services.match_state import MemoryStateBackend, RedisStateBackend
+from services.matchmaker import Matchmaker
+from services.search_queue import SearchQueue
+from tests.profiles import make_profiles, fill_profile_cache
+from tests.resp_server import RespServer
+
+class Recorder:
+    """Собирает исходы поисков: (user_id, номер поиска)"""
+
+    def __init__(self):
+        self.paired: Dict[Tuple[int, int], int] = {}  # (user_id, поиск) -> собеседник
+        self.double: List[Tuple[int, int]] = []
+        self.foreign = 0  # Пара с записью сверки (без бота и FSM) вместо записи самого поиска
+        self.cancelled: Set[Tuple[int, int]] = set()
+        self.missed: Set[Tuple[int, int]] = set()  # dequeue() = False
+        self.enqueued = 0
+        self.unstored = 0  # pair() вернул True, а в хранилище пары нет
+
+    def watch(self, state):
+        """Проверяет каждую созданную пару в хранилище сразу после pair().
+
+        Пока идет pair(), оба пользователя под резервом подборщика и не могут
+        ни выйти из очереди, ни завершить чат, так что пара обязана быть на месте.
+        """
+        pair = state.pair
+
+        async def checked_pair(user_id: int, partner_id: int) -> bool:
+            paired = await pair(user_id, partner_id)
+            if paired and (await state.partner_of(user_id) != partner_id or await state.partner_of(partner_id) != user_id or
+                           await state.is_searching(user_id) or await state.is_searching(partner_id)):
+                self.unstored += 1
+            return paired
+
+        state.pair = checked_pair
+
+    async def on_match(self, entry, partner_entry, user_id, partner_id, score, reasons, level):
+        for uid, partner, own in ((user_id, partner_id, entry), (partner_id, user_id, partner_entry)):
+            if 'stress_search' not in own['profile']:
+                self.foreign += 1
+                continue
+            search = (uid, own['profile']['stress_search'])
+            if search in self.paired or uid == partner:
+                self.double.append(search)
+            self.paired[search] = partner
+
+async def searcher(profile: Dict, matchmaker: Matchmaker, recorder: Recorder, rounds: int, max_wait: float, rng: random.Random):
+    user_id = profile['user_id']
+    for search in range(rounds):
+        await asyncio.sleep(rng.uniform(0, max_wait))
+        # Копия профиля помечена номером поиска, чтобы on_match знал, к какому поиску относится пара
+        if not await matchmaker.enqueue(user_id, dict(profile, stress_search=search), 'low', bot=None):
+            continue
+        recorder.enqueued += 1
+        await asyncio.sleep(rng.uniform(0, max_wait))
+        if rng.random() < 0.3:
+            await matchmaker.relax(user_id)
+            await asyncio.sleep(rng.uniform(0, max_wait / 4))
+        if await matchmaker.dequeue(user_id):
+            recorder.cancelled.add((user_id, search))
+            continue
+        recorder.missed.add((user_id, search))
+        await asyncio.sleep(rng.uniform(0, max_wait))
+        await matchmaker.state.end_chat(user_id)
+
+# Счетчики отчета, которые должны быть нулевыми
+INVARIANTS = (
+    'double_paired', 'pair_not_stored', 'foreign_entries', 'cancelled_but_paired', 'not_cancelled_not_paired', 'queued',
+    'local_queue_diff', 'in_chat', 'not_mutual', 'queued_and_in_chat', 'reserved'
+)
+
+def violations(report: Dict) -> Dict:
+    """Нарушенные инварианты отчета"""
+    return {key: report[key] for key in INVARIANTS if report[key]}
+
+async def run(args) -> Dict:
+    server = None
+    if args.backend == 'redis':
+        server = RespServer()
+        port = await server.start()
+        state = RedisStateBackend(f"redis://127.0.0.1:{port}/0", prefix=f"stress:{time.time_ns()}:")
+    else:
+        state = MemoryStateBackend()
+
+    profiles = make_profiles(args.users, seed=args.seed)
+    fill_profile_cache(profiles)
+    recorder = Recorder()
+    recorder.watch(state)
+    matchmaker = Matchmaker(relax_interval=args.relax_interval, mode=args.mode, tick_interval=args.tick_interval)
+    matchmaker.setup(SearchQueue(), state, on_match=recorder.on_match)
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*[
+            searcher(profile, matchmaker, recorder, args.rounds, args.max_wait, random.Random(rng.random()))
+            for profile in profiles
+        ])
+        # Дожидаемся уведомлений о последних парах
+        while matchmaker._notify_tasks:
+            await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    queue = await state.searchers()
+    in_chat = {}
+    for profile in profiles:
+        partner_id = await state.partner_of(profile['user_id'])
+        if partner_id is not None:
+            in_chat[profile['user_id']] = partner_id
+    report = {
+        'searches': recorder.enqueued,
+        'pairs': len(recorder.paired) // 2,
+        'double_paired': len(recorder.double),
+        'pair_not_stored': recorder.unstored,
+        'foreign_entries': recorder.foreign,
+        'cancelled_but_paired': len(recorder.cancelled & recorder.paired.keys()),
+        'not_cancelled_not_paired': len(recorder.missed - recorder.paired.keys()),
+        'queued': len(queue),
+        'local_queue_diff': len(set(queue) ^ set(matchmaker.searchers)),
+        'in_chat': len(in_chat),
+        'not_mutual': sum(1 for user_id, partner_id in in_chat.items() if in_chat.get(partner_id) != user_id),
+        'queued_and_in_chat': sum(1 for user_id in queue if user_id in in_chat),
+        'reserved': len(matchmaker.reserved)
+    }
+    print(f"{args.backend}/{args.mode}: {args.users} users x {args.rounds} searches in {elapsed:.1f}s")
+    print(f"  {report} {'FAILED' if violations(report) else 'OK'}")
+
+    await state.close()
+    if server is not None:
+        await server.stop()
+    return report
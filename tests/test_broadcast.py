@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+import services.broadcast as broadcast
+from services.broadcast import BroadcastService
+from services.cities import city_registry
+
+PROFILES = {
+    1: {'city': 'Урюпинск'},
+    2: {'city': 'г. урюпинск '},
+    3: {'city': 'Москва'},
+    4: {'city': 'Урюпинская'},
+}
+
+class Users:
+    @staticmethod
+    def filter(**kwargs):
+        return Users
+
+    @staticmethod
+    async def all():
+        return [SimpleNamespace(tg_id=user_id) for user_id in PROFILES]
+
+def city_recipients(monkeypatch, city: str):
+    sent = []
+
+    async def get_profile(user_id):
+        return dict(PROFILES[user_id], user_id=user_id)
+
+    async def send(bot, users, message):
+        sent.extend(user.tg_id for user in users)
+        return {'sent': len(users), 'failed': 0}
+
+    service = BroadcastService()
+    monkeypatch.setattr(broadcast, 'User', Users)
+    monkeypatch.setattr(broadcast.profile_cache, 'get_profile', get_profile)
+    monkeypatch.setattr(service, '_send_broadcast', send)
+    asyncio.run(service.send_to_city(None, city, 'привет'))
+    return sorted(sent)
+
+def test_city_broadcast_reaches_city_missing_from_registry(monkeypatch):
+    # Город не из data/cities.json, еще не встречавшийся в этом процессе
+    assert city_registry.lookup('Урюпинск') is None
+    assert city_recipients(monkeypatch, 'урюпинск') == [1, 2]
+
+def test_city_broadcast_matches_bundled_city_aliases(monkeypatch):
+    assert city_recipients(monkeypatch, 'г. Москва') == [3]
@@ -0,0 +1,19 @@
+import itertools
+import random
+
+from keyboards.registration import GENDERS, ORIENTATIONS, DATING_GOALS
+from tests.compatibility import mismatches, spelling_profiles
+
+def test_table_matches_scalar_checks_for_all_canonical_values():
+    profiles = [
+        {'gender': gender, 'orientation': orientation, 'dating_goal': goal}
+        for gender, orientation, goal in itertools.product(GENDERS, ORIENTATIONS, DATING_GOALS)
+    ]
+    assert mismatches(itertools.product(profiles, profiles)) == []
+
+def test_table_matches_scalar_checks_for_spelling_sample():
+    # Полный перебор написаний (~10 млн пар) делает python -m benchmarks.compatibility_table
+    rng = random.Random(1)
+    profiles = spelling_profiles()
+    pairs = [(rng.choice(profiles), rng.choice(profiles)) for _ in range(50_000)]
+    assert mismatches(pairs) == []
@@ -0,0 +1,19 @@
+import argparse
+import asyncio
+
+import pytest
+
+from tests.stress import run, violations
+
+def stress_args(**overrides) -> argparse.Namespace:
+    args = dict(users=400, rounds=2, max_wait=0.3, relax_interval=0.2, tick_interval=0.05,
+                mode='greedy', backend='memory', seed=1)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+@pytest.mark.parametrize('mode', ['greedy', 'batch'])
+@pytest.mark.parametrize('backend', ['memory', 'redis'])
+def test_no_double_pairing_under_concurrent_searches(backend, mode):
+    report = asyncio.run(run(stress_args(backend=backend, mode=mode)))
+    assert report['pairs'] > 0
+    assert violations(report) == {}
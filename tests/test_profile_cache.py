@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import services.cache as cache
+from services.cache import ProfileCache
+
+ROWS = {
+    1: {'first_name': 'Аня', 'age': 25, 'city': 'Москва', 'about': '', 'tags': 'музыка', 'gender': 'Женский',
+        'orientation': 'Гетеро', 'dating_goal': 'Общение', 'profile_completed': True},
+}
+
+class Query:
+    def __init__(self, row):
+        self.row = row
+
+    async def first(self):
+        return self.row
+
+class Users:
+    @staticmethod
+    def filter(tg_id):
+        return Query(SimpleNamespace(raiting=100, is_premium=False, is_active=True))
+
+class Profiles:
+    @staticmethod
+    def filter(user):
+        return Query(SimpleNamespace(**ROWS[1]))
+
+def expire(profile_cache: ProfileCache, user_id: int, age: float):
+    profile_cache.timestamps[user_id] -= age
+    profile_cache._next_cleanup = 0.0
+
+def test_unchanged_profile_keeps_version_after_ttl(monkeypatch):
+    monkeypatch.setattr(cache, 'User', Users)
+    monkeypatch.setattr(cache, 'Profile', Profiles)
+    profile_cache = ProfileCache(ttl=300, retain=3600)
+
+    profile = asyncio.run(profile_cache.get_profile(1))
+    features = profile_cache.features_for(profile)
+    expire(profile_cache, 1, 301)
+    reloaded = asyncio.run(profile_cache.get_profile(1))
+    assert reloaded is profile
+    assert profile_cache.features_for(reloaded) is features
+
+    # Изменившийся профиль получает новую версию, старый словарь - прежние признаки
+    monkeypatch.setitem(ROWS, 1, dict(ROWS[1], city='Казань'))
+    expire(profile_cache, 1, 301)
+    changed = asyncio.run(profile_cache.get_profile(1))
+    assert changed['version'] != profile['version']
+    assert profile_cache.features_for(profile) is features
+
+def test_profile_not_requested_for_retain_is_dropped(monkeypatch):
+    monkeypatch.setattr(cache, 'User', Users)
+    monkeypatch.setattr(cache, 'Profile', Profiles)
+    profile_cache = ProfileCache(ttl=300, retain=3600)
+
+    asyncio.run(profile_cache.get_profile(1))
+    expire(profile_cache, 1, 3601)
+    profile_cache.clear_expired()
+    assert 1 not in profile_cache.cache and 1 not in profile_cache.features